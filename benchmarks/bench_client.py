@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""End-to-end benchmarks of AdsClient against the in-process AdsSimulator.
+
+Measures single-variable round-trip latency (bound variable, by handle and
+by name), request throughput with 1-64 threads sharing a client, symbol
+upload time and large array read throughput.
+
+    python benchmarks/bench_client.py --output baseline.json
+    python benchmarks/bench_client.py --compare baseline.json --threshold 0.2
+"""
+import threading
+import time
+
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adssimulator import AdsSimulator
+
+import benchutils
+
+
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+ARRAY_ELEMENTS = 65536
+
+
+def create_client(simulator):
+    conn = AdsConnection(
+        target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+    client = AdsClient(conn, tcp_port=simulator.port)
+    client.connect()
+    return client
+
+
+def bench_latency(client, metrics, args):
+    count = 200 if args.quick else 2000
+    handle = client.get_handle_by_name('MAIN.counter')
+    variable = client.bind('MAIN.counter', INT)
+    for name, fn in [
+            ('bound_read', variable.read),
+            ('read_by_handle', lambda: client.read_by_handle(handle, INT)),
+            ('read_by_name',
+             lambda: client.read_by_name('MAIN.counter', INT))]:
+        stats = benchutils.summarize(benchutils.time_calls(fn, count))
+        metrics['latency_%s_p50' % name] = benchutils.metric(
+            stats['p50'] * 1e6, 'us')
+        metrics['latency_%s_p99' % name] = benchutils.metric(
+            stats['p99'] * 1e6, 'us')
+
+
+def bench_throughput(client, metrics, args):
+    duration = 0.3 if args.quick else 1.0
+    handle = client.get_handle_by_name('MAIN.counter')
+
+    def worker(stop, counts, idx):
+        while not stop.is_set():
+            client.read_by_handle(handle, INT)
+            counts[idx] += 1
+
+    for thread_count in THREAD_COUNTS:
+        stop = threading.Event()
+        counts = [0] * thread_count
+        threads = [
+            threading.Thread(target=worker, args=(stop, counts, idx))
+            for idx in range(thread_count)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        metrics['throughput_threads_%02d' % thread_count] = benchutils.metric(
+            sum(counts) / elapsed, 'req/s', higher_is_better=True)
+
+
+def bench_symbol_upload(metrics, args):
+    sizes = [10000] if args.quick else [10000, 100000]
+    for size in sizes:
+        simulator = AdsSimulator(memory_size=size * 2)
+        for idx in range(size):
+            simulator.add_symbol(
+                'MAIN.var_%06d' % idx, INT, comment=u'benchmark symbol')
+        with simulator:
+            client = create_client(simulator)
+            try:
+                samples = []
+                for _ in range(1 if args.quick else 3):
+                    start = time.time()
+                    symbols = client.get_symbols()
+                    samples.append(time.time() - start)
+                assert(len(symbols) == size)
+            finally:
+                client.close()
+        metrics['symbol_upload_%dk' % (size // 1000)] = benchutils.metric(
+            min(samples) * 1000, 'ms')
+
+
+def bench_array_read(client, metrics, args):
+    count = 3 if args.quick else 10
+    datatype = AdsArrayDatatype(REAL, ARRAY_ELEMENTS)
+    symbol = client.get_info_by_name('MAIN.array')
+    handle = client.get_handle_by_name('MAIN.array')
+    megabytes = datatype.byte_count / 1e6
+
+    raw = benchutils.summarize(benchutils.time_calls(
+        lambda: client.read(
+            symbol.index_group, symbol.index_offset, datatype.byte_count),
+        count, warmup=1))
+    metrics['array_read_raw'] = benchutils.metric(
+        megabytes / raw['p50'], 'MB/s', higher_is_better=True)
+
+    decoded = benchutils.summarize(benchutils.time_calls(
+        lambda: client.read_by_handle(handle, datatype), count, warmup=1))
+    metrics['array_read_decoded'] = benchutils.metric(
+        megabytes / decoded['p50'], 'MB/s', higher_is_better=True)
+
+    buffer = bytearray(datatype.byte_count)
+    into = benchutils.summarize(benchutils.time_calls(
+        lambda: client.read_by_handle_into(handle, buffer), count, warmup=1))
+    metrics['array_read_into'] = benchutils.metric(
+        megabytes / into['p50'], 'MB/s', higher_is_better=True)
+
+
+def main():
+    parser = benchutils.create_parser(__doc__.splitlines()[0])
+    args = parser.parse_args()
+
+    metrics = {}
+    simulator = AdsSimulator()
+    simulator.add_symbol('MAIN.counter', INT, 42)
+    simulator.add_symbol(
+        'MAIN.array', AdsArrayDatatype(REAL, ARRAY_ELEMENTS),
+        [0.5] * ARRAY_ELEMENTS,
+        symtype='ARRAY [0..%d] OF REAL' % (ARRAY_ELEMENTS - 1))
+    with simulator:
+        client = create_client(simulator)
+        try:
+            if benchutils.selected(args, 'latency'):
+                bench_latency(client, metrics, args)
+            if benchutils.selected(args, 'throughput'):
+                bench_throughput(client, metrics, args)
+            if benchutils.selected(args, 'array_read'):
+                bench_array_read(client, metrics, args)
+        finally:
+            client.close()
+    if benchutils.selected(args, 'symbol_upload'):
+        bench_symbol_upload(metrics, args)
+
+    return benchutils.report(metrics, args, 'client')
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
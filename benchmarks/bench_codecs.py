@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""Micro-benchmarks of the encode/decode layers, no network involved.
+
+Covers packing and unpacking of single-valued, STRING and array datatypes,
+a table of structs and a log of DATE_AND_TIME timestamps (element by
+element and with NumPy), unpacking 512 bits of the process image (table
+driven and with NumPy) compared with 512 BOOLs,
+AmsPacket serialization, BinaryParser reads/writes, symbol table parsing,
+constructing data types compared with interning them and the client-side
+work of a read by handle compared with a bound variable (AdsClient.bind()).
+Each case is timed with timeit (garbage collection disabled) in several
+repeats; the fastest repeat is reported as time per call, which is the
+statistic least affected by noise from other processes.
+
+    python benchmarks/bench_codecs.py --save-baseline
+    python benchmarks/bench_codecs.py --check-baseline --threshold 0.15
+"""
+import struct
+import timeit
+
+from counsyl_pyads.adsbits import unpack_bits
+from counsyl_pyads.adsbits import unpack_bits_numpy
+from counsyl_pyads.adscommands import ReadCommand
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsconstants import ADSIGRP_SYM_VALBYHND
+from counsyl_pyads.adsconstants import ADSIGRP_SYM_UPLOAD
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import AdsStructDatatype
+from counsyl_pyads.adsdatatypes import BOOL
+from counsyl_pyads.adsdatatypes import DT
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsdatatypes import array_datatype
+from counsyl_pyads.adsdatatypes import numpy
+from counsyl_pyads.adsdatatypes import string_datatype
+from counsyl_pyads.adssimulator import AdsSimulator
+from counsyl_pyads.adssymbol import parse_symbol_table
+from counsyl_pyads.adsvariable import _BoundRead
+from counsyl_pyads.amspacket import AmsPacket
+from counsyl_pyads.binaryparser import BinaryParser
+
+import benchutils
+
+
+ARRAY_SIZES = [10, 100, 1000]
+PACKET_SIZES = [0, 64, 1024]
+SYMBOL_TABLE_SIZE = 1000
+RECIPE_TABLE_ROWS = 10000
+TIMESTAMP_LOG_SIZE = 10000
+# 512 digital inputs as separate BOOL variables
+BOOL_INPUTS = AdsArrayDatatype(BOOL, 512)
+
+
+def time_per_call(fn, args):
+    """Returns the fastest number of seconds per call of fn over several
+    repeats. The number of calls per repeat is calibrated so that each
+    repeat takes at least min_time.
+    """
+    min_time = 0.02 if args.quick else 0.2
+    repeat = 3 if args.quick else 7
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+
+def datatype_cases():
+    cases = []
+    for name, datatype, value in [
+            ('int', INT, -1234),
+            ('real', REAL, 1.5),
+            ('lreal', LREAL, 2.25),
+            ('string81', STRING(81), u'Hello PLC \xe4\xf6\xfc'),
+            ('string256', STRING(256), u'x' * 200)]:
+        raw = datatype.pack(value)
+        cases.append((
+            'pack_%s' % name, lambda d=datatype, v=value: d.pack(v)))
+        cases.append((
+            'unpack_%s' % name, lambda d=datatype, r=raw: d.unpack(r)))
+    for size in ARRAY_SIZES:
+        datatype = AdsArrayDatatype(INT, size)
+        value = list(range(size))
+        raw = datatype.pack(value)
+        cases.append((
+            'pack_array_int_%d' % size,
+            lambda d=datatype, v=value: d.pack(v)))
+        cases.append((
+            'unpack_array_int_%d' % size,
+            lambda d=datatype, r=raw: d.unpack(r)))
+    return cases
+
+
+def struct_array_cases():
+    recipe = AdsStructDatatype([
+        ('name', STRING(21)),
+        ('active', BOOL),
+        ('amount', LREAL),
+        ('steps', AdsArrayDatatype(INT, 4)),
+    ])
+    table = AdsArrayDatatype(recipe, RECIPE_TABLE_ROWS)
+    raw = table.pack([
+        (u'recipe %d' % idx, True, idx * 0.5, [idx] * 4)
+        for idx in range(RECIPE_TABLE_ROWS)])
+    cases = [(
+        'unpack_struct_array_%d' % RECIPE_TABLE_ROWS,
+        lambda: table.unpack(raw))]
+    if numpy is not None:
+        cases.append((
+            'unpack_numpy_struct_array_%d' % RECIPE_TABLE_ROWS,
+            lambda: table.unpack_numpy(raw)))
+    return cases
+
+
+def timestamp_array_cases():
+    log = AdsArrayDatatype(DT, TIMESTAMP_LOG_SIZE)
+    raw = struct.pack(
+        '<%dI' % TIMESTAMP_LOG_SIZE,
+        *range(1500000000, 1500000000 + TIMESTAMP_LOG_SIZE))
+    cases = [(
+        'unpack_dt_array_%d' % TIMESTAMP_LOG_SIZE, lambda: log.unpack(raw))]
+    if numpy is not None:
+        cases.append((
+            'unpack_numpy_dt_array_%d' % TIMESTAMP_LOG_SIZE,
+            lambda: log.unpack_numpy(raw)))
+    return cases
+
+
+def bit_cases():
+    raw = bytes(bytearray(range(64)))
+    cases = [('unpack_bits_512', lambda: unpack_bits(raw, 0, 512))]
+    if numpy is not None:
+        cases.append((
+            'unpack_numpy_bits_512', lambda: unpack_bits_numpy(raw, 0, 512)))
+    cases.append((
+        'unpack_bools_512', lambda: BOOL_INPUTS.unpack(raw * 8)))
+    return cases
+
+
+def datatype_construction_cases():
+    return [
+        ('construct_array_real_100', lambda: AdsArrayDatatype(REAL, 100)),
+        ('intern_array_real_100', lambda: array_datatype(REAL, 100)),
+        ('construct_string80', lambda: STRING(81)),
+        ('intern_string80', lambda: string_datatype(81)),
+    ]
+
+
+def packet_cases():
+    conn = AdsConnection(
+        target_ams='10.1.0.99.1.1:801', source_ams='10.1.0.1.1.1:32905')
+    cases = []
+    for size in PACKET_SIZES:
+        packet = AmsPacket(conn)
+        packet.command_id = 0x0002
+        packet.state_flags = 0x0004
+        packet.invoke_id = 0x8001
+        packet.data = b'\xa5' * size
+        raw = packet.GetBinaryData()
+        cases.append((
+            'ams_encode_%d' % size, lambda p=packet: p.GetBinaryData()))
+        cases.append((
+            'ams_decode_%d' % size,
+            lambda r=raw: AmsPacket.from_binary_data(r)))
+    return cases
+
+
+def read_request_cases():
+    """Encoding of the request and decoding of the response of a read of
+    an INT, i.e. the per-call overhead of the client without the network.
+    """
+    conn = AdsConnection(
+        target_ams='10.1.0.99.1.1:801', source_ams='10.1.0.1.1.1:32905')
+    response = AmsPacket(conn)
+    response.data = b'\0\0\0\0\x02\0\0\0\x2a\0'
+
+    def read_by_handle():
+        command = ReadCommand(ADSIGRP_SYM_VALBYHND, 7, INT.byte_count)
+        packet = command.to_ams_packet(conn)
+        packet.invoke_id = 0x8001
+        packet.GetBinaryData()
+        return INT.unpack(command.CreateResponse(response).data)
+
+    bound = _BoundRead(conn, 7, INT)
+
+    def bound_read():
+        packet = bound.to_ams_packet(conn)
+        packet.invoke_id = 0x8001
+        packet.GetBinaryData()
+        return bound.CreateResponse(response)
+
+    assert(read_by_handle() == bound_read() == 42)
+    return [
+        ('read_request_by_handle', read_by_handle),
+        ('read_request_bound', bound_read),
+    ]
+
+
+def binary_parser_cases():
+    def write_uint32():
+        parser = BinaryParser()
+        for value in range(100):
+            parser.WriteUInt32(value)
+        return parser.ByteData
+
+    data = write_uint32()
+
+    def read_uint32():
+        parser = BinaryParser(data)
+        for _ in range(100):
+            parser.ReadUInt32()
+
+    def read_bytes():
+        BinaryParser(data).ReadBytes(6)
+
+    return [
+        ('parser_write_uint32_x100', write_uint32),
+        ('parser_read_uint32_x100', read_uint32),
+        ('parser_read_bytes_6', read_bytes),
+    ]
+
+
+def symbol_table_cases():
+    simulator = AdsSimulator()
+    for idx in range(SYMBOL_TABLE_SIZE):
+        simulator.add_symbol(
+            'MAIN.var_%06d' % idx, INT, comment=u'benchmark symbol')
+    _, data = simulator.read(ADSIGRP_SYM_UPLOAD, 0, 0xFFFFFFFF)
+    return [(
+        'parse_symbol_table_%d' % SYMBOL_TABLE_SIZE,
+        lambda: parse_symbol_table(data, SYMBOL_TABLE_SIZE))]
+
+
+def main():
+    parser = benchutils.create_parser(__doc__.splitlines()[0])
+    args = parser.parse_args()
+
+    cases = (
+        datatype_cases() + struct_array_cases() + timestamp_array_cases() +
+        bit_cases() +
+        datatype_construction_cases() + packet_cases() +
+        read_request_cases() + binary_parser_cases() + symbol_table_cases())
+    metrics = {}
+    for name, fn in cases:
+        if not benchutils.selected(args, name):
+            continue
+        metrics[name] = benchutils.metric(time_per_call(fn, args) * 1e6, 'us')
+
+    return benchutils.report(metrics, args, 'codecs')
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+Every benchmark script produces a dict of metrics. Each metric is stored as
+{"value": ..., "unit": ..., "higher_is_better": ...} so that a later run can
+be compared against a stored baseline without knowing which benchmark
+produced it.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import time
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+
+def percentile(sorted_values, q):
+    """Returns the q-th percentile (0..100) of an already sorted list using
+    linear interpolation between the closest ranks.
+    """
+    if not sorted_values:
+        return float('nan')
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lower = int(math.floor(pos))
+    upper = int(math.ceil(pos))
+    if lower == upper:
+        return sorted_values[lower]
+    weight = pos - lower
+    return (
+        sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight)
+
+
+def summarize(samples):
+    """Returns min, p50, p99, mean and standard deviation of samples."""
+    values = sorted(samples)
+    mean = sum(values) / float(len(values))
+    variance = sum((v - mean) ** 2 for v in values) / float(len(values))
+    return {
+        'min': values[0],
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'mean': mean,
+        'stdev': math.sqrt(variance),
+        'count': len(values),
+    }
+
+
+def metric(value, unit, higher_is_better=False):
+    return {
+        'value': value,
+        'unit': unit,
+        'higher_is_better': higher_is_better,
+    }
+
+
+def time_calls(fn, count, warmup=10):
+    """Calls fn() count times and returns the list of durations in
+    seconds.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    timer = time.time
+    for _ in range(count):
+        start = timer()
+        fn()
+        samples.append(timer() - start)
+    return samples
+
+
+def create_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--output', help='Write the results as JSON to this file.')
+    parser.add_argument(
+        '--compare', metavar='BASELINE',
+        help='Compare the results against a JSON file written by --output '
+        'and exit with status 1 if a metric regressed.')
+    parser.add_argument(
+        '--save-baseline', action='store_true',
+        help='Store the results as baseline for this benchmark and Python '
+        'version in %s.' % BASELINE_DIR)
+    parser.add_argument(
+        '--check-baseline', action='store_true',
+        help='Like --compare, using the baseline stored with '
+        '--save-baseline.')
+    parser.add_argument(
+        '--threshold', type=float, default=0.10,
+        help='Relative change of a metric that counts as regression '
+        '(default: 0.10).')
+    parser.add_argument(
+        '--only', action='append', default=[],
+        help='Only run benchmarks whose name contains this string. May be '
+        'given several times.')
+    parser.add_argument(
+        '--quick', action='store_true',
+        help='Use fewer iterations and smaller data sets.')
+    return parser
+
+
+def selected(args, name):
+    return not args.only or any(part in name for part in args.only)
+
+
+def compare(current, baseline, threshold):
+    """Returns a list of (name, baseline value, current value, relative
+    change) tuples of all metrics that regressed by more than threshold.
+    Metrics missing from either result are ignored.
+    """
+    regressions = []
+    for name, base in sorted(baseline['metrics'].items()):
+        cur = current['metrics'].get(name)
+        if cur is None or not base['value']:
+            continue
+        change = (cur['value'] - base['value']) / float(base['value'])
+        if base['higher_is_better']:
+            change = -change
+        if change > threshold:
+            regressions.append((name, base['value'], cur['value'], change))
+    return regressions
+
+
+def baseline_path(benchmark):
+    """Baselines are machine and interpreter specific, keep one per
+    benchmark script and Python version.
+    """
+    return os.path.join(BASELINE_DIR, '%s-py%s.json' % (
+        benchmark, '.'.join(platform.python_version_tuple()[:2])))
+
+
+def report(metrics, args, benchmark):
+    """Prints the metrics, writes and compares them as requested on the
+    command line and returns the exit status of the benchmark script.
+    """
+    results = {
+        'metrics': metrics,
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.time(),
+        },
+    }
+    width = max([len(name) for name in metrics] or [0])
+    for name in sorted(metrics):
+        print('%s  %14.3f %s' % (
+            name.ljust(width), metrics[name]['value'], metrics[name]['unit']))
+
+    outputs = [args.output] if args.output else []
+    if args.save_baseline:
+        if not os.path.isdir(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        outputs.append(baseline_path(benchmark))
+    for output in outputs:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    compare_to = args.compare
+    if args.check_baseline:
+        compare_to = baseline_path(benchmark)
+    if compare_to:
+        with open(compare_to) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, cur, change in regressions:
+            print('REGRESSION %s: %.3f -> %.3f (%+.1f%%)' % (
+                name, base, cur, change * 100))
+        if regressions:
+            return 1
+        print('No regressions beyond %.0f%%.' % (args.threshold * 100))
+    return 0
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import time
+
+from counsyl_pyads.adscapture import AdsCaptureReader
+from counsyl_pyads.adscapture import AdsReplayServer
+from counsyl_pyads.adscapture import CAPTURE_SENT
+from counsyl_pyads.adscapture import replay_decode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Inspect and replay AMS capture files written by '
+        'AdsClient.start_capture().')
+    subparsers = parser.add_subparsers(dest='command')
+
+    info = subparsers.add_parser('info', help='Summarize a capture file.')
+    info.add_argument('capture')
+
+    decode = subparsers.add_parser(
+        'decode', help='Decode all captured responses at full speed.')
+    decode.add_argument('capture')
+    decode.add_argument(
+        '--repeat', type=int, default=10,
+        help='Number of passes over the capture.')
+
+    serve = subparsers.add_parser(
+        'serve', help='Serve the captured responses as a fake PLC.')
+    serve.add_argument('capture')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=0xBF02)
+    serve.add_argument(
+        '--latency', type=float, default=0.0,
+        help='Seconds to wait before each response.')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s][%(levelname)s] %(message)s")
+
+    if args.command == 'info':
+        records = AdsCaptureReader(args.capture).records()
+        sent = sum(1 for r in records if r.direction == CAPTURE_SENT)
+        print("Frames: %d sent, %d received" % (sent, len(records) - sent))
+        if records:
+            duration = (records[-1].timestamp_ns - records[0].timestamp_ns)
+            print("Duration: %.3f s" % (duration / 1e9))
+    elif args.command == 'decode':
+        result = replay_decode(args.capture, repeat=args.repeat)
+        print("Decoded %d frames in %.3f s (%.0f frames/s)" % (
+            result['frames'], result['seconds'],
+            result['frames_per_second'] or 0))
+    elif args.command == 'serve':
+        server = AdsReplayServer(
+            args.capture, host=args.host, port=args.port,
+            latency=args.latency)
+        with server:
+            print("Serving %s on %s:%d, press Ctrl+C to stop" % (
+                args.capture, args.host, server.port))
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        print("Unmatched requests: %d" % server.unmatched)
+
+
+if __name__ == '__main__':
+    main()
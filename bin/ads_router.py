@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import argparse
+import logging
+import time
+
+from counsyl_pyads.adsrouter import AdsRouter
+from counsyl_pyads.adstransport import ADS_PORT_DEFAULT
+
+
+def parse_route(route):
+    """Parses a route of the form AMSID=HOST[:PORT]."""
+    ams_id, _, address = route.partition('=')
+    if not address:
+        raise argparse.ArgumentTypeError(
+            "Expected a route of the form AMSID=HOST[:PORT]")
+    host, _, port = address.partition(':')
+    return ams_id, (host, int(port) if port else ADS_PORT_DEFAULT)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a local AMS router that shares one connection per '
+        'PLC between all processes connecting to its Unix socket.')
+    parser.add_argument('socket', help='Path of the Unix socket.')
+    parser.add_argument(
+        '--route', type=parse_route, action='append', default=[],
+        help='Address of the PLC with the given AMS net id as '
+        'AMSID=HOST[:PORT]. By default the IP address is derived from the '
+        'AMS net id.')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(asctime)s][%(levelname)s] %(message)s")
+
+    with AdsRouter(args.socket, routes=dict(args.route)) as router:
+        print("Routing on %s, press Ctrl+C to stop" % args.socket)
+        try:
+            while True:
+                time.sleep(60)
+                logging.info("Router stats: %s" % router.stats())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,28 @@
+from .adscache import AdsCacheServer
+from .adscache import AdsReadCache
 from .adsclient import AdsClient
 from .adsconnection import AdsConnection
 from .adsdatatypes import AdsDatatype
+from .adsdatatypes import AdsDatatypeFactory
 from .adsexception import PyadsException
 from .adsexception import AdsException
 from .adsexception import PyadsTypeError
+from .adshistorian import AdsHistorian
+from .adshistorian import AdsHistorianReader
+from .adsnamespace import AdsSymbolNamespace
+from .adsonlinechange import AdsOnlineChangeWatcher
+from .adsprofiling import AdsSlowestRequestsProfiler
+from .adsreadplan import AdsReadPlan
+from .adsrouter import AdsRouter
+from .adssymbolindex import AdsSymbolIndex
+from .adssharedmemory import AdsSharedMemoryPublisher
+from .adssharedmemory import AdsSharedMemoryReader
+from .adssimulator import AdsSimulator
 from .adsstate import AdsState
 from .adssymbol import AdsSymbol
+from .adstypelibrary import AdsTypeLibrary
+from .adstransport import AdsTcpTransport
+from .adstransport import AdsUnixTransport
 from .amspacket import AmsPacket
 from .binaryparser import BinaryParser
 from .adsutils import HexBlock
@@ -13,14 +30,31 @@ from .version import __version__
 
 
 __all__ = [
+    "AdsCacheServer",
+    "AdsReadCache",
     "AdsClient",
     "AdsConnection",
     "AdsDatatype",
+    "AdsDatatypeFactory",
     "PyadsException",
     "AdsException",
     "PyadsTypeError",
+    "AdsHistorian",
+    "AdsHistorianReader",
+    "AdsSymbolNamespace",
+    "AdsOnlineChangeWatcher",
+    "AdsSlowestRequestsProfiler",
+    "AdsReadPlan",
+    "AdsRouter",
+    "AdsSymbolIndex",
+    "AdsSharedMemoryPublisher",
+    "AdsSharedMemoryReader",
+    "AdsSimulator",
     "AdsState",
     "AdsSymbol",
+    "AdsTypeLibrary",
+    "AdsTcpTransport",
+    "AdsUnixTransport",
     "AmsPacket",
     "BinaryParser",
     "HexBlock",
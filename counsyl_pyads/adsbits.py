@@ -0,0 +1,112 @@
+"""Packing and unpacking of the bits of byte addressed memory, used by
+AdsClient.read_bits() and write_bits().
+
+Bit n of a memory area is bit n % 8 (least significant first) of byte n // 8,
+which is also the index offset of the bit in the bit addressed index groups
+ADSIGRP_IOIMAGE_RWIX and ADSIGRP_IOIMAGE_RWOX.
+"""
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .adsconstants import ADSIGRP_IOIMAGE_RWIB
+from .adsconstants import ADSIGRP_IOIMAGE_RWIX
+from .adsconstants import ADSIGRP_IOIMAGE_RWOB
+from .adsconstants import ADSIGRP_IOIMAGE_RWOX
+from .adsexception import PyadsException
+
+
+# byte addressed index group -> index group of the same memory addressed by
+# bits (one byte, 0 or 1, per bit)
+BIT_ACCESS_GROUPS = {
+    ADSIGRP_IOIMAGE_RWIB: ADSIGRP_IOIMAGE_RWIX,
+    ADSIGRP_IOIMAGE_RWOB: ADSIGRP_IOIMAGE_RWOX,
+}
+# written byte ranges at most this many bytes apart are read and written
+# as one range
+BIT_WRITE_GAP_DEFAULT = 16
+
+# byte value -> its bits, least significant first
+_BYTE_BITS = [
+    tuple(bool(value >> bit & 1) for bit in range(8)) for value in range(256)]
+
+
+def byte_range(bit_offset, count):
+    """Returns (byte offset, length) of the bytes containing count bits
+    starting at bit bit_offset.
+    """
+    if bit_offset < 0 or count < 0:
+        raise PyadsException(
+            'Invalid bit range: %d bits at %d' % (count, bit_offset))
+    start = bit_offset // 8
+    return start, (bit_offset + count + 7) // 8 - start
+
+
+def unpack_bits(data, first_bit, count):
+    """Returns a list of count bools, the bits of the string data starting
+    at bit first_bit.
+    """
+    data = bytearray(data[first_bit // 8:(first_bit + count + 7) // 8])
+    bits = list(itertools.chain.from_iterable(
+        _BYTE_BITS[value] for value in data))
+    start = first_bit % 8
+    return bits[start:start + count]
+
+
+def unpack_bits_numpy(data, first_bit, count):
+    """Like unpack_bits(), returns a numpy bool array."""
+    values = numpy.frombuffer(data, dtype=numpy.uint8)
+    # unpackbits() starts with the most significant bit
+    bits = numpy.unpackbits(values[:, numpy.newaxis], axis=1)[:, ::-1]
+    return bits.reshape(-1)[first_bit:first_bit + count].astype(bool)
+
+
+def plan_bit_writes(bits, max_gap=BIT_WRITE_GAP_DEFAULT):
+    """Combines the bits to write into byte ranges.
+
+    bits: dict bit offset -> value or a sequence of (bit offset, value)
+        pairs; later values of the same bit win
+    max_gap: bytes; ranges closer than this are merged
+    Returns a list of (byte offset, mask, values) tuples sorted by offset.
+    mask and values are bytearrays of the same length: mask has the written
+    bits set, values their new values.
+    """
+    if isinstance(bits, dict):
+        bits = bits.items()
+    changes = {}
+    for bit_offset, value in bits:
+        byte_offset, _ = byte_range(bit_offset, 1)
+        mask, values = changes.get(byte_offset, (0, 0))
+        bit = 1 << bit_offset % 8
+        changes[byte_offset] = (
+            mask | bit, values | bit if value else values & ~bit)
+
+    ranges = []
+    for byte_offset in sorted(changes):
+        mask, values = changes[byte_offset]
+        if ranges and byte_offset - (
+                ranges[-1][0] + len(ranges[-1][1])) <= max_gap:
+            start, range_mask, range_values = ranges[-1]
+            padding = byte_offset - start - len(range_mask)
+            range_mask.extend(b'\x00' * padding)
+            range_values.extend(b'\x00' * padding)
+        else:
+            range_mask = bytearray()
+            range_values = bytearray()
+            ranges.append((byte_offset, range_mask, range_values))
+        range_mask.append(mask)
+        range_values.append(values)
+    return ranges
+
+
+def apply_bits(data, mask, values):
+    """Returns a bytearray of data with the bits set in mask replaced by
+    those of values.
+    """
+    return bytearray(
+        old & ~bits | new
+        for old, bits, new in zip(
+            bytearray(data), bytearray(mask), bytearray(values)))
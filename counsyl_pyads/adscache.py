@@ -0,0 +1,326 @@
+"""Read cache serving many consumers from a single upstream poll loop.
+
+AdsReadCache keeps the latest raw bytes of a set of PLC variables together
+with the time they were read. Consumers ask for a value with the maximum age
+they accept; only if the cached value is older a refresh is read from the
+PLC. The refresh always reads all cached variables with the merged range
+reads of an AdsReadPlan, and concurrent misses wait for the refresh that is
+already in progress instead of issuing their own, so the number of requests
+the PLC sees doesn't grow with the number of consumers:
+
+    cache = AdsReadCache(client, [('MAIN.counter', INT), ('MAIN.speed', REAL)])
+    cache.start(interval=0.1)
+    cache.get('MAIN.counter', max_age=0.5)
+
+AdsCacheServer answers ADS read requests of unmodified AdsClients (by name,
+by handle or by index group/offset) from the cache, so that existing
+consumers only have to be pointed at a different port.
+"""
+import logging
+import struct
+import threading
+
+from .adsconstants import ADSIGRP_SYM_HNDBYNAME
+from .adsconstants import ADSIGRP_SYM_RELEASEHND
+from .adsconstants import ADSIGRP_SYM_VALBYHND
+from .adsconstants import ADSIGRP_SYM_VALBYNAME
+from .adsdatatypes import AdsDatatype
+from .adsexception import AdsException
+from .adsexception import PyadsException
+from .adsreadplan import AdsReadPlan
+from .adsserver import ADSCOMMAND_DEVICEINFO
+from .adsserver import ADSCOMMAND_READ
+from .adsserver import ADSCOMMAND_READSTATE
+from .adsserver import ADSCOMMAND_READWRITE
+from .adsserver import ADSCOMMAND_WRITE
+from .adsserver import ADSERR_DEVICE_SRVNOTSUPP
+from .adsserver import ADSERR_DEVICE_SYMBOLNOTFOUND
+from .adsserver import ADSERR_NOERR
+from .adsserver import AdsServer
+from .adssymbol import AdsSymbol
+from .adsutils import PeriodicRunner
+from .adsutils import monotonic
+from .constants import PYADS_ENCODING
+
+
+logger = logging.getLogger(__name__)
+
+
+# returned to local clients if the upstream read failed without an ADS error
+ADSERR_DEVICE_TIMEOUT = 0x745
+
+
+class _CacheEntry(object):
+    __slots__ = ('symbol', 'datatype', 'raw', 'timestamp', 'decoded')
+
+    def __init__(self, symbol, datatype):
+        self.symbol = symbol
+        self.datatype = datatype
+        self.raw = None
+        self.timestamp = None
+        # (raw, value) decoded lazily, once per refresh
+        self.decoded = None
+
+
+class AdsReadCache(object):
+    """Caches the values of a set of PLC variables."""
+    def __init__(self, client, symbols, max_gap=0, max_read_size=None):
+        """
+        client: connected AdsClient instance
+        symbols: iterable of (symbol, AdsDatatype) tuples. symbol is either
+            an AdsSymbol or a variable name, in which case the index group and
+            offset are looked up with client.get_info_by_name().
+        max_gap, max_read_size: passed on to AdsReadPlan
+        """
+        self.client = client
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        # upper case name -> _CacheEntry
+        self._entries = {}
+        # (index group, index offset) -> _CacheEntry
+        self._by_address = {}
+        pairs = []
+        for symbol, datatype in symbols:
+            if not isinstance(symbol, AdsSymbol):
+                symbol = client.get_info_by_name(symbol)
+            assert(isinstance(datatype, AdsDatatype))
+            entry = _CacheEntry(symbol, datatype)
+            self._entries[symbol.name.upper()] = entry
+            self._by_address[(symbol.index_group, symbol.index_offset)] = entry
+            pairs.append((symbol, datatype))
+        self.plan = AdsReadPlan(
+            pairs, max_gap=max_gap, max_read_size=max_read_size)
+
+        # held while reading from the PLC; misses queue up behind it
+        self._refresh_lock = threading.Lock()
+        # PeriodicRunner calling refresh() while polling
+        self._poller = None
+
+    @property
+    def names(self):
+        return [symbol.name for symbol, _ in self.plan.symbols]
+
+    def _entry(self, name):
+        try:
+            return self._entries[name.upper()]
+        except KeyError:
+            raise PyadsException("%s is not cached." % name)
+
+    def symbol(self, name):
+        """Returns the (AdsSymbol, AdsDatatype) of the cached variable name
+        (in any case). Raises PyadsException if it isn't cached.
+        """
+        entry = self._entry(name)
+        return entry.symbol, entry.datatype
+
+    def find(self, index_group, index_offset):
+        """Returns the (AdsSymbol, AdsDatatype) of the cached variable at the
+        given address or None.
+        """
+        entry = self._by_address.get((index_group, index_offset))
+        if entry is None:
+            return None
+        return entry.symbol, entry.datatype
+
+    def refresh(self):
+        """Reads all cached variables from the PLC."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        timestamp = monotonic()
+        try:
+            raw_values = self.plan.read_raw_list(self.client)
+        except Exception:
+            self.errors += 1
+            raise
+        self.refreshes += 1
+        for (symbol, _), raw in zip(self.plan.symbols, raw_values):
+            entry = self._entries[symbol.name.upper()]
+            # raw before timestamp: readers check the timestamp first
+            entry.raw = raw
+            entry.timestamp = timestamp
+
+    @staticmethod
+    def _is_fresh(entry, max_age, now):
+        if entry.timestamp is None:
+            return False
+        return max_age is None or now - entry.timestamp <= max_age
+
+    def _fresh_entry(self, name, max_age):
+        entry = self._entry(name)
+        if self._is_fresh(entry, max_age, monotonic()):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        with self._refresh_lock:
+            # a refresh that finished while we waited for the lock may
+            # already be recent enough
+            if not self._is_fresh(entry, max_age, monotonic()):
+                self._refresh()
+        return entry
+
+    def get(self, name, max_age=None):
+        """Returns the value of the variable name. If the cached value is
+        older than max_age seconds (or was never read), all variables are
+        refreshed first. max_age None accepts a value of any age.
+        """
+        entry = self._fresh_entry(name, max_age)
+        raw = entry.raw
+        decoded = entry.decoded
+        if decoded is None or decoded[0] is not raw:
+            decoded = entry.decoded = (raw, entry.datatype.unpack(raw))
+        return decoded[1]
+
+    def get_raw(self, name, max_age=None):
+        """Like get() but returns the raw bytes of the variable."""
+        return self._fresh_entry(name, max_age).raw
+
+    def get_many(self, names, max_age=None):
+        """Returns a dict mapping each of names to its value. At most one
+        refresh is performed.
+        """
+        return dict((name, self.get(name, max_age)) for name in names)
+
+    def age(self, name):
+        """Seconds since the cached value of name was read from the PLC, or
+        None if it was never read.
+        """
+        timestamp = self._entry(name).timestamp
+        if timestamp is None:
+            return None
+        return monotonic() - timestamp
+
+    def start(self, interval):
+        """Starts refreshing all variables every interval seconds in a
+        background thread.
+        """
+        if self._poller is not None:
+            raise PyadsException("The cache is already polling.")
+        self._poller = PeriodicRunner(
+            self.refresh, interval, 'Refreshing the read cache')
+        self._poller.start()
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+
+    def stats(self):
+        return {
+            'variables': len(self._entries),
+            'ranges': len(self.plan.ranges),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.stop()
+
+
+class AdsCacheServer(AdsServer):
+    """ADS server answering read requests from an AdsReadCache.
+
+    Supported are reads by name (ADSIGRP_SYM_VALBYNAME), by handle
+    (ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SYM_VALBYHND, ADSIGRP_SYM_RELEASEHND) and
+    by the index group and offset of a cached variable. Device info and
+    state requests are passed on to the PLC. Variables that are not cached
+    are answered with ADS error 0x710 (symbol not found), all other requests
+    with 0x701 (service not supported).
+    """
+    def __init__(self, cache, max_age=None, **kwargs):
+        """
+        cache: AdsReadCache instance
+        max_age: maximum age in seconds of the values served, see
+            AdsReadCache.get()
+        kwargs: passed on to AdsServer
+        """
+        super(AdsCacheServer, self).__init__(**kwargs)
+        self.cache = cache
+        self.max_age = max_age
+        self._handles = {}
+        self._next_handle = 1
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        handler = {
+            ADSCOMMAND_DEVICEINFO: self._device_info,
+            ADSCOMMAND_READ: self._read_command,
+            ADSCOMMAND_WRITE: self._write_command,
+            ADSCOMMAND_READSTATE: self._read_state,
+            ADSCOMMAND_READWRITE: self._read_write_command,
+        }.get(request.command_id)
+        if handler is None:
+            return struct.pack('<I', ADSERR_DEVICE_SRVNOTSUPP)
+        try:
+            return handler(request.data)
+        except AdsException as ex:
+            code = ex.code if isinstance(ex.code, int) else \
+                ADSERR_DEVICE_TIMEOUT
+            return struct.pack('<I', code)
+        except PyadsException as ex:
+            logger.warning("Serving from the read cache failed: %s" % ex)
+            return struct.pack('<I', ADSERR_DEVICE_TIMEOUT)
+
+    def _device_info(self, data):
+        info = self.cache.client.read_device_info()
+        name = info.DeviceName.encode(PYADS_ENCODING)[:16]
+        return struct.pack(
+            '<IBBH16s', ADSERR_NOERR, info.MajorVersion, info.MinorVersion,
+            info.Build, name)
+
+    def _read_state(self, data):
+        state = self.cache.client.read_state()
+        return struct.pack(
+            '<IHH', ADSERR_NOERR, state.AdsState, state.DeviceState)
+
+    def _read_response(self, name, length):
+        raw = self.cache.get_raw(name, self.max_age)[:length]
+        return struct.pack('<II', ADSERR_NOERR, len(raw)) + raw
+
+    def _read_command(self, data):
+        group, offset, length = struct.unpack_from('<III', data)
+        if group == ADSIGRP_SYM_VALBYHND:
+            with self._lock:
+                name = self._handles.get(offset)
+        else:
+            entry = self.cache.find(group, offset)
+            name = None if entry is None else entry[0].name
+        if name is None:
+            return struct.pack('<II', ADSERR_DEVICE_SYMBOLNOTFOUND, 0)
+        return self._read_response(name, length)
+
+    def _write_command(self, data):
+        group, offset, length = struct.unpack_from('<III', data)
+        if group != ADSIGRP_SYM_RELEASEHND:
+            return struct.pack('<I', ADSERR_DEVICE_SRVNOTSUPP)
+        handle = struct.unpack_from('<I', data, 12)[0]
+        with self._lock:
+            if self._handles.pop(handle, None) is None:
+                return struct.pack('<I', ADSERR_DEVICE_SYMBOLNOTFOUND)
+        return struct.pack('<I', ADSERR_NOERR)
+
+    def _read_write_command(self, data):
+        group, offset, read_len, write_len = struct.unpack_from('<IIII', data)
+        if group not in (ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SYM_VALBYNAME):
+            return struct.pack('<II', ADSERR_DEVICE_SRVNOTSUPP, 0)
+        name = data[16:16 + write_len].split(b'\x00', 1)[0].decode(
+            PYADS_ENCODING)
+        try:
+            name = self.cache.symbol(name)[0].name
+        except PyadsException:
+            return struct.pack('<II', ADSERR_DEVICE_SYMBOLNOTFOUND, 0)
+        if group == ADSIGRP_SYM_VALBYNAME:
+            return self._read_response(name, read_len)
+        with self._lock:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._handles[handle] = name
+        return struct.pack('<III', ADSERR_NOERR, 4, handle)
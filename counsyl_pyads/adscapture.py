@@ -0,0 +1,261 @@
+"""Capture of AMS frames to a file and offline replay.
+
+AdsClient.start_capture() writes every sent and received AMS frame with a
+timestamp to a compact binary capture file. Frames are handed to a
+background writer thread through a bounded queue, so capturing never blocks
+the request path; if the writer can't keep up, frames are dropped and
+counted instead.
+
+Capture file format (all little endian):
+
+    header: b'ADSCAP02',
+            wall clock time in nanoseconds since 1970 (UInt64),
+            monotonic clock time in nanoseconds (UInt64),
+            both taken when the capture was started
+    record: direction (UInt8, 0 = sent, 1 = received),
+            monotonic clock time in nanoseconds (UInt64),
+            frame length (UInt32),
+            AMS frame (without the AMS/TCP header)
+
+Records are stamped with adsutils.monotonic_ns(), so the intervals between
+frames are unaffected by changes of the system time; the wall clock anchor
+in the header converts them to absolute times (AdsCaptureReader.wall_time_ns).
+
+A capture can be replayed offline: replay_decode() feeds all frames through
+AmsPacket decoding and the adscommands response classes at full speed (for
+profiling), and AdsReplayServer serves the captured responses back to a
+client as a fake PLC for deterministic load tests.
+"""
+from collections import namedtuple
+import logging
+import struct
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .adscommands import DeviceInfoResponse
+from .adscommands import ReadResponse
+from .adscommands import ReadStateResponse
+from .adscommands import ReadWriteResponse
+from .adscommands import WriteControlResponse
+from .adscommands import WriteResponse
+from .adsexception import AdsException
+from .adsexception import PyadsException
+from .adsserver import AdsServer
+from .adsserver import ADSERR_DEVICE_SRVNOTSUPP
+from .adsutils import monotonic
+from .adsutils import monotonic_ns
+from .amspacket import AmsPacket
+
+
+logger = logging.getLogger(__name__)
+
+
+CAPTURE_MAGIC = b'ADSCAP02'
+CAPTURE_ANCHOR = struct.Struct('<QQ')
+CAPTURE_RECORD_HEADER = struct.Struct('<BQI')
+CAPTURE_SENT = 0
+CAPTURE_RECEIVED = 1
+# seconds close() waits for the writer thread to write the queued frames
+CAPTURE_CLOSE_TIMEOUT = 10.0
+
+RESPONSE_CLASSES = {
+    0x0001: DeviceInfoResponse,
+    0x0002: ReadResponse,
+    0x0003: WriteResponse,
+    0x0004: ReadStateResponse,
+    0x0005: WriteControlResponse,
+    0x0009: ReadWriteResponse,
+}
+
+
+AdsCaptureRecord = namedtuple(
+    'AdsCaptureRecord', ['direction', 'timestamp_ns', 'data'])
+
+
+class AdsCaptureWriter(object):
+    """Writes AMS frames to a capture file in a background thread."""
+    def __init__(self, path, max_queued_frames=100000):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queued_frames)
+        self._file = open(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+        self._file.write(CAPTURE_ANCHOR.pack(
+            int(time.time() * 1e9), monotonic_ns()))
+        self._thread = threading.Thread(target=self._write_fn)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, direction, data):
+        """Queues a frame for writing. Never blocks."""
+        try:
+            self._queue.put_nowait(
+                (direction, monotonic_ns(), data))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_fn(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                direction, timestamp, data = item
+                self._file.write(CAPTURE_RECORD_HEADER.pack(
+                    direction, timestamp, len(data)))
+                self._file.write(data)
+                self.written += 1
+        except Exception:
+            logger.exception("Writing the capture %s failed" % self.path)
+        finally:
+            self._file.close()
+
+    def close(self, timeout=CAPTURE_CLOSE_TIMEOUT):
+        """Writes all queued frames and closes the file.
+
+        Waits at most timeout seconds for the writer thread; the frames it
+        hasn't written by then are lost.
+        """
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        if thread.is_alive():
+            # the sentinel must not be dropped, but a dead or stuck writer
+            # thread must not block close() forever either
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(
+                "The writer thread of %s didn't finish within %.1f s" %
+                (self.path, timeout))
+        if self.dropped:
+            logger.warning(
+                "%d frames were dropped while capturing to %s" %
+                (self.dropped, self.path))
+
+
+class AdsCaptureReader(object):
+    """Iterates over the records of a capture file."""
+    def __init__(self, path):
+        self.path = path
+        self._anchor = None
+
+    def _read_header(self, f):
+        header = f.read(len(CAPTURE_MAGIC) + CAPTURE_ANCHOR.size)
+        if (len(header) < len(CAPTURE_MAGIC) + CAPTURE_ANCHOR.size or
+                not header.startswith(CAPTURE_MAGIC)):
+            raise PyadsException("%s is not a capture file." % self.path)
+        self._anchor = CAPTURE_ANCHOR.unpack_from(header, len(CAPTURE_MAGIC))
+
+    def wall_time_ns(self, record):
+        """Returns the wall clock time of a record in nanoseconds since
+        1970.
+        """
+        if self._anchor is None:
+            with open(self.path, 'rb') as f:
+                self._read_header(f)
+        wall_ns, monotonic_ns = self._anchor
+        return wall_ns + record.timestamp_ns - monotonic_ns
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            self._read_header(f)
+            while True:
+                header = f.read(CAPTURE_RECORD_HEADER.size)
+                if len(header) < CAPTURE_RECORD_HEADER.size:
+                    break
+                direction, timestamp, length = \
+                    CAPTURE_RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    # truncated by an interrupted capture
+                    break
+                yield AdsCaptureRecord(direction, timestamp, data)
+
+    def records(self):
+        return list(self)
+
+    def exchanges(self):
+        """Returns a list of (request frame, response frame) tuples, paired
+        by invoke id. Requests without a response are skipped.
+        """
+        pending = {}
+        result = []
+        for record in self:
+            invoke_id = struct.unpack_from('<I', record.data, 28)[0]
+            if record.direction == CAPTURE_SENT:
+                pending[invoke_id] = record.data
+            else:
+                request = pending.pop(invoke_id, None)
+                if request is not None:
+                    result.append((request, record.data))
+        return result
+
+
+def replay_decode(path, repeat=1):
+    """Decodes all received frames of a capture file repeat times through
+    AmsPacket and the matching response class and returns a dict with the
+    number of decoded frames, the elapsed seconds and frames per second.
+    """
+    frames = [
+        response for _, response in AdsCaptureReader(path).exchanges()]
+    count = 0
+    start = monotonic()
+    for _ in range(repeat):
+        for frame in frames:
+            packet = AmsPacket.from_binary_data(frame)
+            response_class = RESPONSE_CLASSES.get(packet.command_id)
+            if response_class is not None:
+                try:
+                    response_class(packet)
+                except AdsException:
+                    # error responses are decoded up to the error code
+                    pass
+            count += 1
+    elapsed = monotonic() - start
+    return {
+        'frames': count,
+        'seconds': elapsed,
+        'frames_per_second': count / elapsed if elapsed else None,
+    }
+
+
+class AdsReplayServer(AdsServer):
+    """Fake PLC answering requests with the responses of a capture file.
+
+    Requests are matched by command id and request data. If the same
+    request was captured several times, the captured responses are served
+    in turn. Unknown requests are answered with ADS error 0x701 (service not
+    supported).
+    """
+    def __init__(self, path, **kwargs):
+        super(AdsReplayServer, self).__init__(**kwargs)
+        self.unmatched = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+        for request, response in AdsCaptureReader(path).exchanges():
+            request_packet = AmsPacket.from_binary_data(request)
+            response_packet = AmsPacket.from_binary_data(response)
+            key = (request_packet.command_id, request_packet.data)
+            self._responses.setdefault(key, []).append(response_packet.data)
+        self._next = dict((key, 0) for key in self._responses)
+
+    def handle_request(self, request):
+        key = (request.command_id, request.data)
+        with self._lock:
+            responses = self._responses.get(key)
+            if responses is None:
+                self.unmatched += 1
+                return struct.pack('<I', ADSERR_DEVICE_SRVNOTSUPP)
+            idx = self._next[key]
+            self._next[key] = (idx + 1) % len(responses)
+            return responses[idx]
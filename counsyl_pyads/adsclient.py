@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import logging
 import select
 import socket
@@ -5,50 +6,182 @@ import struct
 import threading
 import time
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .constants import ADSIGRP_SYM_UPLOADINFO2
 from .constants import PYADS_ENCODING
+from .adsbits import BIT_ACCESS_GROUPS
+from .adsbits import BIT_WRITE_GAP_DEFAULT
+from .adsbits import apply_bits
+from .adsbits import byte_range
+from .adsbits import plan_bit_writes
+from .adsbits import unpack_bits
+from .adsbits import unpack_bits_numpy
 from .adscommands import DeviceInfoCommand
 from .adscommands import ReadCommand
+from .adscommands import ReadIntoCommand
 from .adscommands import ReadStateCommand
 from .adscommands import ReadWriteCommand
 from .adscommands import WriteCommand
 from .adscommands import WriteControlCommand
+from .adscoalescing import AdsSingleFlight
+from .adscongestion import AdsCongestionControl
+from .adscongestion import CONGESTION_ERRORS
+from .adscongestion import is_idempotent
+from .adscongestion import is_retryable
+from .adscapture import AdsCaptureWriter
+from .adscapture import CAPTURE_RECEIVED
+from .adscapture import CAPTURE_SENT
 from .adsconstants import ADSIGRP_IOIMAGE_RWIB
 from .adsconstants import ADSIGRP_IOIMAGE_RWOB
+from .adsconstants import ADSIGRP_SUMUP_READ
+from .adsconstants import ADSIGRP_SUMUP_READWRITE
+from .adsconstants import ADSIGRP_SUMUP_WRITE
 from .adsconstants import ADSIGRP_SYM_HNDBYNAME
 from .adsconstants import ADSIGRP_SYM_INFOBYNAMEEX
+from .adsconstants import ADSIGRP_SYM_RELEASEHND
 from .adsconstants import ADSIGRP_SYM_UPLOAD
 from .adsconstants import ADSIGRP_SYM_VALBYHND
 from .adsconstants import ADSIGRP_SYM_VALBYNAME
 from .adsdatatypes import AdsDatatype
 from .adsexception import AdsException
 from .adsexception import PyadsException
-from .adssymbol import AdsSymbol
+from .adsmetrics import AdsMetrics
+from .adsnamespace import AdsSymbolNamespace
+from .adsprofiling import AdsRequestTrace
+from .adsprofiling import now_ns
+from .adsscheduling import AdsPriorityGate
+from .adsscheduling import PRIORITY_BULK
+from .adsscheduling import PRIORITY_INTERACTIVE
+from .adsscheduling import PRIORITY_NAMES
+from .adssymbol import parse_symbol_entry
+from .adssymbol import parse_symbol_table
+from .adstransport import ADS_PORT_DEFAULT
+from .adstransport import AdsTcpTransport
+from .adsutils import monotonic
+from .adsvariable import AdsVariable
+from .amspacket import AMS_HEADER
 from .amspacket import AmsPacket
 
 
-ADS_CHUNK_SIZE_DEFAULT = 1024
-ADS_PORT_DEFAULT = 0xBF02
+# bulk reads larger than this are split so urgent commands can interleave
+ADS_BULK_CHUNK_SIZE_DEFAULT = 0x10000
+# index groups of the symbol services (handles, upload, sum commands) whose
+# index offset is not a byte address and which therefore can't be chunked
+ADSIGRP_SYMBOL_SERVICES = (0xF000, 0xF0FF)
+# maximum number of sub-commands of a sum command accepted by TwinCAT
+ADS_SUM_BATCH_SIZE_DEFAULT = 500
+# seconds to wait for the response to a request
+ADS_REQUEST_TIMEOUT_DEFAULT = 10
+# read length of one symbol entry in a sum command; enough for the name,
+# type and comment of nearly all symbols. Longer entries are rejected with
+# ADSERR_DEVICE_INVALIDSIZE and fetched on their own.
+ADS_SYMBOL_INFO_READ_LENGTH = 1024
+# ADS error code of a read length too small for the data
+ADSERR_DEVICE_INVALIDSIZE = 0x705
 
 
 logger = logging.getLogger(__name__)
 
 
+def _byte_view(buffer):
+    """Returns a writable memoryview of the bytes of buffer (a bytearray,
+    memoryview or C-contiguous numpy array).
+    """
+    if numpy is not None and isinstance(buffer, numpy.ndarray):
+        if not buffer.flags.c_contiguous:
+            raise TypeError('buffer must be a C-contiguous array')
+        buffer = buffer.reshape(-1).view(numpy.uint8)
+    view = memoryview(buffer)
+    if view.readonly:
+        raise TypeError('buffer must be writable')
+    if view.itemsize != 1 or view.ndim != 1:
+        raise TypeError('buffer must be a one dimensional buffer of bytes')
+    return view
+
+
 class AdsClient(object):
-    def __init__(self, ads_connection, debug=False):
+    def __init__(
+            self, ads_connection, debug=False, tcp_port=ADS_PORT_DEFAULT,
+            transport=None, max_in_flight=1, latency_target=None,
+            coalesce_reads=False, read_ttl=0):
+        """
+        transport: opens the socket to the device, see adstransport.
+            Defaults to a TCP connection to target_ip:tcp_port.
+        max_in_flight: upper limit of the number of concurrently executed
+            requests. Between one and max_in_flight requests are sent
+            without waiting for the previous responses, see adscongestion.
+        latency_target: seconds; slower responses reduce the number of
+            requests in flight (None: only ADS errors do)
+        coalesce_reads: concurrent read() and read_by_handle() calls of the
+            same memory area share one request, see adscoalescing
+        read_ttl: seconds; if set, identical reads are also served from the
+            last response during that time (implies coalesce_reads)
+        """
         self.ads_connection = ads_connection
+        self.tcp_port = tcp_port
+        if transport is None:
+            transport = AdsTcpTransport(ads_connection.target_ip, tcp_port)
+        self.transport = transport
         # default values
         self.debug = debug
         self.ads_index_group_in = ADSIGRP_IOIMAGE_RWIB
         self.ads_index_group_out = ADSIGRP_IOIMAGE_RWOB
         self.socket = None
         self._current_invoke_id = 0x8000
-        self._current_packet = None
+        # invoke id -> response AmsPacket (None until received)
+        self._pending = {}
+        # invoke id -> memoryview the read data is received into, see
+        # read_into()
+        self._sinks = {}
+        self._invoke_lock = threading.Lock()
+        # held by the reader thread while it receives into a sink; a
+        # request giving up takes it to make sure its buffer isn't written
+        # anymore
+        self._sink_lock = threading.Lock()
+        self._send_lock = threading.Lock()
         # event to signal shutdown to async reader thread
         self._stop_reading = threading.Event()
 
-        # lock to ensure only one command is executed
-        # (sent to the PLC) at a time:
-        self._ads_lock = threading.Lock()
+        # gate limiting the number of commands executed (sent to the PLC)
+        # at a time, admitting the most urgent priority class first
+        self._gate = AdsPriorityGate(capacity=1)
+        # adjusts the capacity of the gate to the load of the device
+        self.congestion = AdsCongestionControl(
+            self._gate, max_window=max_in_flight,
+            latency_target=latency_target)
+        # number of times an idempotent read rejected by an overloaded
+        # device is sent again, with exponential backoff
+        self.max_retries = 3
+        self.retry_delay = 0.001
+        self.request_timeout = ADS_REQUEST_TIMEOUT_DEFAULT
+        # priority of the commands of the current thread, see priority()
+        self._priority_local = threading.local()
+        self.bulk_chunk_size = ADS_BULK_CHUNK_SIZE_DEFAULT
+        # sub-commands per request of get_handles_by_names() and friends
+        self.sum_batch_size = ADS_SUM_BATCH_SIZE_DEFAULT
+        # write_bits() merges byte ranges closer than this many bytes
+        self.bit_write_gap = BIT_WRITE_GAP_DEFAULT
+        # shares the responses of identical reads, None if disabled
+        self._single_flight = None
+        if coalesce_reads or read_ttl:
+            self._single_flight = AdsSingleFlight(ttl=read_ttl)
+
+        # latency and traffic metrics, see stats()
+        self.metrics = AdsMetrics()
+
+        # stage-level profiling, see add_profiling_hook()
+        self._profiling_hooks = []
+        self._trace_local = threading.local()
+
+        # AdsCaptureWriter while capturing, see start_capture()
+        self._capture = None
+
+        # created on first use, see symbols
+        self._symbol_namespace = None
 
     # BEGIN Connection Management Functions
 
@@ -71,18 +204,14 @@ class AdsClient(object):
 
     def connect(self):
         self.close()
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(2)
         try:
-            self.socket.connect(
-                (self.ads_connection.target_ip, ADS_PORT_DEFAULT))
+            # the transport closes the socket if connecting fails, so that
+            # is_connected() keeps returning False
+            self.socket = self.transport.open()
         except Exception as ex:
-            # If an error occurs during connection, close the socket
-            # and set it to None so that is_connected() returns False:
-            self.socket.close()
-            self.socket = None
             raise PyadsException(
                 "Could not connect to device: {ex}".format(ex=ex))
+        self.metrics.connected()
 
         try:
             # start reading thread
@@ -100,9 +229,15 @@ class AdsClient(object):
             if ready[0] and self.is_connected:
                 try:
                     newPacket = self.read_ams_packet_from_socket()
-                    if (newPacket.invoke_id == self._current_invoke_id):
-                        self._current_packet = newPacket
-                    else:
+                    if newPacket is None:
+                        logger.debug("Invalid AMS/TCP header received")
+                        continue
+                    with self._invoke_lock:
+                        expected = newPacket.invoke_id in self._pending
+                        if expected:
+                            self._pending[newPacket.invoke_id] = newPacket
+                    if not expected:
+                        self.metrics.packet_dropped()
                         logger.debug("Packet dropped: %s" % newPacket)
                 except socket.error:
                     self.close()
@@ -120,6 +255,7 @@ class AdsClient(object):
                     ex_value=ex_value or '',
                     traceback=traceback or ''))
         try:
+            self.stop_capture()
             self.close()
         except:
             pass
@@ -128,35 +264,252 @@ class AdsClient(object):
 
     # BEGIN Read/Write Methods
 
-    def execute(self, command):
-        with self._ads_lock:
+    @contextmanager
+    def priority(self, priority):
+        """Executes all commands of the current thread within the with
+        block with the given priority class (see adsscheduling):
+
+            with client.priority(PRIORITY_CONTROL):
+                client.write_by_name('MAIN.stop', BOOL, True)
+        """
+        previous = getattr(self._priority_local, 'priority', None)
+        self._priority_local.priority = priority
+        try:
+            yield
+        finally:
+            self._priority_local.priority = previous
+
+    def current_priority(self):
+        priority = getattr(self._priority_local, 'priority', None)
+        return PRIORITY_INTERACTIVE if priority is None else priority
+
+    def execute(self, command, priority=None):
+        """Sends command to the device and returns its response. priority
+        defaults to the priority class of the current thread, see priority().
+        """
+        index_group = getattr(command, 'index_group', None)
+        if priority is None:
+            priority = self.current_priority()
+        attempt = 0
+        while True:
+            waited = self._gate.acquire(priority)
+            try:
+                self.metrics.waited(PRIORITY_NAMES[priority], waited)
+                start = monotonic()
+                result = self._execute(command, index_group)
+                self.congestion.on_response(
+                    monotonic() - start, bulk=priority == PRIORITY_BULK)
+                return result
+            except AdsException as ex:
+                if ex.code in CONGESTION_ERRORS:
+                    self.congestion.on_congestion()
+                if (attempt >= self.max_retries or
+                        not is_retryable(command, ex.code)):
+                    raise
+            finally:
+                self._gate.release()
+            # back off before the retry, outside the gate
+            time.sleep(self.retry_delay * 2 ** attempt)
+            attempt += 1
+            self.metrics.retried()
+
+    def _execute(self, command, index_group):
+        start = monotonic()
+        trace = None
+        if self._profiling_hooks:
+            trace = AdsRequestTrace(command.command_id, index_group)
+        self.metrics.request_started()
+        try:
             # create packet
+            stage_start = now_ns() if trace is not None else 0
             packet = command.to_ams_packet(self.ads_connection)
+            if trace is not None:
+                trace.add_stage('encode', stage_start, now_ns())
 
             # send to client
-            responsePacket = self.send_and_recv(packet)
+            responsePacket = self.send_and_recv(packet, trace)
             # check for error
             if (responsePacket.error_code > 0):
                 raise AdsException(responsePacket.error_code)
 
             # return response object
+            stage_start = now_ns() if trace is not None else 0
+            # raises AdsException if the response carries an error code
             result = command.CreateResponse(responsePacket)
-            if (result.Error > 0):
-                raise AdsException(result.Error)
-
-            return result
+            if trace is not None:
+                trace.add_stage('response_decode', stage_start, now_ns())
+        except AdsException as ex:
+            self.metrics.request_failed(
+                command.command_id, index_group, monotonic() - start,
+                ex.code)
+            self._abort_trace(trace, ex)
+            raise
+        except Exception as ex:
+            self.metrics.request_finished(
+                command.command_id, index_group, monotonic() - start)
+            self._abort_trace(trace, ex)
+            raise
+        self.metrics.request_finished(
+            command.command_id, index_group, monotonic() - start)
+
+        if trace is not None:
+            if getattr(self._trace_local, 'defer', False):
+                # the caller adds the datatype_decode stage, see
+                # _unpack_traced()
+                self._trace_local.trace = trace
+            else:
+                self._finish_trace(trace)
+
+        return result
 
     def read_device_info(self):
         cmd = DeviceInfoCommand()
         return self.execute(cmd)
 
     def read(self, indexGroup, indexOffset, length):
+        if self._single_flight is None:
+            return self._read(indexGroup, indexOffset, length)
+        return self._single_flight.do(
+            (indexGroup, indexOffset, length),
+            lambda: self._read(indexGroup, indexOffset, length))
+
+    def _is_chunked(self, indexGroup, length):
+        return (length > self.bulk_chunk_size and
+                self.current_priority() == PRIORITY_BULK and
+                not ADSIGRP_SYMBOL_SERVICES[0] <= indexGroup <=
+                ADSIGRP_SYMBOL_SERVICES[1])
+
+    def _read(self, indexGroup, indexOffset, length):
+        if self._is_chunked(indexGroup, length):
+            return self._read_chunked(indexGroup, indexOffset, length)
         cmd = ReadCommand(indexGroup, indexOffset, length)
         return self.execute(cmd)
 
+    def _read_chunked(self, indexGroup, indexOffset, length):
+        """Reads a memory area in chunks of bulk_chunk_size bytes, each
+        executed as a separate command. The chunks are read at different
+        times, so the result is not a consistent snapshot of the area.
+        """
+        chunks = []
+        for offset in xrange(0, length, self.bulk_chunk_size):
+            response = self.execute(ReadCommand(
+                indexGroup, indexOffset + offset,
+                min(self.bulk_chunk_size, length - offset)))
+            chunks.append(response.data)
+        response.data = b''.join(chunks)
+        response.Length = len(response.data)
+        return response
+
+    def read_into(self, indexGroup, indexOffset, buffer):
+        """Reads len(buffer) bytes into buffer, a writable bytearray,
+        memoryview or C-contiguous numpy array, and returns the number of
+        bytes read. The data is received from the socket directly into
+        buffer, so reading large areas doesn't create and copy strings.
+        Bulk reads are chunked like read(); read_into() is never coalesced
+        with other reads. If the read fails (or times out), the contents of
+        buffer are undefined.
+        """
+        view = _byte_view(buffer)
+        length = len(view)
+        if not self._is_chunked(indexGroup, length):
+            return self.execute(
+                ReadIntoCommand(indexGroup, indexOffset, view)).Length
+        total = 0
+        for offset in xrange(0, length, self.bulk_chunk_size):
+            chunk = view[offset:offset + self.bulk_chunk_size]
+            count = self.execute(ReadIntoCommand(
+                indexGroup, indexOffset + offset, chunk)).Length
+            total += count
+            if count < len(chunk):
+                break
+        return total
+
     def write(self, indexGroup, indexOffset, data):
         cmd = WriteCommand(indexGroup, indexOffset, data)
-        return self.execute(cmd)
+        return self.execute_write(cmd)
+
+    def execute_write(self, command, priority=None):
+        """Like execute(), for a command that may change memory of the
+        device: subsequent reads send new requests instead of reusing the
+        result of a read that overlapped the write.
+        """
+        try:
+            return self.execute(command, priority)
+        finally:
+            if self._single_flight is not None:
+                self._single_flight.invalidate()
+
+    def read_bits(self, indexGroup, bitOffset, count):
+        """Reads count bits starting at bit bitOffset of a byte addressed
+        memory area (e.g. ADSIGRP_IOIMAGE_RWIB, bit n is bit n % 8 of byte
+        n // 8) with one read of the bytes containing them. Returns a list
+        of bools.
+        """
+        byte_offset, length = byte_range(bitOffset, count)
+        data = self.read(indexGroup, byte_offset, length).data
+        return unpack_bits(data, bitOffset % 8, count)
+
+    def read_bits_numpy(self, indexGroup, bitOffset, count):
+        """Like read_bits(), returns a numpy bool array."""
+        byte_offset, length = byte_range(bitOffset, count)
+        data = self.read(indexGroup, byte_offset, length).data
+        return unpack_bits_numpy(data, bitOffset % 8, count)
+
+    def write_bits(self, indexGroup, bits, bit_access=False):
+        """Writes bits of a byte addressed memory area (see read_bits()).
+
+        bits: dict bit offset -> bool or a list of (bit offset, bool) pairs
+        bit_access: by default, the bytes containing the bits are read,
+            modified and written back with one request each for all
+            reads and all writes (bytes whose bits are all written aren't
+            read). Other bits of these bytes changed by the PLC in between
+            are overwritten with their old values. With bit_access, every
+            bit is written by its own bit access command (combined into
+            sum commands) which leaves the other bits alone; indexGroup
+            must be ADSIGRP_IOIMAGE_RWIB or ADSIGRP_IOIMAGE_RWOB.
+        """
+        if bit_access:
+            if indexGroup not in BIT_ACCESS_GROUPS:
+                raise PyadsException(
+                    "Index group 0x%X has no bit access" % indexGroup)
+            if isinstance(bits, dict):
+                bits = bits.items()
+            requests = [
+                (BIT_ACCESS_GROUPS[indexGroup], bit_offset,
+                 b'\x01' if value else b'\x00')
+                for bit_offset, value in bits]
+        else:
+            requests = self._read_modify_bits(indexGroup, bits)
+        if len(requests) == 1:
+            self.write(*requests[0])
+            return
+        for error in self._sum_write(requests):
+            if error:
+                raise AdsException(error)
+
+    def _read_modify_bits(self, indexGroup, bits):
+        """Returns the write requests of write_bits() without bit access."""
+        ranges = plan_bit_writes(bits, self.bit_write_gap)
+        partial = [
+            (offset, len(mask)) for offset, mask, _ in ranges
+            if mask.count(b'\xff') < len(mask)]
+        if len(partial) == 1:
+            offset, length = partial[0]
+            old_data = {offset: self.read(indexGroup, offset, length).data}
+        else:
+            old_data = {}
+            results = self.sum_read([
+                (indexGroup, offset, length) for offset, length in partial])
+            for (offset, _), (error, data) in zip(partial, results):
+                if error:
+                    raise AdsException(error)
+                old_data[offset] = data
+        requests = []
+        for offset, mask, values in ranges:
+            data = old_data.get(offset, b'\x00' * len(mask))
+            requests.append(
+                (indexGroup, offset, bytes(apply_bits(data, mask, values))))
+        return requests
 
     def read_state(self):
         cmd = ReadStateCommand()
@@ -164,14 +517,93 @@ class AdsClient(object):
 
     def write_control(self, adsState, deviceState, data=''):
         cmd = WriteControlCommand(adsState, deviceState, data)
-        return self.execute(cmd)
+        return self.execute_write(cmd)
 
     def read_write(self, indexGroup, indexOffset, readLen, dataToWrite=''):
         cmd = ReadWriteCommand(indexGroup, indexOffset, readLen, dataToWrite)
-        return self.execute(cmd)
+        if is_idempotent(cmd):
+            return self.execute(cmd)
+        return self.execute_write(cmd)
 
     # END Read/Write Methods
 
+    # BEGIN metrics and profiling methods
+
+    def stats(self):
+        """Returns a snapshot of the latency and traffic metrics of this
+        client as dict, see AdsMetrics.stats().
+        """
+        stats = self.metrics.stats()
+        stats['congestion'] = self.congestion.stats()
+        if self._single_flight is not None:
+            stats['coalescing'] = self._single_flight.stats()
+        return stats
+
+    def add_profiling_hook(self, hook):
+        """Registers a callable that receives an AdsRequestTrace with the
+        stage timestamps of every executed request, e.g. an instance of
+        AdsSlowestRequestsProfiler. Hooks are called in the thread that
+        executed the request and must be fast.
+        """
+        self._profiling_hooks.append(hook)
+
+    def remove_profiling_hook(self, hook):
+        self._profiling_hooks.remove(hook)
+
+    def _finish_trace(self, trace):
+        for hook in list(self._profiling_hooks):
+            try:
+                hook(trace)
+            except Exception:
+                logger.exception("Profiling hook %r failed" % hook)
+
+    def _abort_trace(self, trace, error):
+        if trace is None:
+            return
+        trace.error = error
+        self._finish_trace(trace)
+
+    @contextmanager
+    def _deferred_trace(self):
+        """Makes the request executed by this thread within the with block
+        hand its trace to _unpack_traced() instead of finishing it.
+        """
+        self._trace_local.defer = True
+        try:
+            yield
+        finally:
+            self._trace_local.defer = False
+
+    def _unpack_traced(self, ads_data_type, data):
+        trace = getattr(self._trace_local, 'trace', None)
+        if trace is None:
+            return ads_data_type.unpack(data)
+        self._trace_local.trace = None
+        stage_start = now_ns()
+        try:
+            return ads_data_type.unpack(data)
+        finally:
+            trace.add_stage('datatype_decode', stage_start, now_ns())
+            self._finish_trace(trace)
+
+    def start_capture(self, path, max_queued_frames=100000):
+        """Starts writing all sent and received AMS frames to the capture
+        file path (see adscapture). Frames are written by a background
+        thread; if more than max_queued_frames are waiting to be written,
+        frames are dropped instead of blocking requests.
+        """
+        self.stop_capture()
+        self._capture = AdsCaptureWriter(path, max_queued_frames)
+        return self._capture
+
+    def stop_capture(self):
+        """Stops capturing and waits until all frames are written."""
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.close()
+
+    # END metrics and profiling methods
+
     # BEGIN variable access methods
 
     def get_handle_by_name(self, var_name):
@@ -219,31 +651,143 @@ class AdsClient(object):
 
         # First four bytes are the full length of the variable definition,
         # which in Twincat3 includes a non-constant number of bytes of
-        # undocumented purpose. Commenting this out because it's not useful
-        # when not reading those undocumented bytes, but keeping around as
-        # a reminder that this information exists.
-        # read_length = struct.unpack("I", resp.data[0:4])[0]
-        index_group = struct.unpack("I", resp.data[4:8])[0]
-        index_offset = struct.unpack("I", resp.data[8:12])[0]
-        name_length = struct.unpack("H", resp.data[24:26])[0]
-        type_length = struct.unpack("H", resp.data[26:28])[0]
-        comment_length = struct.unpack("H", resp.data[28:30])[0]
-
-        name_start_ptr = 30
-        name_end_ptr = name_start_ptr + name_length
-        type_start_ptr = name_end_ptr + 1
-        type_end_ptr = type_start_ptr + type_length
-        comment_start_ptr = type_end_ptr + 1
-        comment_end_ptr = comment_start_ptr + comment_length
-
-        name = resp.data[name_start_ptr:name_end_ptr].decode(
-            PYADS_ENCODING).strip(' \t\n\r\0')
-        symtype = resp.data[type_start_ptr:type_end_ptr]
-        comment = resp.data[comment_start_ptr:comment_end_ptr].decode(
-            PYADS_ENCODING).strip(' \t\n\r\0')
-
-        return AdsSymbol(
-            index_group, index_offset, name, symtype, comment)
+        # undocumented purpose. Those bytes are not read, so the length
+        # returned by parse_symbol_entry() is not useful here.
+        symbol, _ = parse_symbol_entry(resp.data)
+        return symbol
+
+    def get_handles_by_names(self, var_names):
+        """Retrieves the handles of many symbols with one request per
+        sum_batch_size names (see get_handle_by_name()).
+
+        Returns a list in the order of var_names. Its items are the handle
+        of the symbol or, if the PLC couldn't resolve the name, an
+        AdsException with the error code.
+        """
+        results = self._sum_read_write([
+            (ADSIGRP_SYM_HNDBYNAME, 0x0000, 4,
+             var_name.encode(PYADS_ENCODING) + '\x00')
+            for var_name in var_names])
+        return [
+            AdsException(error) if error else struct.unpack('I', data)[0]
+            for error, data in results]
+
+    def get_infos_by_names(self, var_names):
+        """Retrieves the extended symbol information of many symbols with
+        one request per sum_batch_size names (see get_info_by_name()).
+
+        Returns a list in the order of var_names. Its items are AdsSymbol
+        objects or, if the PLC couldn't resolve the name, an AdsException
+        with the error code.
+        """
+        # unlike get_info_by_name(), the read length can't be 0xFFFF: the
+        # PLC would have to reserve it for every entry of the batch
+        encoded = [var_name.encode(PYADS_ENCODING) for var_name in var_names]
+        results = self._sum_read_write([
+            (ADSIGRP_SYM_INFOBYNAMEEX, 0x0000,
+             len(name) + ADS_SYMBOL_INFO_READ_LENGTH, name + '\x00')
+            for name in encoded])
+        infos = []
+        for var_name, (error, data) in zip(var_names, results):
+            if error == ADSERR_DEVICE_INVALIDSIZE:
+                # an exceptionally long type or comment
+                try:
+                    infos.append(self.get_info_by_name(var_name))
+                except AdsException as ex:
+                    infos.append(ex)
+            elif error:
+                infos.append(AdsException(error))
+            else:
+                infos.append(parse_symbol_entry(data)[0])
+        return infos
+
+    def release_handles(self, handles):
+        """Releases many handles with one request per sum_batch_size
+        handles.
+
+        Returns a list in the order of handles. Its items are None or, if
+        the handle couldn't be released, an AdsException with the error
+        code.
+        """
+        errors = self._sum_write([
+            (ADSIGRP_SYM_RELEASEHND, 0x0000, struct.pack('I', handle))
+            for handle in handles])
+        return [AdsException(error) if error else None for error in errors]
+
+    def sum_read(self, requests):
+        """Reads many memory areas with one request per sum_batch_size
+        areas.
+
+        requests: list of (index group, index offset, length) tuples
+        Returns a list of (error code, data) tuples in the order of
+        requests.
+        """
+        results = []
+        for start in xrange(0, len(requests), self.sum_batch_size):
+            batch = requests[start:start + self.sum_batch_size]
+            response = self.read_write(
+                indexGroup=ADSIGRP_SUMUP_READ,
+                indexOffset=len(batch),
+                readLen=sum(4 + length for _, _, length in batch),
+                dataToWrite=b''.join(
+                    struct.pack('<III', group, offset, length)
+                    for group, offset, length in batch))
+            # the response has the error codes of all reads, followed by
+            # their data
+            ptr = 4 * len(batch)
+            for idx, (_, _, length) in enumerate(batch):
+                error = struct.unpack_from('<I', response.data, idx * 4)[0]
+                results.append((error, response.data[ptr:ptr + length]))
+                ptr += length
+        return results
+
+    def _sum_read_write(self, requests):
+        """Executes a list of read/write requests (index group, index
+        offset, read length, data) as ADSIGRP_SUMUP_READWRITE commands and
+        returns a list of (error code, data).
+        """
+        results = []
+        for start in xrange(0, len(requests), self.sum_batch_size):
+            batch = requests[start:start + self.sum_batch_size]
+            headers = [
+                struct.pack('<IIII', group, offset, read_len, len(data))
+                for group, offset, read_len, data in batch]
+            response = self.read_write(
+                indexGroup=ADSIGRP_SUMUP_READWRITE,
+                indexOffset=len(batch),
+                readLen=sum(8 + request[2] for request in batch),
+                dataToWrite=b''.join(headers) + b''.join(
+                    request[3] for request in batch))
+            # the response has (error code, length) of every sub-command,
+            # followed by their data
+            ptr = 8 * len(batch)
+            for idx in xrange(len(batch)):
+                error, length = struct.unpack_from(
+                    '<II', response.data, idx * 8)
+                results.append((error, response.data[ptr:ptr + length]))
+                ptr += length
+        return results
+
+    def _sum_write(self, requests):
+        """Executes a list of write requests (index group, index offset,
+        data) as ADSIGRP_SUMUP_WRITE commands and returns a list of error
+        codes.
+        """
+        errors = []
+        for start in xrange(0, len(requests), self.sum_batch_size):
+            batch = requests[start:start + self.sum_batch_size]
+            headers = [
+                struct.pack('<III', group, offset, len(data))
+                for group, offset, data in batch]
+            response = self.read_write(
+                indexGroup=ADSIGRP_SUMUP_WRITE,
+                indexOffset=len(batch),
+                readLen=4 * len(batch),
+                dataToWrite=b''.join(headers) + b''.join(
+                    request[2] for request in batch))
+            errors.extend(struct.unpack_from(
+                '<%dI' % len(batch), response.data))
+        return errors
 
     def read_by_handle(self, symbolHandle, ads_data_type):
         """Retrieves the current value of a symbol identified by its handle.
@@ -252,12 +796,22 @@ class AdsClient(object):
             AdsDatatype object.
         """
         assert(isinstance(ads_data_type, AdsDatatype))
-        response = self.read(
-            indexGroup=ADSIGRP_SYM_VALBYHND,
-            indexOffset=symbolHandle,
-            length=ads_data_type.byte_count)
-        data = response.data
-        return ads_data_type.unpack(data)
+        with self._deferred_trace():
+            response = self.read(
+                indexGroup=ADSIGRP_SYM_VALBYHND,
+                indexOffset=symbolHandle,
+                length=ads_data_type.byte_count)
+        return self._unpack_traced(ads_data_type, response.data)
+
+    def read_by_handle_into(self, symbolHandle, buffer):
+        """Reads the raw value of a symbol identified by its handle into
+        buffer and returns the number of bytes read, see read_into(). For
+        example, with numpy:
+
+            values = numpy.empty(1000, dtype=numpy_dtype(datatype))
+            client.read_by_handle_into(handle, values)
+        """
+        return self.read_into(ADSIGRP_SYM_VALBYHND, symbolHandle, buffer)
 
     def read_by_name(self, var_name, ads_data_type):
         """Retrieves the current value of a symbol identified by symbol name.
@@ -272,13 +826,23 @@ class AdsClient(object):
         """
         assert(isinstance(ads_data_type, AdsDatatype))
         var_name_enc = var_name.encode(PYADS_ENCODING)
-        response = self.read_write(
-            indexGroup=ADSIGRP_SYM_VALBYNAME,
-            indexOffset=0x0000,
-            readLen=ads_data_type.byte_count,
-            dataToWrite=var_name_enc + '\x00')
-        data = response.data
-        return ads_data_type.unpack(data)
+        with self._deferred_trace():
+            response = self.read_write(
+                indexGroup=ADSIGRP_SYM_VALBYNAME,
+                indexOffset=0x0000,
+                readLen=ads_data_type.byte_count,
+                dataToWrite=var_name_enc + '\x00')
+        return self._unpack_traced(ads_data_type, response.data)
+
+    def bind(self, var_name, ads_data_type):
+        """Returns an AdsVariable whose read() and write() use a resolved
+        handle and prebuilt requests. It is considerably faster than
+        read_by_name() and read_by_handle() for variables accessed often.
+
+        var_name, ads_data_type: see read_by_name()
+        """
+        assert(isinstance(ads_data_type, AdsDatatype))
+        return AdsVariable(self, var_name, ads_data_type)
 
     def write_by_handle(self, symbolHandle, ads_data_type, value):
         """Retrieves the current value of a symbol identified by its handle.
@@ -310,72 +874,126 @@ class AdsClient(object):
         symbol_handle = self.get_handle_by_name(var_name)
         self.write_by_handle(symbol_handle, ads_data_type, value)
 
-    def get_symbols(self):
-        # Figure out the length of the symbol table first
-        resp1 = self.read(
-            indexGroup=0xF00F,  # Not a documented constant
-            indexOffset=0x0000,
-            length=24)
-        sym_count = struct.unpack("I", resp1.data[0:4])[0]
-        sym_list_length = struct.unpack("I", resp1.data[4:8])[0]
-
-        # Get the symbol table
-        resp2 = self.read(
-            indexGroup=ADSIGRP_SYM_UPLOAD,
-            indexOffset=0x0000,
-            length=sym_list_length)
-
-        ptr = 0
-        symbols = []
-        for idx in xrange(sym_count):
-            read_length = struct.unpack("I", resp2.data[ptr+0:ptr+4])[0]
-            index_group = struct.unpack("I", resp2.data[ptr+4:ptr+8])[0]
-            index_offset = struct.unpack("I", resp2.data[ptr+8:ptr+12])[0]
-            name_length = struct.unpack("H", resp2.data[ptr+24:ptr+26])[0]
-            type_length = struct.unpack("H", resp2.data[ptr+26:ptr+28])[0]
-            comment_length = struct.unpack("H", resp2.data[ptr+28:ptr+30])[0]
-
-            name_start_ptr = ptr + 30
-            name_end_ptr = name_start_ptr + name_length
-            type_start_ptr = name_end_ptr + 1
-            type_end_ptr = type_start_ptr + type_length
-            comment_start_ptr = type_end_ptr + 1
-            comment_end_ptr = comment_start_ptr + comment_length
-
-            name = resp2.data[name_start_ptr:name_end_ptr].decode(
-                PYADS_ENCODING).strip(' \t\n\r\0')
-            symtype = resp2.data[type_start_ptr:type_end_ptr]
-            comment = resp2.data[comment_start_ptr:comment_end_ptr].decode(
-                PYADS_ENCODING).strip(' \t\n\r\0')
-
-            ptr = ptr + read_length
-
-            symbol = AdsSymbol(
-                index_group, index_offset, name, symtype, comment)
-
-            symbols.append(symbol)
+    @property
+    def symbols(self):
+        """Hierarchical namespace of the symbols of the PLC, e.g.
+        client.symbols.MAIN.axis[3].read(), see adsnamespace.
+        """
+        if self._symbol_namespace is None:
+            self._symbol_namespace = AdsSymbolNamespace(self)
+        return self._symbol_namespace
 
-        return symbols
+    def get_symbols(self):
+        # the symbol upload can take seconds, don't let it delay other
+        # commands (it can't be chunked though)
+        with self.priority(PRIORITY_BULK):
+            # Figure out the length of the symbol table first
+            resp1 = self.read(
+                indexGroup=ADSIGRP_SYM_UPLOADINFO2,
+                indexOffset=0x0000,
+                length=24)
+            sym_count = struct.unpack("I", resp1.data[0:4])[0]
+            sym_list_length = struct.unpack("I", resp1.data[4:8])[0]
+
+            # Get the symbol table
+            resp2 = self.read(
+                indexGroup=ADSIGRP_SYM_UPLOAD,
+                indexOffset=0x0000,
+                length=sym_list_length)
+
+        return parse_symbol_table(resp2.data, sym_count)
 
     # END variable access methods
 
+    def _recv_into(self, view):
+        # the device may split a packet into several TCP segments, keep
+        # reading until view is filled
+        received = 0
+        length = len(view)
+        while (received < length):
+            count = self.socket.recv_into(view[received:], length - received)
+            if not count:
+                raise socket.error("Connection closed by device")
+            received += count
+
+    def _recv_exactly(self, length):
+        response = bytearray(length)
+        self._recv_into(memoryview(response))
+        return bytes(response)
+
+    def _recv_into_sink(self, invoke_id, view):
+        """Like _recv_into() into the buffer of a read_into() request.
+        Returns False if the request gave up (see _forget_sink()) before
+        all data was received; the rest was then read and discarded.
+        """
+        received = 0
+        length = len(view)
+        while (received < length):
+            with self._sink_lock:
+                if invoke_id in self._sinks:
+                    count = self.socket.recv_into(
+                        view[received:], length - received)
+                else:
+                    count = len(self.socket.recv(length - received))
+            if not count:
+                raise socket.error("Connection closed by device")
+            received += count
+        return invoke_id in self._sinks
+
+    def _forget_sink(self, invoke_id):
+        """Unregisters the buffer of a read_into() request. The reader
+        thread doesn't write into it anymore once this returns.
+        """
+        with self._sink_lock:
+            with self._invoke_lock:
+                self._sinks.pop(invoke_id, None)
+
     def read_ams_packet_from_socket(self):
-        # read default buffer
-        response = self.socket.recv(ADS_CHUNK_SIZE_DEFAULT)
-        # ensure correct beckhoff tcp header
-        if(len(response) < 6):
-            return None
-        # first two bits must be 0
-        if (response[0:2] != b'\x00\x00'):
+        # read beckhoff tcp header
+        tcpHeader = self._recv_exactly(6)
+        # first two bytes must be 0
+        if (tcpHeader[0:2] != b'\x00\x00'):
             return None
         # read whole data length
-        dataLen = struct.unpack('I', response[2:6])[0] + 6
-        # read rest of data, if any
-        while (len(response) < dataLen):
-            nextReadLen = min(ADS_CHUNK_SIZE_DEFAULT, dataLen - len(response))
-            response += self.socket.recv(nextReadLen)
-        # cut off tcp-header and return response amspacket
-        return AmsPacket.from_binary_data(response[6:])
+        dataLen = struct.unpack('<I', tcpHeader[2:6])[0]
+        self.metrics.received(6 + dataLen)
+        if dataLen < AMS_HEADER.size:
+            self._recv_exactly(dataLen)
+            return None
+        amsHeader = self._recv_exactly(AMS_HEADER.size)
+        decodeStart = now_ns() if self._profiling_hooks else 0
+        packet = AmsPacket.from_header(amsHeader)
+
+        dataLen -= AMS_HEADER.size
+        sink = None
+        if self._sinks and packet.error_code == 0 and dataLen >= 8:
+            with self._invoke_lock:
+                sink = self._sinks.get(packet.invoke_id)
+        if sink is None:
+            packet.data = self._recv_exactly(dataLen)
+        else:
+            # result and length of a read response, followed by the data
+            packet.data = self._recv_exactly(8)
+            result, length = struct.unpack('<II', packet.data)
+            if result == 0 and length <= len(sink) and dataLen == 8 + length:
+                if self._recv_into_sink(packet.invoke_id, sink[:length]):
+                    packet.received_into = length
+                else:
+                    # the request timed out, nobody waits for the data
+                    packet.data += b'\x00' * length
+            else:
+                packet.data += self._recv_exactly(dataLen - 8)
+
+        capture = self._capture
+        if capture is not None:
+            amsData = amsHeader + packet.data
+            if packet.received_into is not None:
+                amsData += sink[:packet.received_into].tobytes()
+            capture.write(CAPTURE_RECEIVED, amsData)
+        if self._profiling_hooks:
+            # picked up by send_and_recv() for the frame_decode stage
+            packet.decode_ns = (decodeStart, now_ns())
+        return packet
 
     def get_tcp_header(self, amsData):
         # pack 2 bytes (reserved) and 4 bytes (length)
@@ -388,43 +1006,96 @@ class AdsClient(object):
         tcpHeader = self.get_tcp_header(amsData)
         return tcpHeader + amsData
 
-    def send_and_recv(self, amspacket):
+    def send_and_recv(self, amspacket, trace=None):
         if not self.is_connected:
             self.connect()
         # prepare packet with invoke id
         self.prepare_command_invoke(amspacket)
+        invoke_id = amspacket.invoke_id
 
+        if trace is not None:
+            trace.invoke_id = amspacket.invoke_id
+            frameStart = now_ns()
         try:
             # send tcp-header and ams-data
-            self.socket.send(self.get_tcp_packet(amspacket))
+            tcpPacket = self.get_tcp_packet(amspacket)
+            if trace is not None:
+                sendStart = now_ns()
+                trace.add_stage('frame', frameStart, sendStart)
+            with self._send_lock:
+                # capture before sending, the response may arrive before
+                # sendall() returns
+                capture = self._capture
+                if capture is not None:
+                    capture.write(CAPTURE_SENT, tcpPacket[6:])
+                self.socket.sendall(tcpPacket)
+            self.metrics.sent(len(tcpPacket))
         except Exception as ex:
+            with self._invoke_lock:
+                self._pending.pop(invoke_id, None)
+                self._sinks.pop(invoke_id, None)
             self.close()
             raise PyadsException(
                 "Could not communicate with device: {ex}".format(ex=ex))
 
-        # here's your packet
-        return self.await_command_invoke()
+        if trace is None:
+            # here's your packet
+            return self.await_command_invoke(invoke_id)
+
+        waitStart = now_ns()
+        trace.add_stage('send', sendStart, waitStart)
+        response = self.await_command_invoke(invoke_id)
+        waitEnd = now_ns()
+        decode_ns = getattr(response, 'decode_ns', None)
+        if decode_ns is None:
+            trace.add_stage('wait', waitStart, waitEnd)
+        else:
+            # the reader thread may decode the response before sendall()
+            # returned, don't report negative durations
+            decodeStart, decodeEnd = (max(ns, waitStart) for ns in decode_ns)
+            trace.add_stage('wait', waitStart, decodeStart)
+            trace.add_stage('frame_decode', decodeStart, decodeEnd)
+            trace.add_stage('wakeup', decodeEnd, waitEnd)
+        return response
 
     def prepare_command_invoke(self, amspacket):
-        if(self._current_invoke_id < 0xFFFF):
-            self._current_invoke_id += 1
-        else:
-            self._current_invoke_id = 0x8000
-        self._current_packet = None
-        amspacket.invoke_id = self._current_invoke_id
+        with self._invoke_lock:
+            while True:
+                if(self._current_invoke_id < 0xFFFF):
+                    self._current_invoke_id += 1
+                else:
+                    self._current_invoke_id = 0x8000
+                # skip ids of requests still in flight
+                if self._current_invoke_id not in self._pending:
+                    break
+            self._pending[self._current_invoke_id] = None
+            if amspacket.sink is not None:
+                self._sinks[self._current_invoke_id] = amspacket.sink
+            amspacket.invoke_id = self._current_invoke_id
         if self.debug:
             logger.debug(">>> sending ams-packet:")
             logger.debug(amspacket)
 
-    def await_command_invoke(self):
+    def await_command_invoke(self, invoke_id):
         # unfortunately threading.event is slower than this oldschool poll :-(
         timeout = 0
-        while (self._current_packet is None):
-            timeout += 0.001
-            time.sleep(0.001)
-            if (timeout > 10):
-                raise AdsException("Timout: Did not receive ADS Answer!")
+        try:
+            while (self._pending[invoke_id] is None):
+                timeout += 0.001
+                time.sleep(0.001)
+                if (timeout > self.request_timeout):
+                    self.metrics.timed_out()
+                    self.congestion.on_congestion()
+                    raise AdsException("Timout: Did not receive ADS Answer!")
+                if not self.is_connected:
+                    raise PyadsException("Connection to device lost")
+        finally:
+            # before the invoke id is freed for other requests
+            if invoke_id in self._sinks:
+                self._forget_sink(invoke_id)
+            with self._invoke_lock:
+                packet = self._pending.pop(invoke_id)
         if self.debug:
             logger.debug("<<< received ams-packet:")
-            logger.debug(self._current_packet)
-        return self._current_packet
+            logger.debug(packet)
+        return packet
@@ -0,0 +1,111 @@
+"""Coalescing of identical concurrent reads (single flight).
+
+When several threads read the same memory area at the same time, only the
+first one (the leader) sends a request; the others wait for its response
+and all of them get the same result, or the same exception. Optionally a
+response is also reused for identical reads issued within ttl seconds after
+it was received, which bounds the request rate of hot variables.
+
+A write makes the coalescer forget the reads in flight and the reused
+responses, so that a read issued after a write never returns a value read
+before it.
+"""
+from collections import OrderedDict
+import threading
+
+from .adsutils import monotonic
+
+
+# maximum number of reusable results; the oldest are dropped first
+MAX_RESULTS = 1024
+
+
+class _Flight(object):
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class AdsSingleFlight(object):
+    """Executes concurrent calls with the same key once."""
+    def __init__(self, ttl=0):
+        """
+        ttl: seconds a result is reused for calls with the same key after
+            it was received (0: only calls that overlap in time share it)
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> _Flight in progress
+        self._flights = {}
+        # key -> (time received, result), oldest first
+        self._results = OrderedDict()
+        self.executed = 0
+        self.coalesced = 0
+        self.reused = 0
+
+    def do(self, key, fn):
+        """Returns fn() or the result of a concurrent or recent call of fn
+        with the same key.
+        """
+        with self._lock:
+            if self.ttl:
+                entry = self._results.get(key)
+                if entry is not None and monotonic() - entry[0] < self.ttl:
+                    self.reused += 1
+                    return entry[1]
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self.executed += 1
+            else:
+                flight.followers += 1
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                # unless a write made us forget the flight in the meantime
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                    if self.ttl and flight.error is None:
+                        self._store(key, flight.result)
+            flight.done.set()
+        return flight.result
+
+    def _store(self, key, result):
+        # re-inserting moves the key to the end
+        self._results.pop(key, None)
+        while len(self._results) >= MAX_RESULTS:
+            self._results.popitem(last=False)
+        self._results[key] = (monotonic(), result)
+
+    def invalidate(self):
+        """Makes subsequent calls execute fn again. Calls waiting for a
+        flight in progress still get its result.
+        """
+        with self._lock:
+            self._flights.clear()
+            self._results.clear()
+
+    def stats(self):
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'reused': self.reused,
+        }
@@ -115,6 +115,44 @@ class ReadResponse(AdsResponse):
         return u"AdsReadResponse:\n%s" % HexBlock(self.data)
 
 
+class ReadIntoCommand(ReadCommand):
+    """Reads len(sink) bytes into sink, a writable memoryview of bytes. The
+    client receives the data of the response directly into sink instead of
+    creating a string, see AdsClient.read_into().
+    """
+    def __init__(self, indexGroup, indexOffset, sink):
+        super(ReadIntoCommand, self).__init__(
+            indexGroup, indexOffset, len(sink))
+        self.sink = sink
+
+    def to_ams_packet(self, adsConnection):
+        packet = super(ReadIntoCommand, self).to_ams_packet(adsConnection)
+        packet.sink = self.sink
+        return packet
+
+    def CreateResponse(self, responsePacket):
+        return ReadIntoResponse(responsePacket, self.sink)
+
+
+class ReadIntoResponse(AdsResponse):
+    def __init__(self, responseAmsPacket, sink):
+        super(ReadIntoResponse, self).__init__(responseAmsPacket)
+
+        self.Length = struct.unpack_from('I', responseAmsPacket.data, 4)[0]
+        if responseAmsPacket.received_into is None:
+            # the response didn't match the request (e.g. more data than
+            # requested), it was received as a string
+            data = responseAmsPacket.data[8:8 + len(sink)]
+            sink[:len(data)] = data
+            self.Length = len(data)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    def __unicode__(self):
+        return u"AdsReadIntoResponse: %d bytes" % self.Length
+
+
 class ReadStateCommand(AdsCommand):
     def __init__(self):
         super(ReadStateCommand, self).__init__()
@@ -0,0 +1,134 @@
+"""Congestion control of the requests AdsClient has in flight.
+
+A PLC accepts only a limited number of queued ADS requests. When its
+mailbox is full it rejects further requests with ADS error 0x4 ("Insert
+mailbox error. Reduce the number of ADS calls"); an overloaded router
+answers with 0x745 (timeout). AdsCongestionControl adjusts the number of
+requests the client may have in flight like TCP does with its congestion
+window:
+
+    additive increase        every window's worth of successful responses
+                             grows the window by one request
+    multiplicative decrease  a rejected or timed out request, or a response
+                             slower than latency_target (except bulk
+                             requests, whose latency depends on their
+                             size), shrinks the window
+                             by the factor decrease (at most once per
+                             round trip, so a burst of rejections of the
+                             same window counts as a single congestion
+                             event)
+
+The window is applied as capacity of the AdsPriorityGate of the client.
+Idempotent reads that were rejected are retried by AdsClient (see
+is_retryable()), so callers don't see transient congestion.
+"""
+import threading
+
+from .adsconstants import ADSIGRP_SYM_HNDBYNAME
+from .adsconstants import ADSIGRP_SYM_INFOBYNAMEEX
+from .adsconstants import ADSIGRP_SYM_VALBYNAME
+from .adsconstants import ADSIGRP_SUMUP_READ
+from .adsutils import monotonic
+
+
+ADSERR_MAILBOX_FULL = 0x4
+ADSERR_TIMEOUT = 0x745
+
+# errors signalling an overloaded device; requests rejected with them were
+# not executed and can be sent again
+CONGESTION_ERRORS = (ADSERR_MAILBOX_FULL, ADSERR_TIMEOUT)
+
+# read/write services that only read (HNDBYNAME creates a handle, but a
+# rejected request didn't)
+READ_ONLY_READ_WRITE_GROUPS = (
+    ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SYM_INFOBYNAMEEX, ADSIGRP_SYM_VALBYNAME,
+    ADSIGRP_SUMUP_READ)
+
+# weight of a new sample in the smoothed round trip time
+RTT_GAIN = 0.125
+
+
+def is_idempotent(command):
+    """True if command only reads and may be repeated."""
+    if command.command_id in (0x0001, 0x0002, 0x0004):
+        # device info, read, read state
+        return True
+    if command.command_id == 0x0009:
+        return command.index_group in READ_ONLY_READ_WRITE_GROUPS
+    return False
+
+
+def is_retryable(command, code):
+    return code in CONGESTION_ERRORS and is_idempotent(command)
+
+
+class AdsCongestionControl(object):
+    """AIMD in-flight window of an AdsClient."""
+    def __init__(
+            self, gate, max_window=1, min_window=1, latency_target=None,
+            decrease=0.5):
+        """
+        gate: AdsPriorityGate whose capacity is the window
+        max_window, min_window: bounds of the number of requests in flight.
+            The window starts at min_window.
+        latency_target: seconds; slower responses count as congestion. None
+            reacts to ADS errors only.
+        decrease: factor applied to the window on congestion
+        """
+        self.gate = gate
+        self.max_window = max_window
+        self.min_window = min_window
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.window = float(min_window)
+        self.srtt = None
+        self.congestion_events = 0
+        self._last_decrease = None
+        self._lock = threading.Lock()
+        self._apply()
+
+    def _apply(self):
+        self.gate.capacity = int(self.window)
+
+    def on_response(self, seconds, bulk=False):
+        """Records a successful request that took seconds. The latency of
+        bulk requests grows with their size rather than with the load of the
+        device, so it isn't sampled (bulk=True).
+        """
+        with self._lock:
+            if not bulk:
+                if self.srtt is None:
+                    self.srtt = seconds
+                else:
+                    self.srtt += RTT_GAIN * (seconds - self.srtt)
+            if (not bulk and self.latency_target is not None and
+                    seconds > self.latency_target):
+                self._decrease()
+            elif self.window < self.max_window:
+                self.window = min(
+                    self.max_window, self.window + 1.0 / int(self.window))
+            self._apply()
+
+    def on_congestion(self):
+        """Records a request rejected by or timed out at the device."""
+        with self._lock:
+            self._decrease()
+            self._apply()
+
+    def _decrease(self):
+        now = monotonic()
+        if (self._last_decrease is not None and
+                now - self._last_decrease < (self.srtt or 0)):
+            # same congestion event as the last decrease
+            return
+        self._last_decrease = now
+        self.congestion_events += 1
+        self.window = max(self.min_window, self.window * self.decrease)
+
+    def stats(self):
+        return {
+            'window': int(self.window),
+            'max_window': self.max_window,
+            'srtt': self.srtt,
+            'congestion_events': self.congestion_events,
+        }
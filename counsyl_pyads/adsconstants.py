@@ -91,6 +91,9 @@ ADSIGRP_IOIMAGE_RWOSIZE = 0xF035
 ADSIGRP_IOIMAGE_CLEARI = 0xF040
 ADSIGRP_IOIMAGE_CLEARO = 0xF050
 ADSIGRP_IOIMAGE_RWIOB = 0xF060
+ADSIGRP_SUMUP_READ = 0xF080
+ADSIGRP_SUMUP_WRITE = 0xF081
+ADSIGRP_SUMUP_READWRITE = 0xF082
 ADSIGRP_DEVICE_DATA = 0xF100
 ADSIOFFS_DEVDATA_ADSSTATE = 0x0000
 ADSIOFFS_DEVDATA_DEVSTATE = 0x0002
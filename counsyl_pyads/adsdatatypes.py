@@ -8,26 +8,73 @@ from collections import Sequence
 from copy import copy
 import datetime
 from functools import reduce
+import itertools
+import re
 import struct
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from .constants import PYADS_ENCODING
+from .adsexception import PyadsException
 from .adsexception import PyadsTypeError
 
 
+# struct format characters and their NumPy equivalents
+NUMPY_TYPE_CODES = {
+    '?': 'b1',
+    'b': 'i1',
+    'B': 'u1',
+    'h': 'i2',
+    'H': 'u2',
+    'i': 'i4',
+    'I': 'u4',
+    'l': 'i4',
+    'L': 'u4',
+    'q': 'i8',
+    'Q': 'u8',
+    'f': 'f4',
+    'd': 'f8',
+}
+
+
 class AdsDatatype(object):
     """Represents a simple data type with a fixed byte count."""
+    # set by freeze(), see AdsDatatypeFactory
+    _frozen = False
+    # see AdsTemporalDatatype
+    numpy_unit = None
+
     def __init__(self, byte_count, pack_format):
         self.byte_count = int(byte_count)
         self.pack_format = str(pack_format)
+        # compiled once instead of looking up the format in the struct
+        # module's cache on every call
+        self._struct = struct.Struct(self.pack_format)
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError(
+                "Can't set %r, the data type is shared by all users of the "
+                "datatype factory." % name)
+        super(AdsDatatype, self).__setattr__(name, value)
+
+    def freeze(self):
+        """Makes the attributes of the data type read-only."""
+        object.__setattr__(self, '_frozen', True)
+        return self
 
     def pack(self, values_list):
         """Pack a value using Python's struct.pack()"""
         assert(self.pack_format is not None)
-        return struct.pack(self.pack_format, *values_list)
+        return self._struct.pack(*values_list)
 
     def pack_into_buffer(self, byte_buffer, offset, values_list):
         assert(self.pack_format is not None)
-        struct.pack_into(self.pack_format, byte_buffer, offset, *values_list)
+        self._struct.pack_into(byte_buffer, offset, *values_list)
 
     def unpack(self, value):
         """Unpack a value using Python's struct.unpack()"""
@@ -36,11 +83,11 @@ class AdsDatatype(object):
         # (https://docs.python.org/2/library/struct.html#struct.unpack)
         # For single-valued data types, use AdsSingleValuedDatatype to get the
         # first (and only) entry of the tuple after unpacking.
-        return struct.unpack(self.pack_format, value)
+        return self._struct.unpack(value)
 
     def unpack_from_buffer(self, byte_buffer, offset):
         assert(self.pack_format is not None)
-        return struct.unpack_from(self.pack_format, byte_buffer, offset)
+        return self._struct.unpack_from(byte_buffer, offset)
 
 
 class AdsSingleValuedDatatype(AdsDatatype):
@@ -49,7 +96,7 @@ class AdsSingleValuedDatatype(AdsDatatype):
         return super(AdsSingleValuedDatatype, self).pack([value])
 
     def pack_into_buffer(self, byte_buffer, offset, value):
-        return super(AdsSingleValuedDatatype, self).pack(
+        return super(AdsSingleValuedDatatype, self).pack_into_buffer(
             byte_buffer, offset, [value])
 
     def unpack(self, value):
@@ -58,7 +105,8 @@ class AdsSingleValuedDatatype(AdsDatatype):
 
     def unpack_from_buffer(self, byte_buffer, offset):
         unpacked_tuple = super(
-            AdsSingleValuedDatatype, self).unpack(byte_buffer, offset)
+            AdsSingleValuedDatatype, self).unpack_from_buffer(
+                byte_buffer, offset)
         return unpacked_tuple[0]
 
 
@@ -96,109 +144,250 @@ class AdsStringDatatype(AdsSingleValuedDatatype):
         return self.byte_str_to_decoded_str(value)
 
 
-class AdsTimeDatatype(AdsSingleValuedDatatype):
-    """Represents Twincat's TIME data type."""
-    def __init__(self):
-        # DATE, TIME, and DATE_AND_TIME are all handled as WORD by Twincat
-        super(AdsTimeDatatype, self).__init__(byte_count=4, pack_format='I')
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+MILLISECONDS_PER_DAY = 24 * 60 * 60 * 1000
+SECONDS_PER_DAY = 24 * 60 * 60
 
-    def time_to_milliseconds_integer(self, value):
-        """Converts a Python datetime.time object to an integer.
 
-        The output represents the number of milliseconds since
-        datetime.time(0). Any time zone information is ignored.
-        """
-        assert(isinstance(value, datetime.time))
-        return (
-            ((value.hours * 60 + value.minutes) * 60 + value.seconds) * 1000 +
-            int(value.microseconds / 1000))
+class AdsTemporalDatatype(AdsSingleValuedDatatype):
+    """Base of the time data types. Twincat handles DATE, TIME, TIME_OF_DAY
+    and DATE_AND_TIME as DWORD; subclasses convert between the integer and
+    the Python value in to_integer() and from_integer().
+    """
+    # NumPy type of the integer, and of the values returned by
+    # AdsArrayDatatype.unpack_numpy()
+    numpy_raw_unit = None
+    numpy_unit = None
 
-    def milliseconds_integer_to_time(self, value):
-        """Converts an integer into a Python datetime.time object.
+    def __init__(self):
+        super(AdsTemporalDatatype, self).__init__(
+            byte_count=4, pack_format='I')
 
-        The input is assumed to represent the number of milliseconds since
-        datetime.time(0). Any time zone information is ignored.
-        """
-        assert(isinstance(value, int))
-        # pretend this is a timestamp in millisecond resolution and get the
-        # datetime ignoring timezones, then discard the date component
-        dt = datetime.datetime.utcfromtimestamp(value / 1000.0)
-        return dt.time()
+    def _check_type(self, value, expected_type):
+        if not isinstance(value, expected_type):
+            raise PyadsTypeError(
+                "A value of type %s is required, %r was given." % (
+                    expected_type.__name__, value))
+
+    def _check_range(self, value):
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise PyadsTypeError(
+                "The value is out of the range of the PLC data type.")
+        return value
 
     def pack(self, value):
-        value = self.time_to_milliseconds_integer(value)
-        return super(AdsTimeDatatype, self).pack(value)
+        return super(AdsTemporalDatatype, self).pack(self.to_integer(value))
 
     def pack_into_buffer(self, byte_buffer, offset, value):
-        value = self.time_to_milliseconds_integer(value)
-        super(AdsTimeDatatype, self).pack_into_buffer(
-            byte_buffer, offset, value)
+        super(AdsTemporalDatatype, self).pack_into_buffer(
+            byte_buffer, offset, self.to_integer(value))
 
     def unpack(self, value):
-        value = super(AdsTimeDatatype, self).unpack(value)
-        return self.milliseconds_integer_to_time(value)
+        return self.from_integer(
+            super(AdsTemporalDatatype, self).unpack(value))
 
     def unpack_from_buffer(self, byte_buffer, offset):
-        value = super(AdsTimeDatatype, self).unpack_from_buffer(
-            byte_buffer, offset)
-        return self.milliseconds_integer_to_time(value)
+        return self.from_integer(
+            super(AdsTemporalDatatype, self).unpack_from_buffer(
+                byte_buffer, offset))
 
 
-class AdsDateDatatype(AdsSingleValuedDatatype):
-    def __init__(self):
-        # DATE, TIME, and DATE_AND_TIME are all handled as WORD by Twincat
-        super(AdsDateDatatype, self).__init__(byte_count=4, pack_format='I')
-
-    # contrary to what the docs say the resolution of the DATE datatype is
-    # one day, not one second
-    def time_to_days_integer(self, value):
-        assert(isinstance(value, datetime.date))
-        dt1970 = datetime.date(1970, 1, 1)
-        tdelta = value - dt1970
-        return tdelta.days
-
-    def days_integer_to_time(self, value):
-        assert(isinstance(value, int))
-        dt1970 = datetime.date(1970, 1, 1)
-        return dt1970 + datetime.date(days=value)
+class AdsTimeDatatype(AdsTemporalDatatype):
+    """Represents Twincat's TIME data type, a duration in milliseconds, as
+    datetime.timedelta.
+    """
+    numpy_raw_unit = 'm8[ms]'
+    numpy_unit = 'm8[ms]'
 
-    def pack(self, value):
-        value = self.time_to_days_integer(value)
-        return super(AdsTimeDatatype, self).pack(value)
+    def to_integer(self, value):
+        """Converts a datetime.timedelta into milliseconds; fractions of a
+        millisecond are truncated.
+        """
+        self._check_type(value, datetime.timedelta)
+        return self._check_range(
+            (value.days * SECONDS_PER_DAY + value.seconds) * 1000 +
+            value.microseconds // 1000)
 
-    def pack_into_buffer(self, byte_buffer, offset, value):
-        value = self.time_to_days_integer(value)
-        super(AdsTimeDatatype, self).pack_into_buffer(
-            byte_buffer, offset, value)
+    def from_integer(self, value):
+        return datetime.timedelta(milliseconds=value)
 
-    def unpack(self, value):
-        value = super(AdsTimeDatatype, self).unpack(value)
-        return self.days_integer_to_time(value)
 
-    def unpack_from_buffer(self, byte_buffer, offset):
-        value = super(AdsTimeDatatype, self).unpack_from_buffer(
-            byte_buffer, offset)
-        return self.days_integer_to_time(value)
+class AdsTimeOfDayDatatype(AdsTemporalDatatype):
+    """Represents Twincat's TIME_OF_DAY data type, the milliseconds since
+    midnight, as datetime.time. Any time zone information is ignored.
+    NumPy has no time of day type, unpack_numpy() returns the time since
+    midnight as timedelta64.
+    """
+    numpy_raw_unit = 'm8[ms]'
+    numpy_unit = 'm8[ms]'
 
+    def to_integer(self, value):
+        self._check_type(value, datetime.time)
+        return (
+            ((value.hour * 60 + value.minute) * 60 + value.second) * 1000 +
+            value.microsecond // 1000)
+
+    def from_integer(self, value):
+        if value >= MILLISECONDS_PER_DAY:
+            raise PyadsTypeError(
+                "%d milliseconds exceed a day." % value)
+        seconds, milliseconds = divmod(value, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return datetime.time(hours, minutes, seconds, milliseconds * 1000)
+
+
+class AdsDateDatatype(AdsTemporalDatatype):
+    """Represents Twincat's DATE data type as datetime.date."""
+    # DATE is stored as seconds since 1970 like DATE_AND_TIME, but contrary
+    # to what the docs say the resolution of the DATE datatype is one day,
+    # not one second
+    numpy_raw_unit = 'M8[s]'
+    numpy_unit = 'M8[D]'
+
+    def to_integer(self, value):
+        self._check_type(value, datetime.date)
+        if isinstance(value, datetime.datetime):
+            value = value.date()
+        return self._check_range(
+            (value - EPOCH_DATE).days * SECONDS_PER_DAY)
+
+    def from_integer(self, value):
+        return EPOCH_DATE + datetime.timedelta(days=value // SECONDS_PER_DAY)
+
+
+class AdsDateAndTimeDatatype(AdsTemporalDatatype):
+    """Represents Twincat's DATE_AND_TIME data type, the seconds since 1970,
+    as datetime.datetime. Any time zone information is ignored.
+    """
+    numpy_raw_unit = 'M8[s]'
+    numpy_unit = 'M8[s]'
+
+    def to_integer(self, value):
+        """Converts a datetime.datetime into seconds since 1970; fractions
+        of a second are truncated.
+        """
+        self._check_type(value, datetime.datetime)
+        delta = value.replace(tzinfo=None) - EPOCH
+        return self._check_range(
+            delta.days * SECONDS_PER_DAY + delta.seconds)
+
+    def from_integer(self, value):
+        return EPOCH + datetime.timedelta(seconds=value)
+
+
+class AdsEnumDatatype(AdsSingleValuedDatatype):
+    """Represents an enumeration of PLC code: '(Idle := 0, Running, Error)'.
+    Values are unpacked as integers; pack() accepts integers and member
+    names.
+    """
+    def __init__(self, base_type, members):
+        """base_type is the integer AdsDatatype the PLC stores the values as
+            (INT unless the declaration names another one)
+        members is a list of tuples (name, value)
+        """
+        self.base_type = base_type
+        self.members = OrderedDict(members)
+        # IEC 61131-3 identifiers are case insensitive
+        self._values = dict(
+            (name.upper(), value) for name, value in self.members.items())
+        super(AdsEnumDatatype, self).__init__(
+            byte_count=base_type.byte_count,
+            pack_format=base_type.pack_format)
+
+    def _to_integer(self, value):
+        if isinstance(value, basestring):
+            try:
+                return self._values[value.upper()]
+            except KeyError:
+                raise PyadsTypeError(
+                    "%r is not a member of the enumeration." % value)
+        return value
+
+    def pack(self, value):
+        return super(AdsEnumDatatype, self).pack(self._to_integer(value))
+
+    def pack_into_buffer(self, byte_buffer, offset, value):
+        super(AdsEnumDatatype, self).pack_into_buffer(
+            byte_buffer, offset, self._to_integer(value))
 
-# TODO
-class AdsDateAndTimeDatatype(AdsSingleValuedDatatype):
-    def __init__(self):
-        # DATE, TIME, and DATE_AND_TIME are all handled as WORD by Twincat
-        super(AdsDateAndTimeDatatype, self).__init__(
-            byte_count=4, pack_format='I')
+
+class AdsStructDatatype(AdsDatatype):
+    """Represents a STRUCT of PLC code. The Python representation of a
+    value is an OrderedDict of the field values in declaration order.
+    """
+    def __init__(self, fields, pack_mode=1):
+        """fields is a list of tuples (name, AdsDatatype) in declaration
+            order
+        pack_mode is the largest alignment of a field in bytes: a field is
+            placed at a multiple of the smaller of its own alignment and
+            pack_mode. TwinCAT 2 on x86 doesn't align (1), TwinCAT 3 aligns
+            to 8 bytes unless {attribute 'pack_mode'} says otherwise.
+        """
+        self.fields = list(fields)
+        self.pack_mode = int(pack_mode)
+        names = [name for name, _ in self.fields]
+        if len(set(names)) != len(names):
+            raise PyadsTypeError(
+                "The field names of a struct must be unique: %s." %
+                ', '.join(names))
+        self.offsets = []
+        offset = 0
+        self.alignment = 1
+        for name, datatype in self.fields:
+            if not isinstance(datatype, AdsDatatype):
+                raise PyadsTypeError(
+                    "Field %s must be an AdsDatatype, %r was given." % (
+                        name, datatype))
+            alignment = min(_alignment(datatype), self.pack_mode)
+            offset = _align(offset, alignment)
+            self.offsets.append(offset)
+            offset += datatype.byte_count
+            self.alignment = max(self.alignment, alignment)
+        # the size is padded so that the fields of array elements stay
+        # aligned
+        byte_count = _align(offset, self.alignment)
+        super(AdsStructDatatype, self).__init__(
+            byte_count=byte_count, pack_format='%ds' % byte_count)
+
+    def _field_values(self, value):
+        if isinstance(value, dict):
+            try:
+                return [value[name] for name, _ in self.fields]
+            except KeyError as ex:
+                raise PyadsTypeError(
+                    "The value of the struct has no field %s." % ex)
+        if isinstance(value, Sequence) and len(value) == len(self.fields):
+            return value
+        raise PyadsTypeError(
+            "The value of the struct must be a dict or a sequence of the %d "
+            "field values, %r was given." % (len(self.fields), value))
 
     def pack(self, value):
-        pass
+        byte_buffer = bytearray(self.byte_count)
+        self.pack_into_buffer(byte_buffer, 0, value)
+        return bytes(byte_buffer)
 
     def pack_into_buffer(self, byte_buffer, offset, value):
-        pass
+        for (_, datatype), field_offset, field_value in zip(
+                self.fields, self.offsets, self._field_values(value)):
+            datatype.pack_into_buffer(
+                byte_buffer, offset + field_offset, field_value)
 
     def unpack(self, value):
-        pass
+        if len(value) != self.byte_count:
+            raise PyadsTypeError(
+                "The struct has %d bytes but %d were given." % (
+                    self.byte_count, len(value)))
+        return self.unpack_from_buffer(value, 0)
 
     def unpack_from_buffer(self, byte_buffer, offset):
-        pass
+        return OrderedDict(
+            (name, datatype.unpack_from_buffer(
+                byte_buffer, offset + field_offset))
+            for (name, datatype), field_offset in zip(
+                self.fields, self.offsets))
 
 
 class AdsArrayDatatype(AdsDatatype):
@@ -207,16 +396,18 @@ class AdsArrayDatatype(AdsDatatype):
     """
     def __init__(self, data_type, dimensions=None):
         """Creates data type capable of packing and unpacking an array of
-        elements of a single-valued data type. The Python representation of
+        elements of a single data type. The Python representation of
         the array is as a dict because PLC arrays are arbitrarily indexed.
         Multidimensional PLC arrays are represented as nested dicts.
 
-        data_type must be of type AdsSingleValuedDatatype
+        data_type is the AdsDatatype of the elements, e.g. INT, STRING(81),
+            an AdsStructDatatype or another array
         dimensions is either the total number of elements in the array as
             integer or a list of tuple of (inclusive) start and end indices in
             the same order as they appear in the array definition in PLC code
         """
-        assert(isinstance(data_type, AdsSingleValuedDatatype))
+        assert(isinstance(data_type, AdsDatatype))
+        self.data_type = data_type
 
         # if the array is 1-dimensional and zero-indexed the dimensions
         # argument could be an integer
@@ -233,15 +424,23 @@ class AdsArrayDatatype(AdsDatatype):
         # that it could be multidimensional
         self.total_element_count = reduce(
             lambda x, y: x * (y[1] - y[0] + 1),  # 1..4 => 4 elements!
-            dimensions, 1)
+            self.dimensions, 1)
+        self.shape = tuple(end - start + 1 for start, end in self.dimensions)
 
         total_byte_count = self.total_element_count * data_type.byte_count
-        super(AdsArrayDatatype, self).__init__(
-            byte_count=total_byte_count,
-            pack_format='{cnt}{fmt}'.format(
+        # The elements of plain single-valued types are packed by a single
+        # struct. Repeating the format of other types doesn't work ('3' +
+        # '81s' is '381s'), their elements are packed one by one.
+        self._elementwise = type(data_type) is not AdsSingleValuedDatatype
+        if self._elementwise:
+            pack_format = '%ds' % total_byte_count
+        else:
+            pack_format = '{cnt}{fmt}'.format(
                 cnt=self.total_element_count,
                 fmt=data_type.pack_format,
-            ))
+            )
+        super(AdsArrayDatatype, self).__init__(
+            byte_count=total_byte_count, pack_format=pack_format)
 
     def _dict_to_flat_list(self, dict_, dims=None):
         """Recursively builds a flat list from a dict while checking if the
@@ -350,8 +549,11 @@ class AdsArrayDatatype(AdsDatatype):
         """Packs the Python representation of the array into a binary string.
 
         As a convenience, both the dict representation returned by unpack() and
-        a flattened list are accepted as inputs.
+        a flattened list are accepted as inputs, as well as NumPy arrays like
+        the ones returned by unpack_numpy().
         """
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            return self._pack_numpy(value)
         # The exception message for incorrect arguments can get complex here,
         # pre-assemble a base message first, then modify it for each specific
         # exception.
@@ -386,11 +588,199 @@ class AdsArrayDatatype(AdsDatatype):
             raise PyadsTypeError(
                 exception_str % "The value must be a list or a dict.")
 
+        return self._pack_flat(flat)
+
+    def _pack_flat(self, flat):
+        if self._elementwise:
+            pack = self.data_type.pack
+            return b''.join([pack(element) for element in flat])
         return super(AdsArrayDatatype, self).pack(flat)
 
+    def _pack_numpy(self, array):
+        dtype = numpy_dtype(self.data_type)
+        # elements which are arrays are the trailing dimensions of array
+        if dtype.subdtype is not None:
+            dtype = dtype.subdtype[0]
+        raw = numpy.ascontiguousarray(
+            _from_numpy_values(array, self.data_type), dtype=dtype)
+        if raw.nbytes != self.byte_count:
+            raise PyadsTypeError(
+                "The array has %d bytes but %d were given." % (
+                    self.byte_count, raw.nbytes))
+        return raw.tobytes()
+
+    def _unpack_flat(self, byte_buffer, offset):
+        if not self._elementwise:
+            return super(AdsArrayDatatype, self).unpack_from_buffer(
+                byte_buffer, offset)
+        unpack_from_buffer = self.data_type.unpack_from_buffer
+        size = self.data_type.byte_count
+        return [
+            unpack_from_buffer(byte_buffer, offset + idx * size)
+            for idx in xrange(self.total_element_count)]
+
+    def pack_into_buffer(self, byte_buffer, offset, value):
+        """c.f. pack()"""
+        packed = self.pack(value)
+        byte_buffer[offset:offset + len(packed)] = packed
+
     def unpack(self, value):
-        flat = super(AdsArrayDatatype, self).unpack(value)
-        return self._flat_list_to_dict(flat)
+        if len(value) != self.byte_count:
+            raise PyadsTypeError(
+                "The array has %d bytes but %d were given." % (
+                    self.byte_count, len(value)))
+        return self._flat_list_to_dict(self._unpack_flat(value, 0))
+
+    def unpack_from_buffer(self, byte_buffer, offset):
+        """c.f. unpack()"""
+        return self._flat_list_to_dict(self._unpack_flat(byte_buffer, offset))
+
+    def unpack_numpy(self, value, convert=True):
+        """Unpacks the array into a NumPy array of self.shape with a single
+        frombuffer() call; arrays of structs become structured arrays.
+
+        With convert, STRING elements and fields are cut at their first
+        NULL and decoded to unicode, and time data types become
+        timedelta64 or datetime64, each in one vectorized step for the
+        whole array. Without it, they are the raw bytes and integers of the
+        PLC. The array shares the memory of value if nothing needs
+        converting (and is then read-only if value is).
+        """
+        if numpy is None:
+            raise PyadsException("unpack_numpy() requires NumPy.")
+        dtype = numpy_dtype(self.data_type)
+        array = numpy.frombuffer(
+            value, dtype=dtype, count=self.total_element_count)
+        # elements which are arrays themselves add their own dimensions
+        array = array.reshape(self.shape + array.shape[1:])
+        if convert:
+            array = _to_numpy_values(array, self.data_type)
+        return array
+
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _alignment(datatype):
+    """Returns the natural alignment of a data type in bytes."""
+    if isinstance(datatype, AdsStructDatatype):
+        return datatype.alignment
+    if isinstance(datatype, AdsArrayDatatype):
+        return _alignment(datatype.data_type)
+    if isinstance(datatype, AdsStringDatatype):
+        return 1
+    return max(datatype.byte_count, 1)
+
+
+def numpy_dtype(datatype):
+    """Returns the (little endian) NumPy dtype of an AdsDatatype. Structs
+    are structured dtypes with the offsets of their fields, STRING(n) is
+    'Sn'.
+    """
+    if numpy is None:
+        raise PyadsException("numpy_dtype() requires NumPy.")
+    if isinstance(datatype, AdsStructDatatype):
+        return numpy.dtype({
+            'names': [name for name, _ in datatype.fields],
+            'formats': [
+                numpy_dtype(field_datatype)
+                for _, field_datatype in datatype.fields],
+            'offsets': datatype.offsets,
+            'itemsize': datatype.byte_count,
+        })
+    if isinstance(datatype, AdsArrayDatatype):
+        return numpy.dtype((numpy_dtype(datatype.data_type), datatype.shape))
+    if isinstance(datatype, AdsStringDatatype):
+        return numpy.dtype('S%d' % datatype.byte_count)
+    code = NUMPY_TYPE_CODES.get(datatype.pack_format)
+    if code is None:
+        raise PyadsTypeError(
+            "There is no NumPy type for pack format %r." %
+            datatype.pack_format)
+    return numpy.dtype('<' + code)
+
+
+def _needs_conversion(datatype):
+    if isinstance(datatype, AdsStructDatatype):
+        return any(_needs_conversion(field) for _, field in datatype.fields)
+    if isinstance(datatype, AdsArrayDatatype):
+        return _needs_conversion(datatype.data_type)
+    return (
+        isinstance(datatype, AdsStringDatatype) or
+        datatype.numpy_unit is not None)
+
+
+def _numpy_value_dtype(datatype):
+    """NumPy dtype of the values returned by unpack_numpy()."""
+    if isinstance(datatype, AdsStructDatatype):
+        return numpy.dtype([
+            (name, _numpy_value_dtype(field))
+            for name, field in datatype.fields])
+    if isinstance(datatype, AdsArrayDatatype):
+        return numpy.dtype(
+            (_numpy_value_dtype(datatype.data_type), datatype.shape))
+    if isinstance(datatype, AdsStringDatatype):
+        return numpy.dtype('U%d' % datatype.byte_count)
+    if datatype.numpy_unit is not None:
+        return numpy.dtype(datatype.numpy_unit)
+    return numpy_dtype(datatype)
+
+
+def _to_numpy_values(array, datatype):
+    """Converts an array of the raw elements of datatype, see
+    unpack_numpy().
+    """
+    if not _needs_conversion(datatype):
+        return array
+    if isinstance(datatype, AdsStructDatatype):
+        values = numpy.empty(array.shape, dtype=_numpy_value_dtype(datatype))
+        for name, field in datatype.fields:
+            values[name] = _to_numpy_values(array[name], field)
+        return values
+    if isinstance(datatype, AdsArrayDatatype):
+        # the dimensions of nested arrays are trailing dimensions of array
+        return _to_numpy_values(array, datatype.data_type)
+    if isinstance(datatype, AdsStringDatatype):
+        return _decode_strings(array)
+    return array.astype(datatype.numpy_raw_unit).astype(datatype.numpy_unit)
+
+
+def _from_numpy_values(array, datatype):
+    """Inverse of _to_numpy_values(); raw arrays are passed through."""
+    if not _needs_conversion(datatype):
+        return array
+    if isinstance(datatype, AdsStructDatatype):
+        dtype = numpy_dtype(datatype)
+        if array.dtype == dtype:
+            return array
+        raw = numpy.zeros(array.shape, dtype=dtype)
+        for name, field in datatype.fields:
+            raw[name] = _from_numpy_values(array[name], field)
+        return raw
+    if isinstance(datatype, AdsArrayDatatype):
+        return _from_numpy_values(array, datatype.data_type)
+    if isinstance(datatype, AdsStringDatatype):
+        if array.dtype.kind == 'U':
+            return numpy.char.encode(array, PYADS_ENCODING)
+        return array
+    if array.dtype.kind in 'mM':
+        return array.astype(datatype.numpy_raw_unit).astype('<u4')
+    return array
+
+
+def _decode_strings(array):
+    """Decodes an array of byte strings like AdsStringDatatype.unpack()
+    does, but for the whole array at once.
+    """
+    width = array.dtype.itemsize
+    raw = numpy.ascontiguousarray(array).view(numpy.uint8).reshape(
+        array.shape + (width,))
+    # clear everything behind the first NULL of each string, NumPy only
+    # strips trailing NULLs
+    raw = raw * ~numpy.logical_or.accumulate(raw == 0, axis=-1)
+    strings = raw.view('S%d' % width).reshape(array.shape)
+    return numpy.char.decode(strings, PYADS_ENCODING)
 
 
 BOOL = AdsSingleValuedDatatype(byte_count=1, pack_format='?')  # Bool
@@ -413,8 +803,207 @@ STRING = AdsStringDatatype
 # Duration time. The most siginificant digit is one millisecond. The data type
 # is handled internally like DWORD.
 TIME = AdsTimeDatatype()
-TIME_OF_DAY = TIME  # only semantically different from TIME
+TIME_OF_DAY = AdsTimeOfDayDatatype()
 TOD = TIME_OF_DAY  # alias
 DATE = AdsDateDatatype()
 DATE_AND_TIME = AdsDateAndTimeDatatype()
 DT = DATE_AND_TIME  # alias
+
+
+# names of the elementary data types as used in PLC code and in the symbol
+# table
+ELEMENTARY_DATATYPES = {
+    'BOOL': BOOL,
+    'BYTE': BYTE,
+    'WORD': WORD,
+    'DWORD': DWORD,
+    'SINT': SINT,
+    'USINT': USINT,
+    'INT': INT,
+    'UINT': UINT,
+    'DINT': DINT,
+    'UDINT': UDINT,
+    'REAL': REAL,
+    'LREAL': LREAL,
+    'TIME': TIME,
+    'TIME_OF_DAY': TIME_OF_DAY,
+    'TOD': TOD,
+    'DATE': DATE,
+    'DATE_AND_TIME': DATE_AND_TIME,
+    'DT': DT,
+}
+for _datatype in ELEMENTARY_DATATYPES.values():
+    # shared by everyone just like interned data types
+    _datatype.freeze()
+del _datatype
+
+# number of data types kept by an AdsDatatypeFactory by default
+DATATYPE_CACHE_SIZE = 1024
+
+ARRAY_SYMTYPE_RE = re.compile(r'^ARRAY\s*\[(.+)\]\s*OF\s+(.+)$', re.I)
+STRING_SYMTYPE_RE = re.compile(r'^STRING\s*(?:\(\s*(\d+)\s*\))?$', re.I)
+DIMENSION_RE = re.compile(r'^\s*(-?\d+)\s*\.\.\s*(-?\d+)\s*$')
+
+
+def parse_array_symtype(symtype):
+    """Splits an array type like 'ARRAY [0..3,1..4] OF UINT' into the list
+    of dimensions [(0, 3), (1, 4)] and the element type 'UINT'. Returns
+    None if symtype is not an array type.
+    """
+    match = ARRAY_SYMTYPE_RE.match(symtype.strip())
+    if match is None:
+        return None
+    dimensions = []
+    for dimension in match.group(1).split(','):
+        bounds = DIMENSION_RE.match(dimension)
+        if bounds is None:
+            raise PyadsTypeError(
+                "Unsupported array dimension %r in %r." % (
+                    dimension, symtype))
+        dimensions.append((int(bounds.group(1)), int(bounds.group(2))))
+    return dimensions, match.group(2).strip()
+
+
+def _parse_symtype(symtype, factory):
+    symtype = symtype.strip()
+    datatype = ELEMENTARY_DATATYPES.get(symtype.upper())
+    if datatype is not None:
+        return datatype
+    match = STRING_SYMTYPE_RE.match(symtype)
+    if match is not None:
+        # STRING(n) occupies n + 1 bytes in the PLC (terminating NULL)
+        return factory.string(int(match.group(1) or 80) + 1)
+    array = parse_array_symtype(symtype)
+    if array is not None:
+        dimensions, element_symtype = array
+        return factory.array(factory.parse(element_symtype), dimensions)
+    raise PyadsTypeError("Unsupported data type %r." % symtype)
+
+
+def _dimensions_key(dimensions):
+    """Normalizes the dimensions argument of AdsArrayDatatype to a tuple of
+    (start, end) tuples.
+    """
+    if isinstance(dimensions, (int, long)):
+        return ((0, int(dimensions) - 1),)
+    if isinstance(dimensions, (list, tuple)):
+        return tuple((int(start), int(end)) for start, end in dimensions)
+    raise TypeError(
+        "The dimensions parameter must be either int or a list of "
+        "tuples. %s was given." % type(dimensions))
+
+
+class AdsDatatypeFactory(object):
+    """Interns data types: returns the same frozen instance (with its
+    compiled struct) for every request of the same type specification, so
+    that constructing 'ARRAY [0..99] OF REAL' or STRING(80) in a loop costs
+    a dict lookup.
+
+    The cache keeps the max_size most recently used data types. A hit
+    doesn't take the lock, it only stamps the entry with the value of a
+    lookup counter; the stamps are compared when a miss has to evict an
+    entry.
+    """
+    def __init__(self, max_size=DATATYPE_CACHE_SIZE):
+        self.max_size = max_size
+        # key => data type, key => stamp of the last lookup
+        self._cache = {}
+        self._last_used = {}
+        self._lookups = itertools.count()
+        self._lock = threading.Lock()
+        # hits are counted without the lock and may miss an increment when
+        # threads race, misses and evictions are exact
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _intern(self, key, create, *args):
+        datatype = self._cache.get(key)
+        self._last_used[key] = next(self._lookups)
+        if datatype is not None:
+            self.hits += 1
+            return datatype
+        # create outside of the lock, parsing a symtype interns its element
+        # types recursively
+        try:
+            datatype = create(*args).freeze()
+        except Exception:
+            # e.g. unsupported symtypes, which aren't cached
+            self._last_used.pop(key, None)
+            raise
+        with self._lock:
+            self.misses += 1
+            # another thread may have interned the same type meanwhile, keep
+            # the instance handed out first
+            datatype = self._cache.setdefault(key, datatype)
+            while len(self._cache) > self.max_size:
+                oldest = min(self._cache, key=self._last_used.get)
+                del self._cache[oldest]
+                del self._last_used[oldest]
+                self.evictions += 1
+        return datatype
+
+    def array(self, data_type, dimensions):
+        """Returns the interned AdsArrayDatatype(data_type, dimensions).
+        data_type is compared by identity, so pass interned or elementary
+        element types.
+        """
+        dims = _dimensions_key(dimensions)
+        return self._intern(
+            ('ARRAY', data_type, dims), AdsArrayDatatype, data_type,
+            list(dims))
+
+    def string(self, str_length=80):
+        """Returns the interned STRING(str_length)."""
+        str_length = int(str_length)
+        return self._intern(
+            ('STRING', str_length), AdsStringDatatype, str_length)
+
+    def parse(self, symtype):
+        """Returns the interned data type of a symtype, c.f.
+        parse_symtype().
+        """
+        return self._intern(
+            ('SYMTYPE', symtype.strip().upper()), _parse_symtype, symtype,
+            self)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._last_used.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._cache),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# the factory used by parse_symtype(), array_datatype() and string_datatype()
+DATATYPE_FACTORY = AdsDatatypeFactory()
+
+
+def array_datatype(data_type, dimensions):
+    """Interned version of AdsArrayDatatype(data_type, dimensions)."""
+    return DATATYPE_FACTORY.array(data_type, dimensions)
+
+
+def string_datatype(str_length=80):
+    """Interned version of STRING(str_length)."""
+    return DATATYPE_FACTORY.string(str_length)
+
+
+def parse_symtype(symtype):
+    """Returns the AdsDatatype of a type as written in PLC code and in the
+    symtype of AdsSymbol, e.g. 'INT', 'STRING(20)' or
+    'ARRAY [0..3,1..4] OF UINT'. The returned data types are interned, see
+    AdsDatatypeFactory.
+
+    Raises PyadsTypeError for types that can't be represented, e.g.
+    structures and function blocks.
+    """
+    return DATATYPE_FACTORY.parse(symtype)
@@ -0,0 +1,368 @@
+"""High-rate recording of PLC variables into memory-mapped column files.
+
+AdsHistorian samples a fixed set of symbols with as few range reads as
+possible (see AdsReadPlan) and appends the raw little endian bytes of each
+value to a preallocated, memory-mapped column file per signal. Because the
+PLC already delivers fixed-width little endian data, no decoding or
+formatting happens while recording.
+
+Recordings are split into segments of a fixed number of rows. Each segment
+is a directory containing one column file for the timestamps and one column
+file per signal. When a segment is full, recording continues in a new
+segment and the oldest segments are deleted once max_segments is exceeded,
+which bounds both disk usage and the size of the mapped memory.
+
+AdsHistorianReader maps the column files as NumPy arrays and returns the
+samples of a time range without parsing any data. Range lookups rely on
+the timestamps of a segment being non-decreasing, so sample() derives them
+from the monotonic clock, anchored to the wall clock time the historian was
+created at.
+"""
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .adsdatatypes import AdsDatatype
+from .adsdatatypes import NUMPY_TYPE_CODES
+from .adsexception import PyadsException
+from .adsreadplan import AdsReadPlan
+from .adssymbol import AdsSymbol
+from .adsutils import PeriodicRunner
+from .adsutils import monotonic
+
+
+HISTORIAN_MAGIC = b'ADSHIST1'
+# magic (8 bytes) + number of rows written (UInt64)
+HISTORIAN_HEADER = struct.Struct('<8sQ')
+# timestamps are stored as seconds since the epoch (float64)
+TIMESTAMP_FORMAT = 'd'
+METADATA_FILE = 'historian.json'
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})$')
+
+
+def numpy_dtype_descr(pack_format):
+    """Converts the pack_format of an AdsDatatype into a (little endian) NumPy
+    dtype description, e.g. 'h' -> '<i2', '10h' -> ('<i2', (10,)) and
+    '80s' -> 'S80'.
+    """
+    match = re.match(r'^[<=]?(\d*)([?bBhHiIlLqQfds])$', pack_format)
+    if match is None:
+        raise PyadsException(
+            "Can't derive a fixed-width column type from pack format "
+            "'%s'." % pack_format)
+    count = int(match.group(1) or 1)
+    code = match.group(2)
+    if code == 's':
+        return 'S%d' % count
+    descr = '<' + NUMPY_TYPE_CODES[code]
+    if match.group(1):
+        return (descr, (count,))
+    return descr
+
+
+class _ColumnFile(object):
+    """A preallocated, memory-mapped file of fixed-width rows."""
+    def __init__(self, path, row_size, capacity):
+        self.path = path
+        self.row_size = row_size
+        size = HISTORIAN_HEADER.size + row_size * capacity
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        HISTORIAN_HEADER.pack_into(self._map, 0, HISTORIAN_MAGIC, 0)
+
+    def write_row(self, row, data):
+        start = HISTORIAN_HEADER.size + row * self.row_size
+        self._map[start:start + self.row_size] = data
+
+    def set_row_count(self, count):
+        HISTORIAN_HEADER.pack_into(self._map, 0, HISTORIAN_MAGIC, count)
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class _Segment(object):
+    def __init__(self, path, signals, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.row_count = 0
+        self.last_timestamp = None
+        os.makedirs(path)
+        self._timestamps = _ColumnFile(
+            os.path.join(path, 'timestamp.col'),
+            struct.calcsize('<' + TIMESTAMP_FORMAT), capacity)
+        self._columns = [
+            _ColumnFile(
+                os.path.join(path, signal.file_name),
+                signal.datatype.byte_count, capacity)
+            for signal in signals]
+
+    @property
+    def is_full(self):
+        return self.row_count >= self.capacity
+
+    def append(self, timestamp, raw_values):
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            raise PyadsException(
+                "Timestamp %r is before the previous row (%r)." %
+                (timestamp, self.last_timestamp))
+        row = self.row_count
+        for column, raw in zip(self._columns, raw_values):
+            column.write_row(row, raw)
+        self._timestamps.write_row(
+            row, struct.pack('<' + TIMESTAMP_FORMAT, timestamp))
+        # publish the row only after all values have been written so readers
+        # never see partially written rows
+        self.row_count += 1
+        self.last_timestamp = timestamp
+        self._timestamps.set_row_count(self.row_count)
+
+    def close(self):
+        for column in self._columns:
+            column.close()
+        self._timestamps.close()
+
+
+class AdsHistorianSignal(object):
+    """A recorded PLC variable and the column file it is stored in."""
+    def __init__(self, symbol, datatype, file_name):
+        self.symbol = symbol
+        self.datatype = datatype
+        self.file_name = file_name
+        self.dtype_descr = numpy_dtype_descr(datatype.pack_format)
+
+    @property
+    def name(self):
+        return self.symbol.name
+
+
+class AdsHistorian(object):
+    """Records PLC variables into memory-mapped column files."""
+    def __init__(
+            self, client, symbols, directory, segment_rows=100000,
+            max_segments=None, max_gap=0):
+        """
+        client: connected AdsClient instance
+        symbols: iterable of (symbol, AdsDatatype) tuples. symbol is either
+            an AdsSymbol or a variable name, in which case the index group and
+            offset are looked up with client.get_info_by_name().
+        directory: directory the recording is stored in. It is created if it
+            does not exist. An existing recording is continued; it must have
+            the same signals and segment_rows.
+        segment_rows: number of samples per segment file
+        max_segments: number of segments to keep on disk, older segments are
+            deleted. None keeps all segments.
+        max_gap: passed on to AdsReadPlan
+        """
+        self.client = client
+        self.directory = directory
+        self.segment_rows = int(segment_rows)
+        self.max_segments = max_segments
+        self.signals = []
+        for idx, (symbol, datatype) in enumerate(symbols):
+            if not isinstance(symbol, AdsSymbol):
+                symbol = client.get_info_by_name(symbol)
+            assert(isinstance(datatype, AdsDatatype))
+            self.signals.append(AdsHistorianSignal(
+                symbol, datatype, 'signal-%04d.col' % idx))
+        self.plan = AdsReadPlan(
+            [(signal.symbol, signal.datatype) for signal in self.signals],
+            max_gap=max_gap)
+
+        self._segment = None
+        self._segment_index = 0
+        self._lock = threading.Lock()
+        # PeriodicRunner calling sample() while recording
+        self._recorder = None
+        # (wall clock, monotonic clock) the sample timestamps are based on
+        self._clock_anchor = (time.time(), monotonic())
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._write_metadata()
+        existing = AdsHistorianReader.list_segments(directory)
+        if existing:
+            self._segment_index = existing[-1][0]
+
+    def _write_metadata(self):
+        metadata = {
+            'timestamp_format': '<' + TIMESTAMP_FORMAT,
+            'segment_rows': self.segment_rows,
+            'signals': [{
+                'name': signal.name,
+                'file': signal.file_name,
+                'pack_format': signal.datatype.pack_format,
+                'byte_count': signal.datatype.byte_count,
+            } for signal in self.signals],
+        }
+        path = os.path.join(self.directory, METADATA_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                existing = json.load(f)
+            # compare after a round trip so str and unicode compare equal
+            if json.loads(json.dumps(metadata)) != existing:
+                raise PyadsException(
+                    "%s holds a recording of different signals or segment "
+                    "rows." % self.directory)
+            return
+        with open(path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+    def _start_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_index += 1
+        path = os.path.join(
+            self.directory, 'segment-%06d' % self._segment_index)
+        self._segment = _Segment(path, self.signals, self.segment_rows)
+        self._drop_old_segments()
+
+    def _drop_old_segments(self):
+        if self.max_segments is None:
+            return
+        segments = AdsHistorianReader.list_segments(self.directory)
+        for _, path in segments[:-self.max_segments]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def append(self, timestamp, raw_values):
+        """Appends one row of raw values (in the order of self.signals).
+        Timestamps must not decrease within a segment.
+        """
+        with self._lock:
+            if self._segment is None or self._segment.is_full:
+                self._start_segment()
+            self._segment.append(timestamp, raw_values)
+
+    def sample(self):
+        """Reads all signals from the PLC once and appends them."""
+        raw = self.plan.read_raw_list(self.client)
+        wall, start = self._clock_anchor
+        timestamp = wall + (monotonic() - start)
+        self.append(timestamp, raw)
+        return timestamp
+
+    def start(self, rate):
+        """Starts recording in a background thread at rate samples per
+        second.
+        """
+        if self._recorder is not None:
+            raise PyadsException("The historian is already recording.")
+        self._recorder = PeriodicRunner(
+            self.sample, 1.0 / rate, 'Recording a historian sample')
+        self._recorder.start()
+
+    def stop(self):
+        if self._recorder is not None:
+            self._recorder.stop()
+            self._recorder = None
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.close()
+
+
+class AdsHistorianReader(object):
+    """Returns recorded samples as NumPy arrays."""
+    def __init__(self, directory):
+        if numpy is None:
+            raise PyadsException(
+                "AdsHistorianReader requires NumPy to be installed.")
+        self.directory = directory
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.signals = dict(
+            (signal['name'], signal) for signal in self.metadata['signals'])
+
+    @staticmethod
+    def list_segments(directory):
+        """Returns a sorted list of (segment index, path) tuples."""
+        segments = []
+        for entry in os.listdir(directory):
+            match = SEGMENT_PATTERN.match(entry)
+            if match is not None:
+                segments.append(
+                    (int(match.group(1)), os.path.join(directory, entry)))
+        return sorted(segments)
+
+    def _map_column(self, path, dtype, rows):
+        return numpy.memmap(
+            path, dtype=dtype, mode='r', offset=HISTORIAN_HEADER.size,
+            shape=(rows,))
+
+    def _row_count(self, segment_path):
+        header = numpy.memmap(
+            os.path.join(segment_path, 'timestamp.col'), dtype=numpy.uint8,
+            mode='r', shape=(HISTORIAN_HEADER.size,))
+        magic, count = HISTORIAN_HEADER.unpack(header.tostring())
+        if magic != HISTORIAN_MAGIC:
+            raise PyadsException(
+                "%s is not a historian column file." % segment_path)
+        return count
+
+    def read(self, start=None, end=None, names=None):
+        """Returns a dict mapping 'timestamp' and the signal names to NumPy
+        arrays of all samples with start <= timestamp < end.
+
+        start, end: seconds since the epoch, None means unbounded
+        names: list of signal names to return, None returns all signals
+        """
+        if names is None:
+            names = [signal['name'] for signal in self.metadata['signals']]
+        timestamp_dtype = numpy.dtype(self.metadata['timestamp_format'])
+        parts = dict((name, []) for name in names)
+        parts['timestamp'] = []
+        for _, path in self.list_segments(self.directory):
+            rows = self._row_count(path)
+            if rows == 0:
+                continue
+            timestamps = self._map_column(
+                os.path.join(path, 'timestamp.col'), timestamp_dtype, rows)
+            first = 0 if start is None else numpy.searchsorted(
+                timestamps, start, side='left')
+            last = rows if end is None else numpy.searchsorted(
+                timestamps, end, side='left')
+            if first >= last:
+                continue
+            parts['timestamp'].append(timestamps[first:last])
+            for name in names:
+                signal = self.signals[name]
+                column = self._map_column(
+                    os.path.join(path, signal['file']),
+                    numpy.dtype(numpy_dtype_descr(signal['pack_format'])),
+                    rows)
+                parts[name].append(column[first:last])
+        result = {}
+        for name, arrays in parts.items():
+            if len(arrays) == 1:
+                # single segment: return a view of the mapped file
+                result[name] = arrays[0]
+            elif arrays:
+                result[name] = numpy.concatenate(arrays)
+            else:
+                dtype = timestamp_dtype if name == 'timestamp' else \
+                    numpy.dtype(numpy_dtype_descr(
+                        self.signals[name]['pack_format']))
+                result[name] = numpy.empty((0,), dtype=dtype)
+        return result
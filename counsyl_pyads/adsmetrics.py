@@ -0,0 +1,258 @@
+"""Lightweight latency and traffic metrics collected by AdsClient.
+
+AdsMetrics keeps a latency histogram per ADS command and index group, a
+histogram of the time spent waiting for admission per priority class, byte
+counters, in-flight/timeout/retry/reconnect/dropped-packet counters and
+counts of ADS error codes. Each recorded event costs one short lock
+acquisition, and latencies additionally a bisect into a short list of bucket
+bounds; a request records five events (started, admission wait, bytes sent,
+bytes received, finished), so the metrics can stay enabled in production.
+stats() returns a plain dict snapshot and prometheus() renders
+the same data in the Prometheus text exposition format.
+"""
+from bisect import bisect_left
+import threading
+
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COMMAND_NAMES = {
+    0x0001: 'device_info',
+    0x0002: 'read',
+    0x0003: 'write',
+    0x0004: 'read_state',
+    0x0005: 'write_control',
+    0x0006: 'add_notification',
+    0x0007: 'delete_notification',
+    0x0008: 'notification',
+    0x0009: 'read_write',
+}
+
+
+def _format_code(code):
+    if isinstance(code, int):
+        return '%#x' % code
+    return str(code).replace('"', "'")
+
+
+class AdsLatencyHistogram(object):
+    """Histogram of latencies with fixed bucket bounds (LATENCY_BUCKETS)."""
+    def __init__(self):
+        # one additional bucket for latencies above the largest bound
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Estimates the q-th percentile (0..100) as the upper bound of the
+        bucket containing it.
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if idx < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[idx], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': list(zip(
+                LATENCY_BUCKETS + (float('inf'),), self.counts)),
+        }
+
+
+class AdsMetrics(object):
+    """Collects per-command metrics of an AdsClient."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (command id, index group) -> AdsLatencyHistogram
+            self.latencies = {}
+            self.requests = 0
+            self.in_flight = 0
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.timeouts = 0
+            self.retries = 0
+            self.connects = 0
+            self.dropped_packets = 0
+            # ADS error code -> count
+            self.errors = {}
+            # priority class name -> AdsLatencyHistogram of the time spent
+            # waiting before the request could be sent
+            self.priority_waits = {}
+
+    @property
+    def reconnects(self):
+        return max(self.connects - 1, 0)
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def request_finished(self, command_id, index_group, seconds):
+        key = (command_id, index_group)
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self.latencies.get(key)
+            if histogram is None:
+                histogram = self.latencies[key] = AdsLatencyHistogram()
+            histogram.observe(seconds)
+
+    def request_failed(self, command_id, index_group, seconds, error_code):
+        self.request_finished(command_id, index_group, seconds)
+        with self._lock:
+            self.errors[error_code] = self.errors.get(error_code, 0) + 1
+
+    def waited(self, priority_name, seconds):
+        with self._lock:
+            histogram = self.priority_waits.get(priority_name)
+            if histogram is None:
+                histogram = self.priority_waits[priority_name] = \
+                    AdsLatencyHistogram()
+            histogram.observe(seconds)
+
+    def sent(self, byte_count):
+        with self._lock:
+            self.bytes_sent += byte_count
+
+    def received(self, byte_count):
+        with self._lock:
+            self.bytes_received += byte_count
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def connected(self):
+        with self._lock:
+            self.connects += 1
+
+    def packet_dropped(self):
+        with self._lock:
+            self.dropped_packets += 1
+
+    def stats(self):
+        """Returns a snapshot of all metrics as dict."""
+        with self._lock:
+            latencies = [{
+                'command_id': command_id,
+                'command': COMMAND_NAMES.get(command_id, str(command_id)),
+                'index_group': index_group,
+                'latency': histogram.snapshot(),
+            } for (command_id, index_group), histogram in sorted(
+                self.latencies.items(), key=lambda item: (
+                    item[0][0], item[0][1] is not None, item[0][1]))]
+            return {
+                'requests': self.requests,
+                'in_flight': self.in_flight,
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'timeouts': self.timeouts,
+                'retries': self.retries,
+                'connects': self.connects,
+                'reconnects': self.reconnects,
+                'dropped_packets': self.dropped_packets,
+                'errors': dict(self.errors),
+                'latencies': latencies,
+                'priority_waits': dict(
+                    (name, histogram.snapshot())
+                    for name, histogram in self.priority_waits.items()),
+            }
+
+    def prometheus(self, prefix='pyads'):
+        """Renders the metrics in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = []
+
+        def add(name, metric_type, help_text, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, metric_type))
+            for suffix, labels, value in samples:
+                label_str = ','.join(
+                    '%s="%s"' % (key, val) for key, val in labels)
+                lines.append('%s_%s%s%s %s' % (
+                    prefix, name, suffix,
+                    '{%s}' % label_str if label_str else '',
+                    repr(value) if isinstance(value, float) else value))
+
+        add('requests_total', 'counter', 'ADS requests sent.',
+            [('', [], stats['requests'])])
+        add('requests_in_flight', 'gauge', 'ADS requests awaiting a response.',
+            [('', [], stats['in_flight'])])
+        add('sent_bytes_total', 'counter', 'Bytes sent to the device.',
+            [('', [], stats['bytes_sent'])])
+        add('received_bytes_total', 'counter',
+            'Bytes received from the device.',
+            [('', [], stats['bytes_received'])])
+        add('timeouts_total', 'counter', 'Requests without a response.',
+            [('', [], stats['timeouts'])])
+        add('retries_total', 'counter',
+            'Rejected requests that were sent again.',
+            [('', [], stats['retries'])])
+        add('reconnects_total', 'counter', 'Connections re-established.',
+            [('', [], stats['reconnects'])])
+        add('dropped_packets_total', 'counter',
+            'Received packets without a matching request.',
+            [('', [], stats['dropped_packets'])])
+        add('errors_total', 'counter', 'ADS error codes returned.', [
+            ('', [('code', _format_code(code))], count)
+            for code, count in sorted(stats['errors'].items())])
+
+        def histogram_samples(labels, snapshot):
+            samples = []
+            cumulative = 0
+            for bound, count in snapshot['buckets']:
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append(
+                    ('_bucket', labels + [('le', le)], cumulative))
+            samples.append(('_sum', labels, snapshot['sum']))
+            samples.append(('_count', labels, snapshot['count']))
+            return samples
+
+        samples = []
+        for entry in stats['latencies']:
+            labels = [('command', entry['command'])]
+            if entry['index_group'] is not None:
+                labels.append(('index_group', '%#x' % entry['index_group']))
+            samples.extend(histogram_samples(labels, entry['latency']))
+        add('request_duration_seconds', 'histogram',
+            'Round-trip time of ADS requests.', samples)
+
+        samples = []
+        for name, snapshot in sorted(stats['priority_waits'].items()):
+            samples.extend(histogram_samples([('priority', name)], snapshot))
+        add('priority_wait_seconds', 'histogram',
+            'Time requests waited before they could be sent.', samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,340 @@
+"""Hierarchical access to the symbols of a PLC.
+
+AdsSymbolNamespace turns the flat symbol table of AdsClient.get_symbols()
+into a tree whose nodes are reached by attribute and item access:
+
+    client.symbols.MAIN.speed.read()
+    client.symbols.MAIN.axis[3].write(1.5)
+    client.symbols.MAIN.read()      # all variables of MAIN
+
+The symbol table is uploaded on first access and node objects are only
+created for the paths that are actually used. Each node caches its handle,
+AdsDatatype (parsed from the symtype, see parse_symtype()) and address.
+Elements of arrays of elementary types are addressed directly even though
+the symbol table only lists the array itself.
+
+Reading a node without a data type of its own reads all variables below it
+with one sum read request (see AdsReadPlan) and returns the values as
+nested OrderedDicts. Attributes of the node classes take precedence over
+PLC names; use item access (node['read']) for PLC variables named like
+one of them.
+"""
+from collections import OrderedDict
+import re
+import threading
+
+from .adsdatatypes import AdsArrayDatatype
+from .adsdatatypes import parse_array_symtype
+from .adsdatatypes import parse_symtype
+from .adsexception import PyadsException
+from .adsexception import PyadsTypeError
+from .adsreadplan import AdsReadPlan
+from .adssymbol import AdsSymbol
+
+
+PATH_TOKEN_RE = re.compile(r'\.?([^.\[\]]+)|\[([^\]]*)\]')
+
+
+def parse_symbol_path(name):
+    """Splits a symbol name like 'MAIN.axis[3].position' into its path
+    components ['MAIN', 'axis', 3, 'position']. Indices of multidimensional
+    arrays are tuples ('MAIN.m[1,2]' => ['MAIN', 'm', (1, 2)]).
+    """
+    path = []
+    for member, index in PATH_TOKEN_RE.findall(name):
+        if member:
+            path.append(member)
+            continue
+        try:
+            indices = tuple(int(idx) for idx in index.split(','))
+        except ValueError:
+            raise PyadsException("Invalid index in symbol name %r." % name)
+        path.append(indices[0] if len(indices) == 1 else indices)
+    return path
+
+
+def format_symbol_path(path):
+    """Inverse of parse_symbol_path()."""
+    name = ''
+    for component in path:
+        if isinstance(component, tuple):
+            name += '[%s]' % ','.join(str(idx) for idx in component)
+        elif isinstance(component, (int, long)):
+            name += '[%d]' % component
+        else:
+            name += ('.' if name else '') + component
+    return name
+
+
+def _key(component):
+    # PLC names are case insensitive
+    if isinstance(component, basestring):
+        return component.upper()
+    return component
+
+
+class AdsSymbolNode(object):
+    """A symbol or a group of symbols (e.g. a program) of the namespace."""
+    def __init__(self, namespace, path, symbol=None, datatype=None):
+        self._namespace = namespace
+        self._path = path
+        self.symbol = symbol
+        self._datatype = datatype
+        self._handle = None
+        self._plan = None
+
+    @property
+    def name(self):
+        if self.symbol is not None:
+            return self.symbol.name
+        return format_symbol_path(self._path)
+
+    @property
+    def datatype(self):
+        """The AdsDatatype of the symbol, None if the node is no symbol or
+        its type can't be represented (e.g. a function block).
+        """
+        if self._datatype is None and self.symbol is not None:
+            try:
+                self._datatype = parse_symtype(self.symbol.symtype)
+            except PyadsTypeError:
+                self._datatype = False
+        return self._datatype or None
+
+    @property
+    def index_group(self):
+        return self._require_symbol().index_group
+
+    @property
+    def index_offset(self):
+        return self._require_symbol().index_offset
+
+    @property
+    def handle(self):
+        if self._handle is None:
+            self._require_symbol()
+            self._handle = self._namespace.client.get_handle_by_name(
+                self.name)
+        return self._handle
+
+    def _require_symbol(self):
+        if self.symbol is None:
+            raise PyadsException("%s is not a symbol." % self.name)
+        return self.symbol
+
+    def _require_datatype(self):
+        datatype = self.datatype
+        if datatype is None:
+            raise PyadsTypeError(
+                "The data type of %s is unknown." % self.name)
+        return datatype
+
+    def children(self):
+        return [
+            self._namespace._node(self._path + [component])
+            for component in self._namespace._child_components(self._path)]
+
+    def __dir__(self):
+        return sorted(set(dir(type(self)) + list(self.__dict__) + [
+            component for component in
+            self._namespace._child_components(self._path)
+            if isinstance(component, basestring)]))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        node = self._namespace._node(self._path + [name], required=False)
+        if node is None:
+            raise AttributeError(
+                "%s has no member %s." % (self.name, name))
+        return node
+
+    def __getitem__(self, key):
+        node = self._namespace._node(self._path + [key], required=False)
+        if node is None and isinstance(key, (int, long, tuple)):
+            node = self._element(key)
+        if node is None:
+            raise KeyError(
+                "%s has no member %s." % (self.name, key))
+        return node
+
+    def _element(self, index):
+        """Returns the node of an array element, which the symbol table
+        doesn't list.
+        """
+        datatype = self.datatype
+        if not isinstance(datatype, AdsArrayDatatype):
+            return None
+        indices = index if isinstance(index, tuple) else (index,)
+        if len(indices) != len(datatype.dimensions):
+            raise PyadsTypeError(
+                "%s has %d dimensions, %d indices given." % (
+                    self.name, len(datatype.dimensions), len(indices)))
+        flat_index = 0
+        for idx, (start, end) in zip(indices, datatype.dimensions):
+            if not start <= idx <= end:
+                raise IndexError(
+                    "Index %d of %s is out of bounds %d..%d." % (
+                        idx, self.name, start, end))
+            flat_index = flat_index * (end - start + 1) + idx - start
+        element = datatype.data_type
+        symbol = AdsSymbol(
+            self.symbol.index_group,
+            self.symbol.index_offset + flat_index * element.byte_count,
+            self.symbol.name + format_symbol_path([index]),
+            parse_array_symtype(self.symbol.symtype)[1], '')
+        return self._namespace._add_node(
+            self._path + [index], symbol, element)
+
+    def leaves(self):
+        """Returns the nodes of all variables below this node (or this node
+        if it is one). Raises PyadsTypeError if the data type of a variable
+        is unknown, i.e. it can't be parsed and the symbol table lists no
+        members of the variable.
+        """
+        if self.datatype is not None:
+            return [self]
+        children = self.children()
+        if not children and self.symbol is not None:
+            raise PyadsTypeError(
+                "The data type %s of %s is unknown." %
+                (self.symbol.symtype, self.name))
+        leaves = []
+        for child in children:
+            leaves.extend(child.leaves())
+        return leaves
+
+    def read(self):
+        """Reads the value of the variable or, if the node has no data type,
+        the values of all variables below it as nested OrderedDict.
+        """
+        datatype = self.datatype
+        client = self._namespace.client
+        if datatype is not None:
+            response = client.read(
+                self.symbol.index_group, self.symbol.index_offset,
+                datatype.byte_count)
+            return datatype.unpack(response.data)
+        if self._plan is None:
+            leaves = self.leaves()
+            self._plan = (leaves, AdsReadPlan(
+                [(leaf.symbol, leaf.datatype) for leaf in leaves]))
+        leaves, plan = self._plan
+        values = plan.execute_list(client, batched=True)
+        result = OrderedDict()
+        depth = len(self._path)
+        for leaf, value in zip(leaves, values):
+            parent = result
+            for component in leaf._path[depth:-1]:
+                parent = parent.setdefault(component, OrderedDict())
+            parent[leaf._path[-1]] = value
+        return result
+
+    def write(self, value):
+        datatype = self._require_datatype()
+        self._namespace.client.write(
+            self.symbol.index_group, self.symbol.index_offset,
+            datatype.pack(value))
+
+    def __repr__(self):
+        return '<AdsSymbolNode %s>' % self.name
+
+
+class AdsSymbolNamespace(object):
+    """Tree of the symbols of the PLC of an AdsClient, see the module
+    documentation.
+    """
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.RLock()
+        self._loaded = False
+
+    def reload(self):
+        """Uploads the symbol table again, e.g. after an online change.
+        Nodes obtained before keep referring to the old table.
+        """
+        symbols = self.client.get_symbols()
+        with self._lock:
+            # path key -> AdsSymbol
+            self._symbols = {}
+            # parent path key -> OrderedDict(child key -> component)
+            self._children = {}
+            # path key -> AdsSymbolNode, created on demand
+            self._nodes = {}
+            for symbol in symbols:
+                path = parse_symbol_path(symbol.name)
+                keys = tuple(_key(component) for component in path)
+                self._symbols[keys] = symbol
+                for depth, component in enumerate(path):
+                    self._children.setdefault(
+                        keys[:depth], OrderedDict()).setdefault(
+                            keys[depth], component)
+            self._loaded = True
+
+    def _load(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.reload()
+
+    def _child_components(self, path):
+        self._load()
+        keys = tuple(_key(component) for component in path)
+        return list(self._children.get(keys, {}).values())
+
+    def _node(self, path, required=True):
+        self._load()
+        keys = tuple(_key(component) for component in path)
+        with self._lock:
+            node = self._nodes.get(keys)
+            if node is not None:
+                return node
+            if keys and (
+                    keys not in self._symbols and keys not in self._children):
+                if required:
+                    raise PyadsException(
+                        "Symbol %s not found." % format_symbol_path(path))
+                return None
+            # use the spelling of the symbol table
+            parent = self._children.get(keys[:-1], {}) if keys else {}
+            if keys:
+                path = path[:-1] + [parent.get(keys[-1], path[-1])]
+            node = self._nodes[keys] = AdsSymbolNode(
+                self, path, self._symbols.get(keys))
+            return node
+
+    def _add_node(self, path, symbol, datatype):
+        keys = tuple(_key(component) for component in path)
+        with self._lock:
+            node = self._nodes.get(keys)
+            if node is None:
+                node = self._nodes[keys] = AdsSymbolNode(
+                    self, path, symbol, datatype)
+            return node
+
+    @property
+    def root(self):
+        return self._node([])
+
+    def get(self, name):
+        """Returns the node of a symbol name like 'MAIN.axis[3]'."""
+        node = self.root
+        try:
+            for component in parse_symbol_path(name):
+                node = node[component]
+        except KeyError:
+            raise PyadsException("Symbol %s not found." % name)
+        return node
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.root, name)
+
+    def __getitem__(self, key):
+        return self.root[key]
+
+    def __dir__(self):
+        return sorted(set(dir(type(self)) + list(self.__dict__) + [
+            component for component in self._child_components([])
+            if isinstance(component, basestring)]))
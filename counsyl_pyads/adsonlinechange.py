@@ -0,0 +1,241 @@
+"""Detection of online changes of the PLC program.
+
+An online change may move, retype, add or remove symbols, after which
+handles and data types resolved before point at the wrong memory. The PLC
+increments its symbol version (ADSIGRP_SYM_VERSION) whenever the symbol
+table changes. AdsOnlineChangeWatcher polls the version and the upload info
+(symbol count and table size), which costs two small reads, and only when
+one of them changed uploads the symbol table again and compares it with the
+previous one by name, type, index group and index offset.
+
+The watcher keeps the handles and data types of the symbols its users asked
+for. After a change it releases and resolves again the handles of the
+changed symbols only, forgets the data types of changed symbols and drops
+both for removed symbols. Listeners registered with add_listener() are
+called with the AdsSymbolTableDiff, e.g. to rebuild an AdsReadPlan.
+"""
+import logging
+import threading
+
+from .constants import ADSIGRP_SYM_UPLOADINFO2
+from .adsconstants import ADSIGRP_SYM_VERSION
+from .adsexception import AdsException
+from .adsexception import PyadsException
+from .adssymbolindex import AdsSymbolIndex
+from .adsutils import PeriodicRunner
+
+
+logger = logging.getLogger(__name__)
+
+
+def _symbol_key(symbol):
+    return (symbol.symtype, symbol.index_group, symbol.index_offset)
+
+
+class AdsSymbolTableDiff(object):
+    """Names of the symbols that were added, removed or changed (in type or
+    address) between two symbol tables.
+    """
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return '<AdsSymbolTableDiff added=%r removed=%r changed=%r>' % (
+            self.added, self.removed, self.changed)
+
+
+def diff_symbol_tables(old, new):
+    """Compares two lists of AdsSymbol objects. Names are compared case
+    insensitively, like the PLC does.
+    """
+    old_by_name = dict((symbol.name.upper(), symbol) for symbol in old)
+    new_by_name = dict((symbol.name.upper(), symbol) for symbol in new)
+    added = [
+        symbol.name for symbol in new
+        if symbol.name.upper() not in old_by_name]
+    removed = [
+        symbol.name for symbol in old
+        if symbol.name.upper() not in new_by_name]
+    changed = [
+        symbol.name for symbol in new
+        if symbol.name.upper() in old_by_name and
+        _symbol_key(old_by_name[symbol.name.upper()]) != _symbol_key(symbol)]
+    return AdsSymbolTableDiff(added, removed, changed)
+
+
+class AdsOnlineChangeWatcher(object):
+    """Tracks the symbol table of the PLC of an AdsClient."""
+    def __init__(self, client, datatype_factory=None):
+        """
+        client: AdsClient
+        datatype_factory: callable returning the AdsDatatype of an
+            AdsSymbol, used by datatype()
+        """
+        self.client = client
+        self.datatype_factory = datatype_factory
+        self.version = None
+        self.upload_info = None
+        # upper case name -> AdsSymbol
+        self.symbols = {}
+        self.changes = 0
+        self._index = None
+        self._handles = {}
+        self._datatypes = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+        # PeriodicRunner calling check() while polling
+        self._poller = None
+
+    def _read_version(self):
+        version = self.client.read(ADSIGRP_SYM_VERSION, 0x0000, 1).data
+        upload_info = self.client.read(
+            ADSIGRP_SYM_UPLOADINFO2, 0x0000, 24).data
+        return version, upload_info
+
+    def sync(self):
+        """Uploads the symbol table without comparing it with the previous
+        one.
+        """
+        with self._lock:
+            self.version, self.upload_info = self._read_version()
+            self.symbols = dict(
+                (symbol.name.upper(), symbol)
+                for symbol in self.client.get_symbols())
+            self._index = None
+
+    def check(self):
+        """Checks whether the symbol table changed and updates handles and
+        data types if it did. Returns the AdsSymbolTableDiff, which is empty
+        if nothing changed.
+        """
+        with self._lock:
+            if self.version is None:
+                self.sync()
+                return AdsSymbolTableDiff([], [], [])
+            version, upload_info = self._read_version()
+            if version == self.version and upload_info == self.upload_info:
+                return AdsSymbolTableDiff([], [], [])
+            old = self.symbols.values()
+            self.sync()
+            diff = diff_symbol_tables(old, self.symbols.values())
+            if diff:
+                self.changes += 1
+                self._apply(diff)
+        if diff:
+            for listener in list(self._listeners):
+                try:
+                    listener(diff)
+                except Exception:
+                    logger.exception(
+                        "Online change listener %r failed" % listener)
+        return diff
+
+    def _apply(self, diff):
+        stale = [
+            name.upper() for name in diff.changed + diff.removed
+            if name.upper() in self._handles]
+        for name in diff.changed + diff.removed:
+            self._datatypes.pop(name.upper(), None)
+        if not stale:
+            return
+        # a handle of a moved symbol may still be valid on the PLC, release
+        # it; failures are expected for handles the PLC already dropped
+        self.client.release_handles(
+            [self._handles.pop(name) for name in stale])
+        resolve = [name for name in stale if name in self.symbols]
+        handles = self.client.get_handles_by_names(resolve)
+        for name, handle in zip(resolve, handles):
+            if isinstance(handle, AdsException):
+                logger.warning(
+                    "Resolving the handle of %s failed: %s" % (name, handle))
+            else:
+                self._handles[name] = handle
+
+    def add_listener(self, listener):
+        """Registers a callable that receives the AdsSymbolTableDiff of
+        every detected change.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def symbol(self, name):
+        try:
+            return self.symbols[name.upper()]
+        except KeyError:
+            raise PyadsException("Symbol %s not found." % name)
+
+    def index(self):
+        """Returns the AdsSymbolIndex of the current symbol table, which is
+        built on first use after every change.
+        """
+        with self._lock:
+            if self.version is None:
+                self.sync()
+            if self._index is None:
+                self._index = AdsSymbolIndex(
+                    self.symbols.values(),
+                    version=ord(self.version[:1] or '\0'))
+            return self._index
+
+    def handle(self, name):
+        """Returns the handle of the symbol, resolving it on first use."""
+        key = name.upper()
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                handle = self._handles[key] = \
+                    self.client.get_handle_by_name(name)
+            return handle
+
+    def datatype(self, name):
+        """Returns the AdsDatatype of the symbol built by datatype_factory,
+        creating it on first use.
+        """
+        key = name.upper()
+        with self._lock:
+            datatype = self._datatypes.get(key)
+            if datatype is None:
+                if self.datatype_factory is None:
+                    raise PyadsException(
+                        "The watcher has no datatype_factory.")
+                if self.version is None:
+                    self.sync()
+                datatype = self._datatypes[key] = self.datatype_factory(
+                    self.symbol(name))
+            return datatype
+
+    def start(self, interval):
+        """Starts checking for online changes every interval seconds in a
+        background thread.
+        """
+        if self._poller is not None:
+            raise PyadsException("The watcher is already polling.")
+        self._poller = PeriodicRunner(
+            self.check, interval, 'Checking for online changes')
+        self._poller.start()
+
+    def stop(self):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+
+    def stats(self):
+        return {
+            'symbols': len(self.symbols),
+            'handles': len(self._handles),
+            'datatypes': len(self._datatypes),
+            'changes': self.changes,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.stop()
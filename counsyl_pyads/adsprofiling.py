@@ -0,0 +1,113 @@
+"""Stage-level profiling of requests executed by AdsClient.
+
+When at least one profiling hook is registered with
+AdsClient.add_profiling_hook(), every request is traced with nanosecond
+timestamps for each stage of the request pipeline:
+
+    encode           command -> AmsPacket (to_ams_packet/CreateRequest)
+    frame            AmsPacket -> AMS/TCP frame (GetBinaryData, TCP header)
+    send             writing the frame to the socket
+    wait             network and PLC until the response frame was received
+    frame_decode     AMS/TCP frame -> AmsPacket (in the reader thread)
+    wakeup           until the requesting thread picked up the response
+    response_decode  AmsPacket -> AdsResponse (CreateResponse)
+    datatype_decode  raw bytes -> Python value (read_by_handle/read_by_name)
+
+A hook is any callable that receives the finished AdsRequestTrace.
+AdsSlowestRequestsProfiler is a sampling hook that keeps the N slowest
+requests with their stage breakdown. Without registered hooks no timestamps
+are taken.
+"""
+import heapq
+import threading
+
+from .adsmetrics import COMMAND_NAMES
+from .adsutils import monotonic_ns
+
+
+STAGES = (
+    'encode', 'frame', 'send', 'wait', 'frame_decode', 'wakeup',
+    'response_decode', 'datatype_decode')
+
+
+def now_ns():
+    """Current time of a monotonic clock in integer nanoseconds (see
+    adsutils.monotonic_ns()). Only differences of timestamps are
+    meaningful, but they aren't distorted by changes of the system time.
+    """
+    return monotonic_ns()
+
+
+class AdsRequestTrace(object):
+    """Timestamps of the stages of a single request."""
+    def __init__(self, command_id, index_group=None):
+        self.command_id = command_id
+        self.index_group = index_group
+        self.invoke_id = None
+        self.error = None
+        self.start_ns = now_ns()
+        self.end_ns = None
+        # list of (stage, start_ns, end_ns) in order of execution
+        self.stages = []
+
+    def add_stage(self, stage, start_ns, end_ns):
+        self.stages.append((stage, start_ns, end_ns))
+        self.end_ns = max(self.end_ns or end_ns, end_ns)
+
+    @property
+    def duration_ns(self):
+        return (self.end_ns or self.start_ns) - self.start_ns
+
+    def breakdown(self):
+        """Returns a dict mapping stage name to nanoseconds spent in it."""
+        result = {}
+        for stage, start, end in self.stages:
+            result[stage] = result.get(stage, 0) + (end - start)
+        return result
+
+    def __str__(self):
+        header = "%s%s invoke id %s: %.1f us%s" % (
+            COMMAND_NAMES.get(self.command_id, self.command_id),
+            '' if self.index_group is None else
+            ' (index group %#x)' % self.index_group,
+            self.invoke_id, self.duration_ns / 1e3,
+            '' if self.error is None else ' [%s]' % self.error)
+        lines = [header]
+        for stage, start, end in self.stages:
+            lines.append("  %-16s %10.1f us" % (stage, (end - start) / 1e3))
+        return "\n".join(lines)
+
+
+class AdsSlowestRequestsProfiler(object):
+    """Profiling hook that keeps the traces of the N slowest requests."""
+    def __init__(self, n=20):
+        self.n = n
+        self.count = 0
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def __call__(self, trace):
+        with self._lock:
+            self.count += 1
+            # the counter keeps heap entries comparable for equal durations
+            entry = (trace.duration_ns, self.count, trace)
+            if len(self._heap) < self.n:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest(self):
+        """Returns the recorded traces, slowest first."""
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._heap, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self._heap = []
+
+    def report(self):
+        traces = self.slowest()
+        lines = ["Slowest %d of %d requests:" % (len(traces), self.count)]
+        lines.extend(str(trace) for trace in traces)
+        return "\n".join(lines)
@@ -0,0 +1,272 @@
+"""Planner that merges reads of neighbouring PLC variables into range reads.
+
+Reading variables one by one by name costs one round trip per variable. Many
+variables, however, are located next to each other in the same index group
+(e.g. in the %M memory area). AdsReadPlan uses the index group and index offset
+of each symbol (as returned by AdsClient.get_symbols()) to merge the variables
+into a minimal number of ReadCommands and slices each value out of the shared
+response buffer.
+"""
+from collections import OrderedDict
+
+from .adsdatatypes import AdsDatatype
+from .adsexception import AdsException
+from .adsexception import PyadsException
+from .adssymbol import AdsSymbol
+
+
+# Sizes of the protocol overhead of a single request/response pair, used to
+# estimate the number of bytes sent over the wire.
+AMS_TCP_HEADER_SIZE = 6
+AMS_HEADER_SIZE = 32
+# index group, index offset, length
+READ_REQUEST_SIZE = 12
+# index group, index offset, read length, write length
+READ_WRITE_REQUEST_SIZE = 16
+# error code, length
+READ_RESPONSE_SIZE = 8
+
+
+class AdsReadRange(object):
+    """A single ReadCommand covering one or more symbols of an index group."""
+    def __init__(self, index_group, index_offset):
+        self.index_group = index_group
+        self.index_offset = index_offset
+        self.length = 0
+        # list of (position, AdsSymbol, AdsDatatype) tuples in order of index
+        # offset; position is the index of the symbol in AdsReadPlan.symbols
+        self.members = []
+
+    @property
+    def end_offset(self):
+        return self.index_offset + self.length
+
+    def add(self, symbol, ads_data_type, position=None):
+        if position is None:
+            position = len(self.members)
+        end = symbol.index_offset + ads_data_type.byte_count
+        self.length = max(self.length, end - self.index_offset)
+        self.members.append((position, symbol, ads_data_type))
+
+    def covered_bytes(self):
+        """Returns the number of bytes of this range used by at least one
+        member symbol.
+        """
+        covered = 0
+        end = self.index_offset
+        for _, symbol, ads_data_type in self.members:
+            start = max(end, symbol.index_offset)
+            end = max(end, symbol.index_offset + ads_data_type.byte_count)
+            covered += max(0, end - start)
+        return covered
+
+    def slices(self, data):
+        """Slices the raw bytes of all member symbols out of the response data
+        of this range and returns a list of (position, raw) tuples.
+        """
+        if len(data) < self.length:
+            raise PyadsException(
+                "Read of {length} bytes at {group:#x}:{offset:#x} returned "
+                "only {received} bytes.".format(
+                    length=self.length,
+                    group=self.index_group,
+                    offset=self.index_offset,
+                    received=len(data)))
+        result = []
+        for position, symbol, ads_data_type in self.members:
+            start = symbol.index_offset - self.index_offset
+            end = start + ads_data_type.byte_count
+            result.append((position, data[start:end]))
+        return result
+
+    def unpack(self, data):
+        """Slices the values of all member symbols out of the response data
+        of this range and returns a list of (position, value) tuples.
+        """
+        datatypes = dict(
+            (position, ads_data_type)
+            for position, _, ads_data_type in self.members)
+        return [
+            (position, datatypes[position].unpack(raw))
+            for position, raw in self.slices(data)]
+
+    def __str__(self):
+        return "%#x:%#x (%d bytes, %d symbols)" % (
+            self.index_group, self.index_offset, self.length,
+            len(self.members))
+
+
+class AdsReadPlanReport(object):
+    """Compares the number of requests and bytes of a read plan with reading
+    each symbol individually by name.
+    """
+    def __init__(self, plan):
+        self.naive_requests = len(plan.symbols)
+        self.planned_requests = len(plan.ranges)
+
+        self.payload_bytes = sum(
+            ads_data_type.byte_count for _, ads_data_type in plan.symbols)
+        self.planned_payload_bytes = sum(rng.length for rng in plan.ranges)
+        covered_bytes = sum(rng.covered_bytes() for rng in plan.ranges)
+        # bytes read in the gaps between symbols that are thrown away
+        self.gap_bytes = self.planned_payload_bytes - covered_bytes
+        # bytes of overlapping symbols (e.g. a struct and one of its
+        # members) that are read once for several symbols
+        self.overlap_bytes = self.payload_bytes - covered_bytes
+
+        overhead = 2 * (AMS_TCP_HEADER_SIZE + AMS_HEADER_SIZE)
+        self.naive_bytes = sum(
+            overhead + READ_WRITE_REQUEST_SIZE + len(symbol.name) + 1 +
+            READ_RESPONSE_SIZE + ads_data_type.byte_count
+            for symbol, ads_data_type in plan.symbols)
+        self.planned_bytes = sum(
+            overhead + READ_REQUEST_SIZE + READ_RESPONSE_SIZE + rng.length
+            for rng in plan.ranges)
+
+    @property
+    def saved_requests(self):
+        return self.naive_requests - self.planned_requests
+
+    @property
+    def saved_bytes(self):
+        return self.naive_bytes - self.planned_bytes
+
+    def __str__(self):
+        return (
+            "Requests: {planned} instead of {naive} (saves {saved_req})\n"
+            "Bytes on the wire: {planned_bytes} instead of {naive_bytes} "
+            "(saves {saved_bytes})\n"
+            "Payload bytes: {planned_payload} for {payload} bytes of data "
+            "({gap} gap bytes, {overlap} overlapping bytes)".format(
+                planned=self.planned_requests,
+                naive=self.naive_requests,
+                saved_req=self.saved_requests,
+                planned_bytes=self.planned_bytes,
+                naive_bytes=self.naive_bytes,
+                saved_bytes=self.saved_bytes,
+                planned_payload=self.planned_payload_bytes,
+                payload=self.payload_bytes,
+                gap=self.gap_bytes,
+                overlap=self.overlap_bytes))
+
+
+class AdsReadPlan(object):
+    """Merges the reads of a set of symbols into a minimal set of range reads.
+    """
+    def __init__(self, symbols, max_gap=0, max_read_size=None):
+        """
+        symbols: iterable of (AdsSymbol, AdsDatatype) tuples. The symbols are
+            usually taken from AdsClient.get_symbols() or
+            AdsClient.get_info_by_name().
+        max_gap: number of unused bytes between two symbols of the same index
+            group that may be read (and thrown away) in order to merge both
+            symbols into a single read.
+        max_read_size: upper limit for the number of bytes of a single range
+            read. Symbols larger than this limit are read on their own.
+        """
+        self.max_gap = int(max_gap)
+        self.max_read_size = max_read_size
+        self.symbols = []
+        for symbol, ads_data_type in symbols:
+            assert(isinstance(symbol, AdsSymbol))
+            assert(isinstance(ads_data_type, AdsDatatype))
+            self.symbols.append((symbol, ads_data_type))
+        self.ranges = self._build_ranges()
+
+    def _build_ranges(self):
+        ranges = []
+        ordered = sorted(
+            enumerate(self.symbols),
+            key=lambda item: (item[1][0].index_group, item[1][0].index_offset))
+        current = None
+        for position, (symbol, ads_data_type) in ordered:
+            if current is None or not self._can_merge(
+                    current, symbol, ads_data_type):
+                current = AdsReadRange(
+                    symbol.index_group, symbol.index_offset)
+                ranges.append(current)
+            current.add(symbol, ads_data_type, position)
+        return ranges
+
+    def _can_merge(self, current, symbol, ads_data_type):
+        if symbol.index_group != current.index_group:
+            return False
+        if symbol.index_offset > current.end_offset + self.max_gap:
+            return False
+        if self.max_read_size is not None:
+            end = max(
+                current.end_offset,
+                symbol.index_offset + ads_data_type.byte_count)
+            if end - current.index_offset > self.max_read_size:
+                return False
+        return True
+
+    def execute(self, client, batched=False):
+        """Performs all range reads using the AdsClient instance client and
+        returns an OrderedDict mapping symbol names to values, in the order
+        in which the symbols were passed to the constructor. Raises
+        PyadsException if several symbols have the same name, see
+        execute_list().
+
+        batched: send all range reads in one sum read request (see
+            AdsClient.sum_read()) instead of one request per range
+        """
+        return self._by_name(self.execute_list(client, batched))
+
+    def execute_list(self, client, batched=False):
+        """Like execute() but returns a list of the values in the order in
+        which the symbols were passed to the constructor.
+        """
+        values = [None] * len(self.symbols)
+        for rng, data in zip(self.ranges, self._read_ranges(client, batched)):
+            for position, value in rng.unpack(data):
+                values[position] = value
+        return values
+
+    def read_raw(self, client, batched=False):
+        """Like execute() but returns the raw (little endian) bytes of each
+        symbol instead of the unpacked values.
+        """
+        return self._by_name(self.read_raw_list(client, batched))
+
+    def read_raw_list(self, client, batched=False):
+        """Like execute_list() but returns the raw (little endian) bytes of
+        each symbol instead of the unpacked values.
+        """
+        values = [None] * len(self.symbols)
+        for rng, data in zip(self.ranges, self._read_ranges(client, batched)):
+            for position, raw in rng.slices(data):
+                values[position] = raw
+        return values
+
+    def _by_name(self, values):
+        result = OrderedDict(
+            (symbol.name, value)
+            for (symbol, _), value in zip(self.symbols, values))
+        if len(result) != len(values):
+            raise PyadsException(
+                "The read plan reads several symbols of the same name, use "
+                "execute_list() or read_raw_list().")
+        return result
+
+    def _read_ranges(self, client, batched):
+        """Returns the response data of all ranges."""
+        if not batched or len(self.ranges) == 1:
+            return [client.read(
+                indexGroup=rng.index_group,
+                indexOffset=rng.index_offset,
+                length=rng.length).data for rng in self.ranges]
+        results = client.sum_read([
+            (rng.index_group, rng.index_offset, rng.length)
+            for rng in self.ranges])
+        for error, _ in results:
+            if error:
+                raise AdsException(error)
+        return [data for _, data in results]
+
+    def report(self):
+        return AdsReadPlanReport(self)
+
+    def __str__(self):
+        return "AdsReadPlan:\n%s" % "\n".join(
+            str(rng) for rng in self.ranges)
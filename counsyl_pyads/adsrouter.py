@@ -0,0 +1,481 @@
+"""Local AMS router sharing one PLC connection between many processes.
+
+AdsRouter listens on a Unix socket. Local processes connect to it with an
+AdsClient using AdsUnixTransport and exchange ordinary AMS/TCP frames. The
+router forwards the frames of all local connections over a single upstream
+TCP connection per PLC (selected by the target AMS net id of each frame):
+
+    client A --\\                         /-- PLC 1
+    client B ---+-- Unix socket -- router
+    client C --/                         \\-- PLC 2
+
+The invoke id of every forwarded request is rewritten to an id that is
+unique on the upstream connection, so responses can be routed back to the
+local connection that sent the request (with its original invoke id
+restored). Device notifications are routed by their notification handle,
+which the router learns from the responses to AddDeviceNotification
+requests. Notification handles of a local connection that goes away are
+deleted on the PLC.
+
+Frames are rewritten in place; the router never decodes full AmsPackets.
+
+    with AdsRouter('/tmp/ads-router.sock') as router:
+        ...
+
+    client = AdsClient(
+        conn, transport=AdsUnixTransport('/tmp/ads-router.sock'))
+"""
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+
+from .adstransport import ADS_PORT_DEFAULT
+from .adstransport import AdsTcpTransport
+from .adsutils import monotonic
+
+
+logger = logging.getLogger(__name__)
+
+
+ADSCOMMAND_ADDDEVICENOTE = 0x0006
+ADSCOMMAND_DELDEVICENOTE = 0x0007
+ADSCOMMAND_DEVICENOTE = 0x0008
+
+AMS_STATE_FLAGS_REQUEST = 0x0004
+AMS_STATE_FLAGS_RESPONSE = 0x0005
+
+# AMS error sent back to local connections if the PLC can't be reached
+ADSERR_TARGET_MACHINE_NOT_FOUND = 0x0007
+
+# AMS header: target net id and port, source net id and port, command id,
+# state flags, data length, error code, invoke id
+AMS_HEADER = struct.Struct('<6sH6sHHHIII')
+AMS_HEADER_SIZE = AMS_HEADER.size
+AMS_COMMAND_OFFSET = 16
+AMS_INVOKE_ID_OFFSET = 28
+
+# seconds a frame may take to be sent to a PLC before the upstream connection
+# is given up (the socket timeout only paces the receive loop)
+UPSTREAM_SEND_TIMEOUT = 5.0
+
+
+def format_ams_id(data):
+    return '.'.join(str(byte) for byte in bytearray(data))
+
+
+class _LocalConnection(object):
+    """A process connected to the router."""
+    def __init__(self, sock):
+        self.socket = sock
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def send(self, ams_frame):
+        with self._send_lock:
+            try:
+                self.socket.sendall(
+                    struct.pack('<HI', 0, len(ams_frame)) + bytes(ams_frame))
+            except socket.error:
+                # the reader thread of the connection cleans up
+                logger.debug("Could not send to local connection")
+
+
+class _Upstream(object):
+    """The shared TCP connection to one PLC."""
+    def __init__(self, router, ams_id, transport):
+        self.router = router
+        self.ams_id = ams_id
+        self.transport = transport
+        self.socket = None
+        # set once a send failed; the connection is replaced on the next
+        # request
+        self.failed = False
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._next_invoke_id = 1
+        # upstream invoke id -> (local connection, original invoke id,
+        #     command id, AMS addresses, request data)
+        self._pending = {}
+        # notification handle -> (local connection, AMS addresses)
+        self._notifications = {}
+
+    def open(self):
+        self.socket = self.transport.open()
+        self.socket.settimeout(0.1)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def forward(self, local, frame):
+        """Forwards a request frame (bytearray) of a local connection."""
+        command_id = struct.unpack_from('<H', frame, AMS_COMMAND_OFFSET)[0]
+        original_id = struct.unpack_from('<I', frame, AMS_INVOKE_ID_OFFSET)[0]
+        with self._lock:
+            invoke_id = self._next_invoke_id
+            self._next_invoke_id = (invoke_id % 0xFFFFFFFF) + 1
+            self._pending[invoke_id] = (
+                local, original_id, command_id, bytes(frame[:16]),
+                bytes(frame[AMS_HEADER_SIZE:]))
+        struct.pack_into('<I', frame, AMS_INVOKE_ID_OFFSET, invoke_id)
+        try:
+            self.send(frame)
+        except socket.error:
+            with self._lock:
+                entry = self._pending.pop(invoke_id, None)
+            struct.pack_into('<I', frame, AMS_INVOKE_ID_OFFSET, original_id)
+            if entry is not None:
+                raise
+            # else fail_pending() already answered the request
+
+    def send(self, frame):
+        with self._send_lock:
+            if self.socket is None or self.failed:
+                raise socket.error("Upstream connection closed")
+            data = memoryview(
+                struct.pack('<HI', 0, len(frame)) + bytes(frame))
+            deadline = monotonic() + UPSTREAM_SEND_TIMEOUT
+            try:
+                while len(data):
+                    try:
+                        sent = self.socket.send(data)
+                    except socket.timeout:
+                        if monotonic() >= deadline:
+                            raise
+                        continue
+                    data = data[sent:]
+            except socket.error:
+                # part of the frame may have been sent, the connection is
+                # out of sync with the PLC; shutting it down wakes up the
+                # receiving thread, which fails the pending requests
+                self.fail()
+                raise
+
+    def fail(self):
+        self.failed = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def dispatch(self, frame):
+        """Routes a frame received from the PLC to its local connection."""
+        command_id = struct.unpack_from('<H', frame, AMS_COMMAND_OFFSET)[0]
+        if command_id == ADSCOMMAND_DEVICENOTE:
+            self._dispatch_notification(frame)
+            return
+        invoke_id = struct.unpack_from('<I', frame, AMS_INVOKE_ID_OFFSET)[0]
+        with self._lock:
+            entry = self._pending.pop(invoke_id, None)
+            if entry is None:
+                self.router.count('dropped_frames')
+                return
+            local, original_id, _, addresses, request = entry
+            result = None
+            if len(frame) >= AMS_HEADER_SIZE + 4:
+                result = struct.unpack_from('<I', frame, AMS_HEADER_SIZE)[0]
+            if result == 0 and command_id == ADSCOMMAND_ADDDEVICENOTE:
+                handle = struct.unpack_from(
+                    '<I', frame, AMS_HEADER_SIZE + 4)[0]
+                self._notifications[handle] = (local, addresses)
+            elif result == 0 and command_id == ADSCOMMAND_DELDEVICENOTE:
+                handle = struct.unpack_from('<I', request)[0]
+                self._notifications.pop(handle, None)
+        if local is None or local.closed:
+            # response to a request of the router itself or of a local
+            # connection that went away
+            return
+        struct.pack_into('<I', frame, AMS_INVOKE_ID_OFFSET, original_id)
+        self.router.count('forwarded_responses')
+        local.send(frame)
+
+    def _dispatch_notification(self, frame):
+        # notification stream: length, stamp count, then per stamp a
+        # timestamp, sample count and samples of handle, size and data
+        owners = []
+        try:
+            ptr = AMS_HEADER_SIZE + 4
+            stamps = struct.unpack_from('<I', frame, ptr)[0]
+            ptr += 4
+            for _ in range(stamps):
+                samples = struct.unpack_from('<I', frame, ptr + 8)[0]
+                ptr += 12
+                for _ in range(samples):
+                    handle, size = struct.unpack_from('<II', frame, ptr)
+                    ptr += 8 + size
+                    with self._lock:
+                        entry = self._notifications.get(handle)
+                    if entry is not None and entry[0] not in owners:
+                        owners.append(entry[0])
+        except struct.error:
+            logger.debug("Malformed notification frame dropped")
+        if not owners:
+            self.router.count('dropped_frames')
+            return
+        # a frame may contain samples of several owners; every owner gets
+        # the whole frame and ignores the handles it doesn't know
+        # count before sending, the owner may look at stats() as soon as it
+        # received the frame
+        self.router.count('forwarded_notifications')
+        for local in owners:
+            if not local.closed:
+                local.send(frame)
+
+    def fail_pending(self):
+        """Answers all pending requests with an error after the upstream
+        connection was lost. Notifications die with the connection.
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending = {}
+            self._notifications = {}
+        for local, original_id, command_id, addresses, _ in pending:
+            if local is not None and not local.closed:
+                local.send(error_response(
+                    addresses, command_id, original_id,
+                    ADSERR_TARGET_MACHINE_NOT_FOUND))
+
+    def release(self, local):
+        """Forgets a local connection that went away and deletes its
+        notification handles on the PLC.
+        """
+        with self._lock:
+            handles = [
+                (handle, addresses) for handle, (owner, addresses)
+                in self._notifications.items() if owner is local]
+            for handle, _ in handles:
+                del self._notifications[handle]
+        for handle, addresses in handles:
+            data = struct.pack('<I', handle)
+            frame = bytearray(addresses + struct.pack(
+                '<HHIII', ADSCOMMAND_DELDEVICENOTE, AMS_STATE_FLAGS_REQUEST,
+                len(data), 0, 0) + data)
+            try:
+                self.forward(None, frame)
+            except socket.error:
+                break
+
+
+def error_response(addresses, command_id, invoke_id, error_code):
+    """Builds a response frame with an AMS error code for a request sent from
+    the given AMS addresses (the first 16 bytes of the request header).
+    """
+    return AMS_HEADER.pack(
+        addresses[8:14], struct.unpack('<H', addresses[14:16])[0],
+        addresses[0:6], struct.unpack('<H', addresses[6:8])[0],
+        command_id, AMS_STATE_FLAGS_RESPONSE, 0, error_code, invoke_id)
+
+
+class AdsRouter(object):
+    """Forwards AMS frames of local Unix socket connections to the PLCs."""
+    def __init__(self, path, routes=None, connect_timeout=2):
+        """
+        path: path of the Unix socket to listen on
+        routes: dict mapping AMS net ids to (host, port) of the PLC. Net ids
+            without a route are reached at the IP address formed by their
+            first four parts on the default ADS port.
+        connect_timeout: seconds to wait for an upstream connection
+        """
+        self.path = path
+        self.routes = dict(routes or {})
+        self.connect_timeout = connect_timeout
+        self.forwarded_requests = 0
+        self.forwarded_responses = 0
+        self.forwarded_notifications = 0
+        self.dropped_frames = 0
+        self._server_socket = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._upstreams = {}
+        # AMS net id -> lock held while connecting to the PLC
+        self._connect_locks = {}
+        self._locals = []
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._stopping.clear()
+        if os.path.exists(self.path) and \
+                stat.S_ISSOCK(os.stat(self.path).st_mode):
+            # stale socket of a router that wasn't stopped
+            os.unlink(self.path)
+        self._server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server_socket.bind(self.path)
+        self._server_socket.listen(64)
+        self._server_socket.settimeout(0.1)
+        self._start_thread(self._accept_fn)
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._lock:
+            for local in self._locals:
+                local.socket.close()
+            self._locals = []
+            for upstream in self._upstreams.values():
+                upstream.close()
+            self._upstreams = {}
+        if self._server_socket is not None:
+            self._server_socket.close()
+            self._server_socket = None
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'local_connections': len(self._locals),
+                'upstream_connections': len(self._upstreams),
+            }
+        with self._stats_lock:
+            stats.update({
+                'forwarded_requests': self.forwarded_requests,
+                'forwarded_responses': self.forwarded_responses,
+                'forwarded_notifications': self.forwarded_notifications,
+                'dropped_frames': self.dropped_frames,
+            })
+        return stats
+
+    def count(self, counter):
+        """Increments one of the counters reported by stats()."""
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        with self._lock:
+            self._threads.append(thread)
+
+    def _recv_frame(self, sock):
+        """Returns the next AMS frame received on sock as bytearray or None
+        if the connection was closed or the router is stopping.
+        """
+        header = self._recv_exactly(sock, 6)
+        if header is None:
+            return None
+        length = struct.unpack('<I', header[2:6])[0]
+        return self._recv_exactly(sock, length)
+
+    def _recv_exactly(self, sock, length):
+        data = bytearray()
+        while len(data) < length:
+            try:
+                chunk = sock.recv(length - len(data))
+            except socket.timeout:
+                if self._stopping.is_set():
+                    return None
+                continue
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _accept_fn(self):
+        while not self._stopping.is_set():
+            try:
+                conn, _ = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            conn.settimeout(0.1)
+            local = _LocalConnection(conn)
+            with self._lock:
+                self._locals.append(local)
+            self._start_thread(self._local_fn, local)
+
+    def _local_fn(self, local):
+        try:
+            while not self._stopping.is_set():
+                frame = self._recv_frame(local.socket)
+                if frame is None:
+                    break
+                if len(frame) < AMS_HEADER_SIZE:
+                    logger.debug("Invalid AMS frame dropped")
+                    continue
+                self._forward(local, frame)
+        except socket.error:
+            pass
+        local.closed = True
+        local.socket.close()
+        with self._lock:
+            if local in self._locals:
+                self._locals.remove(local)
+            upstreams = list(self._upstreams.values())
+        for upstream in upstreams:
+            upstream.release(local)
+
+    def _forward(self, local, frame):
+        ams_id = format_ams_id(frame[0:6])
+        try:
+            upstream = self._get_upstream(ams_id)
+            upstream.forward(local, frame)
+            self.count('forwarded_requests')
+        except socket.error as ex:
+            logger.warning("Could not forward to %s: %s" % (ams_id, ex))
+            local.send(error_response(
+                bytes(frame[:16]),
+                struct.unpack_from('<H', frame, AMS_COMMAND_OFFSET)[0],
+                struct.unpack_from('<I', frame, AMS_INVOKE_ID_OFFSET)[0],
+                ADSERR_TARGET_MACHINE_NOT_FOUND))
+
+    def _get_upstream(self, ams_id):
+        with self._lock:
+            upstream = self._upstreams.get(ams_id)
+            if upstream is not None and not upstream.failed:
+                return upstream
+            connect_lock = self._connect_locks.setdefault(
+                ams_id, threading.Lock())
+        # the connect lock keeps concurrent first requests to the same PLC
+        # from opening several connections without blocking the requests to
+        # other PLCs
+        with connect_lock:
+            with self._lock:
+                upstream = self._upstreams.get(ams_id)
+                if upstream is not None and not upstream.failed:
+                    return upstream
+            host, port = self.routes.get(ams_id, (
+                '.'.join(ams_id.split('.')[:4]), ADS_PORT_DEFAULT))
+            upstream = _Upstream(self, ams_id, AdsTcpTransport(
+                host, port, timeout=self.connect_timeout))
+            upstream.open()
+            with self._lock:
+                self._upstreams[ams_id] = upstream
+        logger.info("Connected to %s at %s" % (ams_id, upstream.transport))
+        self._start_thread(self._upstream_fn, upstream)
+        return upstream
+
+    def _upstream_fn(self, upstream):
+        try:
+            while not self._stopping.is_set():
+                frame = self._recv_frame(upstream.socket)
+                if frame is None:
+                    break
+                if len(frame) < AMS_HEADER_SIZE:
+                    logger.debug("Invalid AMS frame dropped")
+                    continue
+                upstream.dispatch(frame)
+        except socket.error:
+            pass
+        if self._stopping.is_set():
+            return
+        logger.warning("Lost connection to %s" % upstream.ams_id)
+        with self._lock:
+            if self._upstreams.get(upstream.ams_id) is upstream:
+                del self._upstreams[upstream.ams_id]
+        upstream.close()
+        upstream.fail_pending()
@@ -0,0 +1,91 @@
+"""Priority classes for the commands executed by AdsClient.
+
+Every command passes an AdsPriorityGate before it is sent. The gate admits
+a limited number of commands at a time (one, as long as the client has a
+single request in flight) and always admits the waiting command of the most
+urgent priority class first, in arrival order within a class:
+
+    PRIORITY_CONTROL      safety relevant writes and reads of a controller
+    PRIORITY_INTERACTIVE  default, e.g. requests of a UI
+    PRIORITY_BULK         symbol uploads, large array reads, logging
+
+Commands can't be preempted once they were sent, so large bulk reads are
+split into chunks by AdsClient (see AdsClient.bulk_chunk_size), each of
+which passes the gate on its own and lets urgent commands interleave.
+"""
+import heapq
+import itertools
+import threading
+
+from .adsutils import monotonic
+
+
+PRIORITY_CONTROL = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_CONTROL: 'control',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BULK: 'bulk',
+}
+
+
+class AdsPriorityGate(object):
+    """Admits up to capacity holders at a time, most urgent priority (lowest
+    number) first.
+    """
+    def __init__(self, capacity=1):
+        self._condition = threading.Condition(threading.Lock())
+        self._capacity = capacity
+        self._holders = 0
+        # heap of (priority, arrival) of the waiting acquirers
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        with self._condition:
+            self._capacity = max(1, int(capacity))
+            self._condition.notify_all()
+
+    @property
+    def holders(self):
+        return self._holders
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def acquire(self, priority):
+        """Blocks until admitted and returns the number of seconds waited."""
+        start = monotonic()
+        with self._condition:
+            ticket = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while (self._holders >= self._capacity or
+                        self._waiting[0] != ticket):
+                    self._condition.wait()
+            except BaseException:
+                # e.g. KeyboardInterrupt: a stale ticket at the head of the
+                # queue would block all other acquirers forever
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._holders += 1
+            if self._waiting and self._holders < self._capacity:
+                # the next in line may be admitted as well
+                self._condition.notify_all()
+        return monotonic() - start
+
+    def release(self):
+        with self._condition:
+            self._holders -= 1
+            self._condition.notify_all()
@@ -0,0 +1,232 @@
+"""Base class of in-process ADS servers.
+
+AdsServer implements the AMS/TCP framing on a local TCP port and hands each
+received AmsPacket to handle_request(). It is the base of the PLC simulator
+(adssimulator), the replay server of captures (adscapture) and the server
+of the read cache (adscache).
+"""
+import copy
+import random
+import socket
+import struct
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .amspacket import AmsPacket
+
+
+# ADS command ids
+ADSCOMMAND_DEVICEINFO = 0x0001
+ADSCOMMAND_READ = 0x0002
+ADSCOMMAND_WRITE = 0x0003
+ADSCOMMAND_READSTATE = 0x0004
+ADSCOMMAND_WRITECONTROL = 0x0005
+ADSCOMMAND_READWRITE = 0x0009
+
+# state flags of a response packet (response + ADS command)
+AMS_STATE_FLAGS_RESPONSE = 0x0005
+
+# ADS error codes (c.f. AdsException)
+ADSERR_NOERR = 0x0
+ADSERR_MAILBOX_FULL = 0x4
+ADSERR_DEVICE_SRVNOTSUPP = 0x701
+ADSERR_DEVICE_INVALIDGRP = 0x702
+ADSERR_DEVICE_INVALIDOFFSET = 0x703
+ADSERR_DEVICE_INVALIDSIZE = 0x705
+ADSERR_DEVICE_SYMBOLNOTFOUND = 0x710
+
+
+class AdsServer(object):
+    """Accepts AMS/TCP connections and answers AMS packets.
+
+    Subclasses implement handle_request(), which receives the request
+    AmsPacket and returns the data of the response packet (or None to not
+    respond at all).
+    """
+    def __init__(
+            self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+            split_size=None, split_delay=0.0, mailbox_size=None):
+        """
+        host, port: address to listen on. Port 0 picks a free port, the port
+            actually used is available as self.port after start().
+        latency: seconds to wait before sending each response
+        jitter: maximum number of seconds randomly added to the latency
+        split_size: if set, responses are sent in TCP segments of at most
+            split_size bytes, separated by split_delay seconds
+        mailbox_size: if set, requests are queued in a mailbox of this size
+            and processed one after the other by a separate thread, like in
+            a PLC. Requests arriving while the mailbox is full are rejected
+            with ADS error 0x4.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.split_size = split_size
+        self.split_delay = split_delay
+        self.mailbox_size = mailbox_size
+        self.request_count = 0
+        self.rejected_count = 0
+        self._send_lock = threading.Lock()
+        self._server_socket = None
+        self._connections = []
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._stopping.clear()
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind((self.host, self.port))
+        self._server_socket.listen(16)
+        self._server_socket.settimeout(0.1)
+        self.port = self._server_socket.getsockname()[1]
+        self._start_thread(self._accept_fn)
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        if self._server_socket is not None:
+            self._server_socket.close()
+            self._server_socket = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.stop()
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _accept_fn(self):
+        while not self._stopping.is_set():
+            try:
+                conn, _ = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.settimeout(0.1)
+            self._connections.append(conn)
+            self._start_thread(self._serve_fn, conn)
+
+    def _recv_exactly(self, conn, length):
+        data = b''
+        while len(data) < length:
+            try:
+                chunk = conn.recv(length - len(data))
+            except socket.timeout:
+                if self._stopping.is_set():
+                    return None
+                continue
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _serve_fn(self, conn):
+        mailbox = None
+        if self.mailbox_size:
+            mailbox = queue.Queue()
+            self._start_thread(self._mailbox_fn, conn, mailbox)
+        while not self._stopping.is_set():
+            try:
+                header = self._recv_exactly(conn, 6)
+                if header is None:
+                    break
+                length = struct.unpack('<I', header[2:6])[0]
+                data = self._recv_exactly(conn, length)
+                if data is None:
+                    break
+                if mailbox is None:
+                    self.handle_frame(conn, data)
+                elif mailbox.qsize() >= self.mailbox_size:
+                    self.reject_frame(conn, data, ADSERR_MAILBOX_FULL)
+                else:
+                    mailbox.put(data)
+            except socket.error:
+                break
+        if mailbox is not None:
+            mailbox.put(None)
+        conn.close()
+
+    def _mailbox_fn(self, conn, mailbox):
+        while True:
+            data = mailbox.get()
+            if data is None:
+                break
+            try:
+                self.handle_frame(conn, data)
+            except socket.error:
+                break
+
+    def reject_frame(self, conn, data, error_code):
+        """Answers a received AMS frame immediately with an error code in
+        the AMS header.
+        """
+        request = AmsPacket.from_binary_data(data)
+        self.rejected_count += 1
+        response = self.create_response(request, b'')
+        response.error_code = error_code
+        self.send_packet(conn, response, delay=False)
+
+    def handle_frame(self, conn, data):
+        """Decodes a received AMS frame and sends the response."""
+        request = AmsPacket.from_binary_data(data)
+        self.request_count += 1
+        response_data = self.handle_request(request)
+        if response_data is not None:
+            self.send_packet(
+                conn, self.create_response(request, response_data))
+
+    def create_response(self, request, data):
+        response = copy.copy(request)
+        response.target_ams_id = request.source_ams_id
+        response.target_ams_port = request.source_ams_port
+        response.source_ams_id = request.target_ams_id
+        response.source_ams_port = request.target_ams_port
+        response.state_flags = AMS_STATE_FLAGS_RESPONSE
+        response.error_code = 0
+        response.data = data
+        return response
+
+    def send_packet(self, conn, packet, delay=True):
+        ams_data = packet.GetBinaryData()
+        self.send_frame(
+            conn, struct.pack('<HI', 0, len(ams_data)) + ams_data, delay)
+
+    def send_frame(self, conn, frame, delay=True):
+        seconds = self.latency if delay else 0
+        if delay and self.jitter:
+            seconds += random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+        # with a mailbox, responses and rejections are sent by two threads
+        with self._send_lock:
+            if not self.split_size:
+                conn.sendall(frame)
+                return
+            for start in range(0, len(frame), self.split_size):
+                conn.sendall(frame[start:start + self.split_size])
+                if self.split_delay:
+                    time.sleep(self.split_delay)
+
+    def handle_request(self, request):
+        raise NotImplementedError()
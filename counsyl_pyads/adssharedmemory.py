@@ -0,0 +1,269 @@
+"""Fan-out of live PLC values to local processes through shared memory.
+
+AdsSharedMemoryPublisher reads a fixed set of symbols (with the merged range
+reads of an AdsReadPlan) and writes their raw little endian bytes into a
+memory-mapped file, e.g. in /dev/shm. Any number of AdsSharedMemoryReader
+instances in other processes map the same file and decode values straight
+from the mapping with the AdsDatatype of each signal; nothing is serialized
+or sent over a socket.
+
+Segment layout (all little endian):
+
+    header:  magic b'ADSSHM01', layout checksum (UInt32), payload size
+             (UInt32), sequence (UInt64), timestamp of the sample (float64)
+    payload: the raw bytes of each signal back to back, in the order in
+             which the signals were passed to the publisher
+
+Readers and the publisher must agree on the signal layout; the layout
+checksum (names, pack formats and sizes) is verified when a reader attaches.
+
+Consistency is guaranteed by a sequence lock: the publisher makes the
+sequence odd before it writes and even again afterwards. Readers take the
+sequence before and after decoding and retry if it was odd or changed, so
+readers never block the publisher or each other.
+"""
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from .adsdatatypes import AdsDatatype
+from .adsexception import PyadsException
+from .adsreadplan import AdsReadPlan
+from .adssymbol import AdsSymbol
+from .adsutils import PeriodicRunner
+from .adsutils import monotonic
+
+
+SHM_MAGIC = b'ADSSHM01'
+SHM_HEADER = struct.Struct('<8sIIQd')
+SHM_SEQUENCE = struct.Struct('<Q')
+SHM_SEQUENCE_OFFSET = 16
+SHM_TIMESTAMP = struct.Struct('<d')
+SHM_TIMESTAMP_OFFSET = 24
+
+# seconds a reader waits for a consistent snapshot before giving up
+SNAPSHOT_TIMEOUT_DEFAULT = 1.0
+# longest sleep between two snapshot attempts, seconds
+SNAPSHOT_MAX_BACKOFF = 0.001
+
+
+def layout_checksum(signals):
+    """Checksum of a list of (name, AdsDatatype) tuples."""
+    layout = ';'.join(
+        '%s:%s:%d' % (name.upper(), datatype.pack_format, datatype.byte_count)
+        for name, datatype in signals)
+    return zlib.crc32(layout.encode('utf-8')) & 0xFFFFFFFF
+
+
+def _signal_offsets(signals):
+    """Returns a dict mapping the upper case name of each signal to a tuple
+    (name, datatype, payload offset) and the total payload size. Raises
+    PyadsException if two signals have the same name.
+    """
+    offsets = {}
+    offset = SHM_HEADER.size
+    for name, datatype in signals:
+        if name.upper() in offsets:
+            raise PyadsException("Signal %s is given twice." % name)
+        offsets[name.upper()] = (name, datatype, offset)
+        offset += datatype.byte_count
+    return offsets, offset - SHM_HEADER.size
+
+
+class AdsSharedMemoryPublisher(object):
+    """Publishes the latest values of PLC variables into shared memory."""
+    def __init__(self, client, symbols, path, max_gap=0):
+        """
+        client: connected AdsClient instance
+        symbols: iterable of (symbol, AdsDatatype) tuples. symbol is either
+            an AdsSymbol or a variable name, in which case the index group and
+            offset are looked up with client.get_info_by_name().
+        path: file backing the shared memory, usually in /dev/shm. It is
+            created or overwritten.
+        max_gap: passed on to AdsReadPlan
+        """
+        self.client = client
+        self.path = path
+        pairs = []
+        for symbol, datatype in symbols:
+            if not isinstance(symbol, AdsSymbol):
+                symbol = client.get_info_by_name(symbol)
+            assert(isinstance(datatype, AdsDatatype))
+            pairs.append((symbol, datatype))
+        self.plan = AdsReadPlan(pairs, max_gap=max_gap)
+        self.signals = [(sym.name, datatype) for sym, datatype in pairs]
+        offsets, self.payload_size = _signal_offsets(self.signals)
+        self._offsets = [
+            offsets[name.upper()][2] for name, _ in self.signals]
+        self.sequence = 0
+
+        size = SHM_HEADER.size + self.payload_size
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        SHM_HEADER.pack_into(
+            self._map, 0, SHM_MAGIC, layout_checksum(self.signals),
+            self.payload_size, self.sequence, 0.0)
+
+        # PeriodicRunner calling sample() while publishing
+        self._publisher = None
+
+    def publish(self, timestamp, raw_values):
+        """Writes one sample of raw values (in the order of self.signals)."""
+        # odd sequence: readers retry until the write is complete
+        SHM_SEQUENCE.pack_into(
+            self._map, SHM_SEQUENCE_OFFSET, self.sequence + 1)
+        for offset, raw in zip(self._offsets, raw_values):
+            self._map[offset:offset + len(raw)] = raw
+        SHM_TIMESTAMP.pack_into(self._map, SHM_TIMESTAMP_OFFSET, timestamp)
+        self.sequence += 2
+        SHM_SEQUENCE.pack_into(self._map, SHM_SEQUENCE_OFFSET, self.sequence)
+
+    def sample(self):
+        """Reads all signals from the PLC once and publishes them."""
+        raw = self.plan.read_raw_list(self.client)
+        timestamp = time.time()
+        self.publish(timestamp, raw)
+        return timestamp
+
+    def start(self, rate):
+        """Starts publishing in a background thread at rate samples per
+        second.
+        """
+        if self._publisher is not None:
+            raise PyadsException("The publisher is already running.")
+        self._publisher = PeriodicRunner(
+            self.sample, 1.0 / rate, 'Publishing a shared memory sample')
+        self._publisher.start()
+
+    def stop(self):
+        if self._publisher is not None:
+            self._publisher.stop()
+            self._publisher = None
+
+    def close(self, unlink=False):
+        """Stops publishing and unmaps the segment. Attached readers keep
+        the last published values unless unlink is True, in which case the
+        file is removed.
+        """
+        self.stop()
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+            if unlink:
+                os.unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.close()
+
+
+class AdsSharedMemoryReader(object):
+    """Reads values published by an AdsSharedMemoryPublisher."""
+    def __init__(self, path, signals, timeout=SNAPSHOT_TIMEOUT_DEFAULT):
+        """
+        path: file backing the shared memory
+        signals: list of (name, AdsDatatype) tuples in the same order and
+            with the same data types as passed to the publisher
+        timeout: seconds to keep trying to read a consistent snapshot
+            before giving up
+        """
+        self.path = path
+        self.signals = list(signals)
+        self.timeout = timeout
+        self._offsets, payload_size = _signal_offsets(self.signals)
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, checksum, size, _, _ = SHM_HEADER.unpack_from(self._map, 0)
+        if magic != SHM_MAGIC:
+            self.close()
+            raise PyadsException("%s is not a shared memory segment." % path)
+        if checksum != layout_checksum(self.signals) or size != payload_size:
+            self.close()
+            raise PyadsException(
+                "The signals don't match the layout of the shared memory "
+                "segment %s." % path)
+
+    @property
+    def sequence(self):
+        """Increases with every published sample (by two)."""
+        return SHM_SEQUENCE.unpack_from(self._map, SHM_SEQUENCE_OFFSET)[0]
+
+    def _snapshot(self, entries):
+        deadline = monotonic() + self.timeout
+        backoff = 0
+        while True:
+            before = SHM_SEQUENCE.unpack_from(
+                self._map, SHM_SEQUENCE_OFFSET)[0]
+            if not before & 1:
+                values = [
+                    datatype.unpack_from_buffer(self._map, offset)
+                    for _, datatype, offset in entries]
+                timestamp = SHM_TIMESTAMP.unpack_from(
+                    self._map, SHM_TIMESTAMP_OFFSET)[0]
+                after = SHM_SEQUENCE.unpack_from(
+                    self._map, SHM_SEQUENCE_OFFSET)[0]
+                if before == after:
+                    return before, timestamp, values
+            # the publisher is writing: yield the CPU first, then back off
+            # exponentially so a busy publisher isn't starved by readers
+            if monotonic() >= deadline:
+                raise PyadsException(
+                    "No consistent snapshot of %s within %.3f s." %
+                    (self.path, self.timeout))
+            time.sleep(backoff)
+            backoff = min(
+                SNAPSHOT_MAX_BACKOFF, max(2 * backoff, 0.00001))
+
+    def _entries(self, names):
+        try:
+            return [self._offsets[name.upper()] for name in names]
+        except KeyError as ex:
+            raise PyadsException("Unknown signal %s." % ex.args[0])
+
+    def get(self, name):
+        """Returns the latest published value of the signal name."""
+        return self._snapshot(self._entries([name]))[2][0]
+
+    def read(self, names=None):
+        """Returns a tuple (sequence, timestamp, values) of a consistent
+        snapshot of the given signals (all by default). values is a dict
+        mapping names to values. The sequence is 0 if nothing was published
+        yet.
+        """
+        if names is None:
+            names = [name for name, _ in self.signals]
+        entries = self._entries(names)
+        sequence, timestamp, values = self._snapshot(entries)
+        return sequence, timestamp, dict(
+            (entry[0], value) for entry, value in zip(entries, values))
+
+    def wait(self, sequence, timeout=None, interval=0.001):
+        """Waits until a sample newer than sequence was published. Returns
+        the new sequence or None on timeout.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            current = self.sequence
+            if current > sequence and not current & 1:
+                return current
+            if deadline is not None and monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_value, traceback):
+        self.close()
@@ -0,0 +1,424 @@
+"""In-process ADS server simulating a PLC for tests and benchmarks.
+
+AdsSimulator builds on AdsServer (see adsserver), which implements the
+AMS/TCP framing on a local TCP port, and implements the ADS commands used by
+AdsClient (device info, read, write, read/write, read state, write control)
+over an in-memory symbol table,
+including symbol handles, symbol upload, the symbol version, bit access to
+the process image (ADSIGRP_IOIMAGE_RWIX/RWOX) and the sum commands
+(ADSIGRP_SUMUP_READ/WRITE/READWRITE).
+
+Latency, jitter and splitting of response frames into several TCP segments
+can be injected so that client behaviour under realistic network conditions
+can be verified without a Beckhoff device:
+
+    with AdsSimulator(latency=0.001) as plc:
+        plc.add_symbol('MAIN.counter', INT, 5)
+        conn = AdsConnection(
+            target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+        with AdsClient(conn, tcp_port=plc.port) as client:
+            client.read_by_name('MAIN.counter', INT)
+"""
+from collections import OrderedDict
+import logging
+import struct
+import threading
+
+from .adsbits import BIT_ACCESS_GROUPS
+from .adsconstants import ADSIGRP_SUMUP_READ
+from .adsconstants import ADSIGRP_SUMUP_READWRITE
+from .adsconstants import ADSIGRP_SUMUP_WRITE
+from .adsconstants import ADSIGRP_SYM_HNDBYNAME
+from .adsconstants import ADSIGRP_SYM_INFOBYNAMEEX
+from .adsconstants import ADSIGRP_SYM_RELEASEHND
+from .adsconstants import ADSIGRP_SYM_UPLOAD
+from .adsconstants import ADSIGRP_SYM_UPLOADINFO
+from .adsconstants import ADSIGRP_SYM_VALBYHND
+from .adsconstants import ADSIGRP_SYM_VALBYNAME
+from .adsconstants import ADSIGRP_SYM_VERSION
+from .adsconstants import ADSIGRP_IOIMAGE_RWIB
+from .adsconstants import ADSIGRP_IOIMAGE_RWOB
+from .adsdatatypes import AdsDatatype
+from .adsdatatypes import AdsStringDatatype
+from .adsdatatypes import BOOL
+from .adsdatatypes import BYTE
+from .adsdatatypes import DATE
+from .adsdatatypes import DATE_AND_TIME
+from .adsdatatypes import DINT
+from .adsdatatypes import DWORD
+from .adsdatatypes import INT
+from .adsdatatypes import LREAL
+from .adsdatatypes import REAL
+from .adsdatatypes import SINT
+from .adsdatatypes import TIME
+from .adsdatatypes import TIME_OF_DAY
+from .adsdatatypes import UDINT
+from .adsdatatypes import UINT
+from .adsdatatypes import USINT
+from .adsdatatypes import WORD
+from .adsexception import PyadsException
+from .adsserver import ADSCOMMAND_DEVICEINFO
+from .adsserver import ADSCOMMAND_READ
+from .adsserver import ADSCOMMAND_READSTATE
+from .adsserver import ADSCOMMAND_READWRITE
+from .adsserver import ADSCOMMAND_WRITE
+from .adsserver import ADSCOMMAND_WRITECONTROL
+from .adsserver import ADSERR_DEVICE_INVALIDGRP
+from .adsserver import ADSERR_DEVICE_INVALIDSIZE
+from .adsserver import ADSERR_DEVICE_SRVNOTSUPP
+from .adsserver import ADSERR_DEVICE_SYMBOLNOTFOUND
+from .adsserver import ADSERR_NOERR
+from .adsserver import AdsServer
+from .adsstate import AdsState
+from .adssymbol import AdsSymbol
+from .constants import ADSIGRP_SYM_UPLOADINFO2
+from .constants import PYADS_ENCODING
+
+
+logger = logging.getLogger(__name__)
+
+
+# index group of the %M memory area, the default area for symbols
+ADSIGRP_MEMORY_M = 0x4020
+
+# bit addressed index group -> byte addressed index group of the memory
+BYTE_ACCESS_GROUPS = dict(
+    (bit_group, byte_group)
+    for byte_group, bit_group in BIT_ACCESS_GROUPS.items())
+
+# entry header of the symbol table: entry length, index group, index offset,
+# size, data type id, flags, name length, type length, comment length
+SYMBOL_ENTRY_HEADER = struct.Struct('<IIIIIIHHH')
+
+_DEFAULT_SYMTYPES = [
+    (BOOL, 'BOOL'), (BYTE, 'BYTE'), (WORD, 'WORD'), (DWORD, 'DWORD'),
+    (SINT, 'SINT'), (USINT, 'USINT'), (INT, 'INT'), (UINT, 'UINT'),
+    (DINT, 'DINT'), (UDINT, 'UDINT'), (REAL, 'REAL'), (LREAL, 'LREAL'),
+    (TIME, 'TIME'), (TIME_OF_DAY, 'TIME_OF_DAY'), (DATE, 'DATE'),
+    (DATE_AND_TIME, 'DATE_AND_TIME'),
+]
+
+
+def _default_symtype(datatype):
+    if isinstance(datatype, AdsStringDatatype):
+        # STRING(n) occupies n + 1 bytes in the PLC (terminating NULL)
+        return 'STRING(%d)' % (datatype.byte_count - 1)
+    for known, name in _DEFAULT_SYMTYPES:
+        if datatype is known:
+            return name
+    raise PyadsException(
+        "The symtype must be specified for data type %r." % datatype)
+
+
+class AdsSimulator(AdsServer):
+    """Simulates a PLC with an in-memory symbol table."""
+    def __init__(
+            self, device_name='Simulated PLC', version=(2, 11, 2000),
+            memory_size=0x10000, **kwargs):
+        """
+        device_name, version: returned by the device info command
+        memory_size: initial size of the %M, input and output memory areas
+        kwargs: passed on to AdsServer
+        """
+        super(AdsSimulator, self).__init__(**kwargs)
+        self.device_name = device_name
+        self.version = version
+        self.ads_state = AdsState.Run
+        self.device_state = 0
+        self.symbol_version = 1
+        self.memory = {
+            ADSIGRP_MEMORY_M: bytearray(memory_size),
+            ADSIGRP_IOIMAGE_RWIB: bytearray(memory_size),
+            ADSIGRP_IOIMAGE_RWOB: bytearray(memory_size),
+        }
+        self._next_offset = {}
+        # upper case name -> (AdsSymbol, AdsDatatype)
+        self._symbols = OrderedDict()
+        self._handles = {}
+        self._next_handle = 1
+        self._upload_cache = None
+        self._lock = threading.RLock()
+
+    # BEGIN symbol table
+
+    def add_symbol(
+            self, name, datatype, value=None, index_group=ADSIGRP_MEMORY_M,
+            index_offset=None, symtype=None, comment=''):
+        """Adds a symbol to the simulated PLC and returns its AdsSymbol.
+
+        If index_offset is not given, the symbol is placed right behind the
+        last symbol of the index group.
+        """
+        assert(isinstance(datatype, AdsDatatype))
+        if symtype is None:
+            symtype = _default_symtype(datatype)
+        with self._lock:
+            if index_offset is None:
+                index_offset = self._next_offset.get(index_group, 0)
+            end = index_offset + datatype.byte_count
+            memory = self.memory.setdefault(index_group, bytearray())
+            if len(memory) < end:
+                memory.extend(bytearray(end - len(memory)))
+            self._next_offset[index_group] = max(
+                self._next_offset.get(index_group, 0), end)
+            symbol = AdsSymbol(
+                index_group, index_offset, name, symtype, comment)
+            self._symbols[name.upper()] = (symbol, datatype)
+            self._symbol_table_changed()
+        if value is not None:
+            self.set_value(name, value)
+        return symbol
+
+    def remove_symbol(self, name):
+        with self._lock:
+            del self._symbols[name.upper()]
+            self._symbol_table_changed()
+
+    def _symbol_table_changed(self):
+        self._upload_cache = None
+        self.symbol_version = (self.symbol_version + 1) & 0xFF
+
+    def get_symbol(self, name):
+        try:
+            return self._symbols[name.upper()]
+        except KeyError:
+            raise PyadsException("Symbol %s not found." % name)
+
+    @property
+    def symbols(self):
+        return [symbol for symbol, _ in self._symbols.values()]
+
+    def set_value(self, name, value):
+        symbol, datatype = self.get_symbol(name)
+        self.set_raw(symbol, datatype.pack(value))
+
+    def get_value(self, name):
+        symbol, datatype = self.get_symbol(name)
+        return datatype.unpack(self.get_raw(symbol, datatype.byte_count))
+
+    def set_raw(self, symbol, data):
+        with self._lock:
+            memory = self.memory[symbol.index_group]
+            memory[symbol.index_offset:symbol.index_offset + len(data)] = data
+
+    def get_raw(self, symbol, length):
+        with self._lock:
+            memory = self.memory[symbol.index_group]
+            return bytes(
+                memory[symbol.index_offset:symbol.index_offset + length])
+
+    def _symbol_entry(self, symbol, datatype):
+        name = symbol.name.encode(PYADS_ENCODING)
+        symtype = symbol.symtype.encode(PYADS_ENCODING)
+        comment = symbol.comment.encode(PYADS_ENCODING)
+        body = name + b'\x00' + symtype + b'\x00' + comment + b'\x00'
+        return SYMBOL_ENTRY_HEADER.pack(
+            SYMBOL_ENTRY_HEADER.size + len(body), symbol.index_group,
+            symbol.index_offset, datatype.byte_count, 0, 0,
+            len(name), len(symtype), len(comment)) + body
+
+    def _symbol_upload(self):
+        with self._lock:
+            if self._upload_cache is None:
+                self._upload_cache = b''.join(
+                    self._symbol_entry(symbol, datatype)
+                    for symbol, datatype in self._symbols.values())
+            return self._upload_cache
+
+    def _find_by_name(self, data):
+        name = data.split(b'\x00', 1)[0].decode(PYADS_ENCODING)
+        return self._symbols.get(name.upper())
+
+    # END symbol table
+
+    # BEGIN ADS services
+
+    def handle_request(self, request):
+        handler = {
+            ADSCOMMAND_DEVICEINFO: self._device_info,
+            ADSCOMMAND_READ: self._read_command,
+            ADSCOMMAND_WRITE: self._write_command,
+            ADSCOMMAND_READSTATE: self._read_state,
+            ADSCOMMAND_WRITECONTROL: self._write_control,
+            ADSCOMMAND_READWRITE: self._read_write_command,
+        }.get(request.command_id)
+        if handler is None:
+            return struct.pack('<I', ADSERR_DEVICE_SRVNOTSUPP)
+        return handler(request.data)
+
+    def _device_info(self, data):
+        name = self.device_name.encode(PYADS_ENCODING)[:16]
+        return struct.pack(
+            '<IBBH16s', ADSERR_NOERR, self.version[0], self.version[1],
+            self.version[2], name)
+
+    def _read_state(self, data):
+        return struct.pack(
+            '<IHH', ADSERR_NOERR, self.ads_state, self.device_state)
+
+    def _write_control(self, data):
+        self.ads_state, self.device_state = struct.unpack_from('<HH', data)
+        return struct.pack('<I', ADSERR_NOERR)
+
+    def _read_command(self, data):
+        group, offset, length = struct.unpack_from('<III', data)
+        error, result = self.read(group, offset, length)
+        return struct.pack('<II', error, len(result)) + result
+
+    def _write_command(self, data):
+        group, offset, length = struct.unpack_from('<III', data)
+        error = self.write(group, offset, data[12:12 + length])
+        return struct.pack('<I', error)
+
+    def _read_write_command(self, data):
+        group, offset, read_len, write_len = struct.unpack_from('<IIII', data)
+        error, result = self.read_write(
+            group, offset, read_len, data[16:16 + write_len])
+        return struct.pack('<II', error, len(result)) + result
+
+    def read(self, group, offset, length):
+        """Returns a tuple (error code, data)."""
+        with self._lock:
+            if group == ADSIGRP_SYM_VALBYHND:
+                entry = self._handles.get(offset)
+                if entry is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND, b''
+                symbol, _ = entry
+                return ADSERR_NOERR, self.get_raw(symbol, length)
+            if group == ADSIGRP_SYM_VERSION:
+                return ADSERR_NOERR, struct.pack('<B', self.symbol_version)
+            if group in (ADSIGRP_SYM_UPLOADINFO, ADSIGRP_SYM_UPLOADINFO2):
+                info = struct.pack(
+                    '<IIIIII', len(self._symbols), len(self._symbol_upload()),
+                    0, 0, 0, 0)
+                return ADSERR_NOERR, info[:length]
+            if group == ADSIGRP_SYM_UPLOAD:
+                return ADSERR_NOERR, self._symbol_upload()[:length]
+            if group in BYTE_ACCESS_GROUPS:
+                return self._read_bits(group, offset, length)
+            memory = self.memory.get(group)
+            if memory is None:
+                return ADSERR_DEVICE_INVALIDGRP, b''
+            if offset + length > len(memory):
+                return ADSERR_DEVICE_INVALIDSIZE, b''
+            return ADSERR_NOERR, bytes(memory[offset:offset + length])
+
+    def _read_bits(self, group, offset, length):
+        # one byte, 0 or 1, per bit
+        memory = self.memory[BYTE_ACCESS_GROUPS[group]]
+        if offset + length > len(memory) * 8:
+            return ADSERR_DEVICE_INVALIDSIZE, b''
+        return ADSERR_NOERR, bytes(bytearray(
+            memory[bit // 8] >> bit % 8 & 1
+            for bit in range(offset, offset + length)))
+
+    def write(self, group, offset, data):
+        """Returns the error code."""
+        with self._lock:
+            if group == ADSIGRP_SYM_VALBYHND:
+                entry = self._handles.get(offset)
+                if entry is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND
+                symbol, _ = entry
+                self.set_raw(symbol, data)
+                return ADSERR_NOERR
+            if group == ADSIGRP_SYM_RELEASEHND:
+                handle = struct.unpack_from('<I', data)[0]
+                if self._handles.pop(handle, None) is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND
+                return ADSERR_NOERR
+            if group in BYTE_ACCESS_GROUPS:
+                return self._write_bits(group, offset, data)
+            memory = self.memory.get(group)
+            if memory is None:
+                return ADSERR_DEVICE_INVALIDGRP
+            if offset + len(data) > len(memory):
+                return ADSERR_DEVICE_INVALIDSIZE
+            memory[offset:offset + len(data)] = data
+            return ADSERR_NOERR
+
+    def _write_bits(self, group, offset, data):
+        memory = self.memory[BYTE_ACCESS_GROUPS[group]]
+        if offset + len(data) > len(memory) * 8:
+            return ADSERR_DEVICE_INVALIDSIZE
+        for bit, value in enumerate(bytearray(data), offset):
+            if value:
+                memory[bit // 8] |= 1 << bit % 8
+            else:
+                memory[bit // 8] &= ~(1 << bit % 8)
+        return ADSERR_NOERR
+
+    def read_write(self, group, offset, read_len, data):
+        """Returns a tuple (error code, data)."""
+        if group == ADSIGRP_SUMUP_READ:
+            return self._sum_read(offset, data)
+        if group == ADSIGRP_SUMUP_WRITE:
+            return self._sum_write(offset, data)
+        if group == ADSIGRP_SUMUP_READWRITE:
+            return self._sum_read_write(offset, data)
+        with self._lock:
+            if group == ADSIGRP_SYM_HNDBYNAME:
+                entry = self._find_by_name(data)
+                if entry is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND, b''
+                handle = self._next_handle
+                self._next_handle += 1
+                self._handles[handle] = entry
+                return ADSERR_NOERR, struct.pack('<I', handle)
+            if group == ADSIGRP_SYM_VALBYNAME:
+                entry = self._find_by_name(data)
+                if entry is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND, b''
+                symbol, datatype = entry
+                return ADSERR_NOERR, self.get_raw(
+                    symbol, min(read_len, datatype.byte_count))
+            if group == ADSIGRP_SYM_INFOBYNAMEEX:
+                entry = self._find_by_name(data)
+                if entry is None:
+                    return ADSERR_DEVICE_SYMBOLNOTFOUND, b''
+                symbol_entry = self._symbol_entry(*entry)
+                if len(symbol_entry) > read_len:
+                    return ADSERR_DEVICE_INVALIDSIZE, b''
+                return ADSERR_NOERR, symbol_entry
+        # a read/write on a plain memory area writes, then reads
+        error = self.write(group, offset, data) if data else ADSERR_NOERR
+        if error:
+            return error, b''
+        return self.read(group, offset, read_len)
+
+    def _sum_read(self, count, data):
+        errors = []
+        results = []
+        for idx in range(count):
+            group, offset, length = struct.unpack_from('<III', data, idx * 12)
+            error, result = self.read(group, offset, length)
+            errors.append(struct.pack('<I', error))
+            # the data of failed reads is zero-filled
+            results.append(result if not error else b'\x00' * length)
+        return ADSERR_NOERR, b''.join(errors) + b''.join(results)
+
+    def _sum_write(self, count, data):
+        errors = []
+        ptr = count * 12
+        for idx in range(count):
+            group, offset, length = struct.unpack_from('<III', data, idx * 12)
+            errors.append(struct.pack(
+                '<I', self.write(group, offset, data[ptr:ptr + length])))
+            ptr += length
+        return ADSERR_NOERR, b''.join(errors)
+
+    def _sum_read_write(self, count, data):
+        headers = []
+        results = []
+        ptr = count * 16
+        for idx in range(count):
+            group, offset, read_len, write_len = struct.unpack_from(
+                '<IIII', data, idx * 16)
+            error, result = self.read_write(
+                group, offset, read_len, data[ptr:ptr + write_len])
+            ptr += write_len
+            headers.append(struct.pack('<II', error, len(result)))
+            results.append(result)
+        return ADSERR_NOERR, b''.join(headers) + b''.join(results)
+
+    # END ADS services
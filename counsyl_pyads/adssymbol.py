@@ -1,3 +1,8 @@
+import struct
+
+from .constants import PYADS_ENCODING
+
+
 class AdsSymbol(object):
     def __init__(
             self, index_group, index_offset, name, symtype, comment):
@@ -6,3 +11,46 @@ class AdsSymbol(object):
         self.name = name
         self.symtype = symtype
         self.comment = comment
+
+
+def parse_symbol_entry(data, ptr=0):
+    """Parses the symbol table entry starting at ptr in data, as returned by
+    ADSIGRP_SYM_UPLOAD and ADSIGRP_SYM_INFOBYNAMEEX.
+
+    Returns a tuple (AdsSymbol, entry length in bytes).
+    """
+    read_length = struct.unpack("I", data[ptr+0:ptr+4])[0]
+    index_group = struct.unpack("I", data[ptr+4:ptr+8])[0]
+    index_offset = struct.unpack("I", data[ptr+8:ptr+12])[0]
+    name_length = struct.unpack("H", data[ptr+24:ptr+26])[0]
+    type_length = struct.unpack("H", data[ptr+26:ptr+28])[0]
+    comment_length = struct.unpack("H", data[ptr+28:ptr+30])[0]
+
+    name_start_ptr = ptr + 30
+    name_end_ptr = name_start_ptr + name_length
+    type_start_ptr = name_end_ptr + 1
+    type_end_ptr = type_start_ptr + type_length
+    comment_start_ptr = type_end_ptr + 1
+    comment_end_ptr = comment_start_ptr + comment_length
+
+    name = data[name_start_ptr:name_end_ptr].decode(
+        PYADS_ENCODING).strip(' \t\n\r\0')
+    symtype = data[type_start_ptr:type_end_ptr]
+    comment = data[comment_start_ptr:comment_end_ptr].decode(
+        PYADS_ENCODING).strip(' \t\n\r\0')
+
+    symbol = AdsSymbol(index_group, index_offset, name, symtype, comment)
+    return symbol, read_length
+
+
+def parse_symbol_table(data, sym_count):
+    """Parses sym_count consecutive symbol table entries into a list of
+    AdsSymbol objects.
+    """
+    ptr = 0
+    symbols = []
+    for idx in xrange(sym_count):
+        symbol, read_length = parse_symbol_entry(data, ptr)
+        ptr = ptr + read_length
+        symbols.append(symbol)
+    return symbols
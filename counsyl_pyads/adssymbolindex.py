@@ -0,0 +1,191 @@
+"""Search index over the symbol table of a PLC.
+
+Scanning a list of 100k AdsSymbol objects for every query takes too long
+for interactive search. AdsSymbolIndex is built once per symbol table and
+answers queries from precomputed structures:
+
+    names      upper case names in sorted order; a prefix query is a binary
+               search for the range of names starting with the prefix
+    segments   upper case dotted path segment ('MAIN', 'AXIS', ...) ->
+               symbol ids
+    symtypes   upper case symtype -> symbol ids
+    comments   upper case word of the comment -> symbol ids
+
+Glob and regular expression queries are matched against the names only
+within the prefix range of their literal beginning (if any), and all
+filters are intersected starting with the smallest candidate set.
+
+AdsOnlineChangeWatcher.index() keeps an index per symbol version.
+"""
+from bisect import bisect_left
+import re
+
+from .adsexception import PyadsException
+
+
+SEGMENT_SPLIT_RE = re.compile(r'[.\[\],]+')
+WORD_RE = re.compile(r'\w+', re.U)
+GLOB_WILDCARD_RE = re.compile(r'([*?])')
+
+
+def glob_to_regex(glob):
+    """Translates a glob pattern into a regular expression matching the
+    whole name. Unlike in fnmatch, brackets aren't character classes but
+    match themselves, as in array indices ('MAIN.axes[3].*').
+    """
+    parts = []
+    for part in GLOB_WILDCARD_RE.split(glob):
+        if part == '*':
+            parts.append('.*')
+        elif part == '?':
+            parts.append('.')
+        else:
+            parts.append(re.escape(part))
+    return r'(?s)%s\Z' % ''.join(parts)
+
+
+def name_segments(name):
+    """Upper case dotted path segments of a symbol name; array indices are
+    segments as well ('MAIN.axis[3]' => ['MAIN', 'AXIS', '3']).
+    """
+    return [
+        segment for segment in SEGMENT_SPLIT_RE.split(name.upper())
+        if segment]
+
+
+class AdsSymbolIndex(object):
+    """Name, path segment, type and comment index of a list of AdsSymbol
+    objects.
+    """
+    def __init__(self, symbols, version=None):
+        """
+        symbols: list of AdsSymbol, e.g. from AdsClient.get_symbols()
+        version: symbol version of the PLC the symbols belong to
+        """
+        self.version = version
+        self.symbols = list(symbols)
+        # symbol id (position in symbols) -> upper case name
+        self._upper_names = [symbol.name.upper() for symbol in self.symbols]
+        order = sorted(
+            xrange(len(self.symbols)), key=self._upper_names.__getitem__)
+        # sorted upper case names and the ids of their symbols
+        self._names = [self._upper_names[idx] for idx in order]
+        self._name_ids = order
+        self._segments = {}
+        self._symtypes = {}
+        self._comments = {}
+        for idx, symbol in enumerate(self.symbols):
+            for segment in set(name_segments(symbol.name)):
+                self._segments.setdefault(segment, []).append(idx)
+            self._symtypes.setdefault(
+                symbol.symtype.strip().upper(), []).append(idx)
+            for word in set(WORD_RE.findall(symbol.comment.upper())):
+                self._comments.setdefault(word, []).append(idx)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _prefix_range(self, prefix):
+        prefix = prefix.upper()
+        start = bisect_left(self._names, prefix)
+        # u'\uffff' sorts behind every character of a symbol name
+        end = bisect_left(self._names, prefix + u'\uffff', start)
+        return start, end
+
+    def prefix(self, prefix, limit=None):
+        """Returns the symbols whose name starts with prefix (case
+        insensitive) in name order.
+        """
+        start, end = self._prefix_range(prefix)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self.symbols[idx] for idx in self._name_ids[start:end]]
+
+    def search(
+            self, prefix=None, glob=None, regex=None, segment=None,
+            symtype=None, comment=None, limit=None):
+        """Returns the symbols matching all given criteria in name order.
+
+        prefix: beginning of the name
+        glob: pattern of the whole name with the wildcards * and ?
+            ('MAIN.axis*.pos*', 'MAIN.axes[?]'), see glob_to_regex()
+        regex: regular expression searched for in the name
+        segment: dotted path segment or list of segments all of which the
+            name must contain ('axis' matches 'MAIN.axis.pos' but not
+            'MAIN.axis2')
+        symtype: type name ('LREAL', 'ARRAY [0..9] OF INT')
+        comment: words all of which the comment must contain
+        All criteria are case insensitive.
+        """
+        # lists of symbol ids, every result must be in all of them
+        id_lists = []
+        if segment is not None:
+            segments = [segment] if isinstance(segment, basestring) \
+                else segment
+            for seg in segments:
+                id_lists.append(self._segments.get(seg.upper(), ()))
+        if symtype is not None:
+            id_lists.append(self._symtypes.get(symtype.strip().upper(), ()))
+        if comment is not None:
+            for word in WORD_RE.findall(comment.upper()):
+                id_lists.append(self._comments.get(word, ()))
+
+        # predicates on the upper case name
+        matchers = []
+        prefixes = [] if prefix is None else [prefix]
+        if glob is not None:
+            matchers.append(re.compile(
+                glob_to_regex(glob.upper()), re.U).match)
+            literal = GLOB_WILDCARD_RE.split(glob, 1)[0]
+            if literal:
+                prefixes.append(literal)
+        if regex is not None:
+            try:
+                matchers.append(re.compile(regex, re.I | re.U).search)
+            except re.error as ex:
+                raise PyadsException("Invalid regular expression: %s" % ex)
+
+        if prefixes:
+            # the longest prefix has the smallest name range, which is
+            # already in name order
+            longest = max(prefixes, key=len)
+            start, end = self._prefix_range(longest)
+            matchers.extend(
+                _prefix_matcher(other.upper()) for other in prefixes
+                if other is not longest)
+            ordered = self._name_ids[start:end]
+        else:
+            ordered = None
+
+        allowed = None
+        if id_lists:
+            id_lists.sort(key=len)
+            allowed = set(id_lists[0])
+            for ids in id_lists[1:]:
+                if not allowed:
+                    break
+                allowed.intersection_update(ids)
+        if (ordered is not None and allowed is not None and
+                len(allowed) < len(ordered)):
+            # the filters are more selective than the name range
+            matchers.append(_prefix_matcher(longest.upper()))
+            ordered = None
+        if ordered is None:
+            if allowed is None:
+                ordered = self._name_ids
+            else:
+                ordered = sorted(allowed, key=self._upper_names.__getitem__)
+                allowed = None
+
+        if allowed is not None:
+            ordered = [idx for idx in ordered if idx in allowed]
+        upper_names = self._upper_names
+        for matcher in matchers:
+            ordered = [idx for idx in ordered if matcher(upper_names[idx])]
+        if limit is not None:
+            ordered = ordered[:limit]
+        return [self.symbols[idx] for idx in ordered]
+
+
+def _prefix_matcher(prefix):
+    return lambda name: name.startswith(prefix)
@@ -0,0 +1,52 @@
+"""Transports opening the stream socket AdsClient exchanges AMS/TCP frames on.
+
+By default AdsClient connects directly to the PLC over TCP. Passing an
+AdsUnixTransport instead connects it to a local AdsRouter, which forwards the
+frames of many local processes over a single upstream connection per PLC.
+"""
+import socket
+
+
+ADS_PORT_DEFAULT = 0xBF02
+
+
+class AdsTcpTransport(object):
+    """Direct TCP connection to the AMS router of the PLC."""
+    def __init__(self, host, port=ADS_PORT_DEFAULT, timeout=2):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect((self.host, self.port))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def __str__(self):
+        return "tcp://%s:%s" % (self.host, self.port)
+
+
+class AdsUnixTransport(object):
+    """Connection to a local AdsRouter listening on a Unix socket."""
+    def __init__(self, path, timeout=2):
+        self.path = path
+        self.timeout = timeout
+
+    def open(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def __str__(self):
+        return "unix://%s" % self.path
@@ -0,0 +1,538 @@
+"""Data types compiled from IEC 61131-3 type declarations.
+
+DUTs (data unit types) live in source control as TYPE ... END_TYPE text or
+as .TcDUT files of TwinCAT projects. AdsTypeLibrary parses these
+declarations and compiles them into AdsDatatype codecs, so that structs can
+be decoded without uploading type information from the PLC:
+
+    TYPE ST_Recipe :
+    STRUCT
+        name : STRING(20);
+        mode : E_Mode;
+        steps : ARRAY [1..MAX_STEPS] OF ST_Step;
+    END_STRUCT
+    END_TYPE
+
+Supported are STRUCT (including EXTENDS and {attribute 'pack_mode'}),
+ARRAY, STRING(n), enumerations, aliases, subranges and references to other
+declared or elementary types in any order. Array bounds may name constants
+passed to the library. POINTER, REFERENCE, UNION and WSTRING are rejected
+with PyadsTypeError, as are unknown and recursive types.
+
+Parsing is the slow part. load_type_library() keeps the parsed
+declarations of a set of files in a JSON file in a cache directory, keyed
+by a hash of the file contents and options, and compiles the codecs from
+it directly when nothing changed.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+from .adsdatatypes import AdsEnumDatatype
+from .adsdatatypes import AdsStructDatatype
+from .adsdatatypes import DATATYPE_FACTORY
+from .adsdatatypes import ELEMENTARY_DATATYPES
+from .adsexception import PyadsTypeError
+from .constants import PYADS_ENCODING
+
+
+# bump when the format of the parsed declarations changes
+CACHE_FORMAT_VERSION = 1
+# alignment of structs without a pack_mode attribute: TwinCAT 3 aligns
+# fields to 8 bytes; use 1 for TwinCAT 2 on x86
+PACK_MODE_DEFAULT = 8
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<pragma>\{[^}]*\})|
+        (?P<string>'(?:\$.|[^'$])*'|"(?:\$.|[^"$])*")|
+        (?P<number>\d+\#[0-9A-Fa-f_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)|
+        (?P<ident>[A-Za-z_][A-Za-z0-9_]*)|
+        (?P<op>:=|\.\.|[:;,()\[\]+\-*/.%\#=<>&^])
+    )""", re.X)
+PACK_MODE_RE = re.compile(r"attribute\s+'pack_mode'\s*:=\s*'(\d+)'", re.I)
+
+
+def strip_comments(text):
+    """Replaces (* nested *) and // line comments by blanks, leaving string
+    literals alone.
+    """
+    result = []
+    pos = 0
+    depth = 0
+    length = len(text)
+    while pos < length:
+        if text.startswith('(*', pos):
+            depth += 1
+            pos += 2
+        elif depth:
+            if text.startswith('*)', pos):
+                depth -= 1
+                result.append(' ')
+                pos += 2
+            else:
+                pos += 1
+        elif text.startswith('//', pos):
+            end = text.find('\n', pos)
+            pos = length if end < 0 else end
+        elif text[pos] in '\'"':
+            end = pos + 1
+            while end < length and text[end] != text[pos]:
+                # $ escapes the next character
+                end += 2 if text[end] == '$' else 1
+            result.append(text[pos:end + 1])
+            pos = end + 1
+        else:
+            result.append(text[pos])
+            pos += 1
+    if depth:
+        raise PyadsTypeError("Unterminated comment in type declaration.")
+    return ''.join(result)
+
+
+def tokenize(text):
+    """Returns the list of tokens (kind, value) of declaration text."""
+    text = strip_comments(text)
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        match = TOKEN_RE.match(text, pos)
+        if match is None:
+            raise PyadsTypeError(
+                "Unexpected character %r in type declaration." %
+                text[pos:].lstrip()[:1])
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'ident':
+            value = str(value)
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+def _int_literal(value):
+    value = value.replace('_', '')
+    if '#' in value:
+        base, digits = value.split('#', 1)
+        return int(digits, int(base))
+    return int(value)
+
+
+class _DeclarationParser(object):
+    """Recursive descent parser of TYPE declarations producing the JSON
+    compatible type specifications compiled by AdsTypeLibrary:
+
+        {'kind': 'named', 'name': 'ST_Axis'}
+        {'kind': 'string', 'length': 20}
+        {'kind': 'array', 'dimensions': [[0, 'MAX'], ...], 'element': spec}
+        {'kind': 'struct', 'pack_mode': None, 'extends': None,
+         'fields': [[name, spec], ...]}
+        {'kind': 'enum', 'base': spec, 'members': [[name, value], ...]}
+    """
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def _error(self, message):
+        context = ' '.join(
+            value for _, value in self.tokens[self.pos:self.pos + 5])
+        return PyadsTypeError("%s at %r." % (message, context))
+
+    def peek(self):
+        """Returns the next token, identifiers (and keywords) in upper
+        case.
+        """
+        if self.pos < len(self.tokens):
+            kind, value = self.tokens[self.pos]
+            return value.upper() if kind == 'ident' else value
+        return None
+
+    def next(self, kind=None):
+        if self.pos >= len(self.tokens):
+            raise self._error("Unexpected end of type declaration")
+        token_kind, value = self.tokens[self.pos]
+        if kind is not None and token_kind != kind:
+            raise self._error("Expected %s" % kind)
+        self.pos += 1
+        return value
+
+    def accept(self, value):
+        if self.peek() == value:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise self._error("Expected %r" % value)
+
+    def pragmas(self):
+        """Returns the pack_mode of the pragmas at the current position."""
+        pack_mode = None
+        while self.pos < len(self.tokens) and \
+                self.tokens[self.pos][0] == 'pragma':
+            match = PACK_MODE_RE.search(self.next())
+            if match is not None:
+                pack_mode = int(match.group(1))
+        return pack_mode
+
+    def skip_initial_value(self):
+        """Skips ':= value' up to the end of the declaration."""
+        if not self.accept(':='):
+            return
+        depth = 0
+        while self.peek() is not None:
+            value = self.peek()
+            if depth == 0 and value in (';', 'END_TYPE', 'END_STRUCT'):
+                return
+            if value in ('(', '['):
+                depth += 1
+            elif value in (')', ']'):
+                depth -= 1
+            self.pos += 1
+
+    def declarations(self):
+        """Returns the list of tuples (name, spec) of all TYPE blocks."""
+        declarations = []
+        while True:
+            pack_mode = self.pragmas()
+            if self.peek() is None:
+                return declarations
+            self.expect('TYPE')
+            while not self.accept('END_TYPE'):
+                pack_mode = self.pragmas() or pack_mode
+                declarations.append(self.declaration(pack_mode))
+                pack_mode = None
+
+    def declaration(self, pack_mode):
+        name = self.next('ident')
+        extends = self.next('ident') if self.accept('EXTENDS') else None
+        self.expect(':')
+        pack_mode = self.pragmas() or pack_mode
+        if self.accept('STRUCT'):
+            spec = {
+                'kind': 'struct', 'pack_mode': pack_mode,
+                'extends': extends, 'fields': self.fields()}
+        elif extends is not None:
+            raise self._error("Only structs can extend other types")
+        elif self.peek() == 'UNION':
+            raise self._error("Unions are not supported")
+        elif self.peek() == '(':
+            spec = self.enum()
+        else:
+            spec = self.type_spec()
+            self.skip_initial_value()
+        self.accept(';')
+        return name, spec
+
+    def fields(self):
+        fields = []
+        while not self.accept('END_STRUCT'):
+            self.pragmas()
+            names = [self.next('ident')]
+            while self.accept(','):
+                names.append(self.next('ident'))
+            if self.accept('AT'):
+                # I/O location like %I* or %QX2.1
+                while self.peek() not in (':', None):
+                    self.pos += 1
+            self.expect(':')
+            spec = self.type_spec()
+            self.skip_initial_value()
+            self.expect(';')
+            fields.extend([name, spec] for name in names)
+        return fields
+
+    def enum(self):
+        self.expect('(')
+        members = []
+        value = -1
+        while True:
+            name = self.next('ident')
+            value = self.signed_int() if self.accept(':=') else value + 1
+            members.append([name, value])
+            if not self.accept(','):
+                break
+        self.expect(')')
+        if self.peek() not in (';', ':=', 'END_TYPE'):
+            base = self.type_spec()
+        else:
+            base = {'kind': 'named', 'name': 'INT'}
+        self.skip_initial_value()
+        return {'kind': 'enum', 'base': base, 'members': members}
+
+    def signed_int(self):
+        sign = -1 if self.accept('-') else 1
+        return sign * _int_literal(self.next('number'))
+
+    def bound(self):
+        """An array bound: an integer or the name of a constant."""
+        if self.tokens[self.pos][0] == 'ident':
+            return self.next()
+        return self.signed_int()
+
+    def type_spec(self):
+        name = self.next('ident')
+        keyword = name.upper()
+        if keyword == 'STRING':
+            length = 80
+            if self.peek() in ('(', '['):
+                closing = ')' if self.next() == '(' else ']'
+                length = _int_literal(self.next('number'))
+                self.expect(closing)
+            return {'kind': 'string', 'length': length}
+        if keyword == 'ARRAY':
+            self.expect('[')
+            dimensions = []
+            while True:
+                start = self.bound()
+                self.expect('..')
+                dimensions.append([start, self.bound()])
+                if not self.accept(','):
+                    break
+            self.expect(']')
+            self.expect('OF')
+            return {
+                'kind': 'array', 'dimensions': dimensions,
+                'element': self.type_spec()}
+        if keyword in ('POINTER', 'REFERENCE'):
+            raise self._error(
+                "%s types are not supported, their size depends on the "
+                "target" % keyword)
+        if keyword == 'WSTRING':
+            raise self._error("WSTRING is not supported")
+        if self.accept('('):
+            # subrange like INT (0..100), stored as its base type
+            self.signed_int()
+            self.expect('..')
+            self.signed_int()
+            self.expect(')')
+        return {'kind': 'named', 'name': name}
+
+
+def parse_declarations(text):
+    """Returns the list of tuples (name, spec) of the TYPE declarations in
+    text, see _DeclarationParser for the specs.
+    """
+    return _DeclarationParser(text).declarations()
+
+
+def read_declaration_file(path):
+    """Returns the declaration text of a .TcDUT file or of a plain text file
+    of TYPE declarations.
+    """
+    if path.lower().endswith('.tcdut'):
+        root = ElementTree.parse(path).getroot()
+        declarations = root.findall('.//Declaration')
+        if not declarations:
+            raise PyadsTypeError("%s has no type declaration." % path)
+        return u'\n'.join(element.text or u'' for element in declarations)
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode(PYADS_ENCODING)
+
+
+def _str_spec(value):
+    """Turns the unicode strings json.load() returns into str (field names
+    must be str for NumPy dtypes on Python 2).
+    """
+    if isinstance(value, dict):
+        return dict(
+            (str(key), _str_spec(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_str_spec(item) for item in value]
+    if isinstance(value, unicode):
+        return str(value)
+    return value
+
+
+class AdsTypeLibrary(object):
+    """Named data types compiled from TYPE declarations, see the module
+    documentation.
+    """
+    def __init__(self, pack_mode=PACK_MODE_DEFAULT, constants=None):
+        """pack_mode is the default alignment of structs without a
+            pack_mode attribute (see AdsStructDatatype)
+        constants maps names used as array bounds to their values
+        """
+        self.pack_mode = pack_mode
+        self.constants = dict(
+            (name.upper(), value)
+            for name, value in (constants or {}).items())
+        # upper case name -> (name, spec)
+        self.declarations = OrderedDict()
+        # upper case name -> compiled AdsDatatype
+        self._datatypes = {}
+
+    def add_declarations(self, declarations):
+        """Adds a list of tuples (name, spec) as returned by
+        parse_declarations().
+        """
+        for name, spec in declarations:
+            key = name.upper()
+            if key in self.declarations:
+                raise PyadsTypeError("Type %s is declared twice." % name)
+            self.declarations[key] = (name, spec)
+        self._datatypes.clear()
+
+    def add_source(self, text):
+        """Parses and adds the TYPE declarations in text."""
+        self.add_declarations(parse_declarations(text))
+
+    def add_file(self, path):
+        """Parses and adds the declarations of a .TcDUT or text file."""
+        self.add_source(read_declaration_file(path))
+
+    def names(self):
+        return [name for name, _ in self.declarations.values()]
+
+    def spec(self, name):
+        """Returns the parsed specification of a declared type."""
+        try:
+            return self.declarations[name.upper()][1]
+        except KeyError:
+            raise PyadsTypeError("Unknown data type %r." % name)
+
+    def datatype(self, name):
+        """Returns the AdsDatatype of a declared or elementary type."""
+        return self._named(name.upper(), ())
+
+    def parse_symtype(self, symtype):
+        """Returns the AdsDatatype of a type specification which may refer
+        to declared types, e.g. the symtype 'ARRAY [0..9] OF ST_Recipe' of
+        an AdsSymbol.
+        """
+        parser = _DeclarationParser(symtype)
+        spec = parser.type_spec()
+        if parser.peek() is not None:
+            raise parser._error("Unexpected text behind type")
+        return self._compile(spec, ())
+
+    def compile(self):
+        """Compiles all declared types and returns them as OrderedDict of
+        name -> AdsDatatype; raises PyadsTypeError for the first type that
+        can't be compiled. Running this in a test catches broken
+        declarations before a service starts.
+        """
+        return OrderedDict(
+            (name, self._named(key, ()))
+            for key, (name, _) in self.declarations.items())
+
+    def _named(self, key, resolving):
+        datatype = self._datatypes.get(key)
+        if datatype is not None:
+            return datatype
+        if key in self.declarations:
+            if key in resolving:
+                raise PyadsTypeError(
+                    "Type %s contains itself: %s." % (
+                        key, ' -> '.join(resolving + (key,))))
+            datatype = self._compile(
+                self.declarations[key][1], resolving + (key,)).freeze()
+            self._datatypes[key] = datatype
+            return datatype
+        datatype = ELEMENTARY_DATATYPES.get(key)
+        if datatype is None:
+            raise PyadsTypeError("Unknown data type %r." % key)
+        return datatype
+
+    def _bound(self, bound):
+        if isinstance(bound, basestring):
+            try:
+                return self.constants[bound.upper()]
+            except KeyError:
+                raise PyadsTypeError(
+                    "Unknown constant %r in array bounds." % bound)
+        return bound
+
+    def _compile(self, spec, resolving):
+        kind = spec['kind']
+        if kind == 'named':
+            return self._named(spec['name'].upper(), resolving)
+        if kind == 'string':
+            # STRING(n) occupies n + 1 bytes in the PLC (terminating NULL)
+            return DATATYPE_FACTORY.string(spec['length'] + 1)
+        if kind == 'array':
+            return DATATYPE_FACTORY.array(
+                self._compile(spec['element'], resolving),
+                [(self._bound(start), self._bound(end))
+                 for start, end in spec['dimensions']])
+        if kind == 'enum':
+            return AdsEnumDatatype(
+                self._compile(spec['base'], resolving),
+                [(name, value) for name, value in spec['members']])
+        if kind == 'struct':
+            fields = []
+            if spec['extends'] is not None:
+                base = self._named(spec['extends'].upper(), resolving)
+                if not isinstance(base, AdsStructDatatype):
+                    raise PyadsTypeError(
+                        "%s is not a struct and can't be extended." %
+                        spec['extends'])
+                fields.extend(base.fields)
+            fields.extend(
+                (name, self._compile(field_spec, resolving))
+                for name, field_spec in spec['fields'])
+            return AdsStructDatatype(
+                fields, pack_mode=spec['pack_mode'] or self.pack_mode)
+        raise PyadsTypeError("Unknown kind of type specification %r." % kind)
+
+
+def _cache_key(sources, pack_mode, constants):
+    digest = hashlib.sha1()
+    digest.update(json.dumps(
+        [CACHE_FORMAT_VERSION, pack_mode, sorted(constants.items())]))
+    for source in sources:
+        digest.update(source.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_type_library(
+        paths, cache_dir=None, pack_mode=PACK_MODE_DEFAULT, constants=None):
+    """Returns an AdsTypeLibrary of the declarations in a list of .TcDUT or
+    text files.
+
+    With cache_dir, the parsed declarations are stored in a JSON file there
+    and reused as long as the contents of the files, pack_mode and
+    constants are the same.
+    """
+    library = AdsTypeLibrary(pack_mode=pack_mode, constants=constants)
+    sources = [read_declaration_file(path) for path in paths]
+    if cache_dir is None:
+        for source in sources:
+            library.add_source(source)
+        return library
+
+    cache_path = os.path.join(
+        cache_dir, 'types-%s.json' % _cache_key(
+            sources, pack_mode, library.constants))
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = _str_spec(json.load(f))
+        library.add_declarations(cached['declarations'])
+        return library
+
+    declarations = []
+    for source in sources:
+        declarations.extend(parse_declarations(source))
+    library.add_declarations(declarations)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    # write to a temporary file first so that concurrent loaders never
+    # read a partial cache file
+    temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    with open(temp_path, 'w') as f:
+        json.dump({
+            'version': CACHE_FORMAT_VERSION,
+            'declarations': declarations,
+        }, f)
+    os.rename(temp_path, cache_path)
+    return library
@@ -1,3 +1,129 @@
+import ctypes
+import ctypes.util
+import logging
+import sys
+import threading
+import time
+
+from .adsexception import PyadsException
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    """Returns a function reading CLOCK_MONOTONIC in nanoseconds with
+    clock_gettime() of the C library, or None if it isn't available.
+    """
+    if sys.platform.startswith('linux'):
+        clock_id = 1
+    elif sys.platform == 'darwin':
+        clock_id = 6
+    else:
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+    timespec = _Timespec()
+    # one timespec per thread, the function is called from many threads
+    local = threading.local()
+
+    def monotonic_ns():
+        timespec = getattr(local, 'timespec', None)
+        if timespec is None:
+            timespec = local.timespec = _Timespec()
+        if clock_gettime(clock_id, ctypes.byref(timespec)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime() failed')
+        return timespec.tv_sec * 1000000000 + timespec.tv_nsec
+
+    # fail early (e.g. an unsupported clock id) rather than on first use
+    if clock_gettime(clock_id, ctypes.byref(timespec)) != 0:
+        return None
+    return monotonic_ns
+
+
+if hasattr(time, 'monotonic_ns'):
+    monotonic_ns = time.monotonic_ns
+else:
+    monotonic_ns = _load_clock_gettime()
+    if monotonic_ns is None:
+        # neither Python 3 nor clock_gettime(): the wall clock is all we have
+        def monotonic_ns():
+            return int(time.time() * 1e9)
+monotonic_ns.__doc__ = """Returns the time of a monotonic clock in integer
+nanoseconds. Only differences are meaningful; the clock isn't affected by
+changes of the system time (except on platforms without clock_gettime()).
+"""
+
+
+def monotonic():
+    """Like monotonic_ns(), in float seconds."""
+    return monotonic_ns() / 1e9
+
+
+class PeriodicRunner(object):
+    """Calls fn every period seconds in a daemon thread until stop() is
+    called. Errors of fn are logged and counted in errors; the next call
+    follows at the usual time. If fn takes longer than period, the next
+    call follows immediately and the schedule starts over from there.
+    """
+    def __init__(self, fn, period, name):
+        """
+        name: description of fn for the log, e.g. 'Refreshing the read
+            cache'
+        """
+        self.fn = fn
+        self.period = period
+        self.name = name
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            raise PyadsException("%s is already running." % self.name)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_fn)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_fn(self):
+        next_call = monotonic()
+        while not self._stop.is_set():
+            try:
+                self.fn()
+            except PyadsException as ex:
+                self.errors += 1
+                logger.warning("%s failed: %s" % (self.name, ex))
+            except Exception:
+                self.errors += 1
+                logger.exception("%s failed" % self.name)
+            next_call += self.period
+            delay = next_call - monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                # we can't keep up, don't try to catch up with a burst
+                next_call = monotonic()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+
 def HexBlock(data, width=8):
     i = 0
     result = ''
@@ -0,0 +1,185 @@
+"""PLC variables bound to a handle with precompiled requests.
+
+read_by_handle() builds a ReadCommand, an AmsPacket (serialized field by
+field with BinaryParser) and a ReadResponse on every call. An AdsVariable
+(see AdsClient.bind()) does that work once: it resolves the handle, packs
+the AMS header and request payload of its read and write requests in
+advance and compiles the struct of its data type. A call then only inserts
+the invoke id into the prebuilt frame and unpacks the value straight from
+the response data.
+
+The requests still pass AdsClient.execute(), so priorities, the in-flight
+window, retries, metrics and capturing apply as for any other request.
+"""
+import struct
+
+from .adsconstants import ADSIGRP_SYM_VALBYHND
+from .adsdatatypes import AdsSingleValuedDatatype
+from .adsexception import AdsException
+from .adsexception import PyadsException
+from .amspacket import AmsPacket
+
+
+AMS_REQUEST_STATE_FLAGS = 0x0004
+# target id and port, source id and port, command id, state flags, data
+# length and error code; the invoke id follows
+AMS_HEADER_PREFIX = struct.Struct('<6BH6BHHHII')
+INVOKE_ID = struct.Struct('<I')
+ERROR_CODE = struct.Struct('<I')
+
+
+def _ams_header_prefix(connection, command_id, data_length):
+    return AMS_HEADER_PREFIX.pack(*(
+        AmsPacket.ams_id_to_bytes(connection.target_ams_id) +
+        [connection.target_ams_port] +
+        AmsPacket.ams_id_to_bytes(connection.source_ams_id) +
+        [connection.source_ams_port, command_id, AMS_REQUEST_STATE_FLAGS,
+         data_length, 0]))
+
+
+def compile_decoder(datatype):
+    """Returns a function decoding the value of datatype at offset 8 (behind
+    the error code and length) of read response data.
+    """
+    if type(datatype) is AdsSingleValuedDatatype:
+        unpack_from = struct.Struct('<' + datatype.pack_format).unpack_from
+        return lambda data: unpack_from(data, 8)[0]
+    byte_count = datatype.byte_count
+    unpack = datatype.unpack
+    return lambda data: unpack(data[8:8 + byte_count])
+
+
+def compile_encoder(datatype):
+    """Returns a function packing a value of datatype."""
+    if type(datatype) is AdsSingleValuedDatatype:
+        return struct.Struct('<' + datatype.pack_format).pack
+    return datatype.pack
+
+
+class _PrebuiltPacket(object):
+    """Stands in for the AmsPacket of a prebuilt request."""
+    __slots__ = ('invoke_id', 'prefix', 'payload', 'command_id')
+    # see AmsPacket.sink
+    sink = None
+
+    def __init__(self, prefix, payload, command_id):
+        self.invoke_id = 0
+        self.prefix = prefix
+        self.payload = payload
+        self.command_id = command_id
+
+    def GetBinaryData(self):
+        return self.prefix + INVOKE_ID.pack(self.invoke_id) + self.payload
+
+    def __str__(self):
+        return "Prebuilt packet, command ID %s, invoke ID %s" % (
+            self.command_id, self.invoke_id)
+
+
+class _BoundRead(object):
+    """Read command of an AdsVariable, executed by AdsClient.execute()."""
+    command_id = 0x0002
+    index_group = ADSIGRP_SYM_VALBYHND
+
+    def __init__(self, ads_connection, handle, datatype):
+        payload = struct.pack(
+            '<III', ADSIGRP_SYM_VALBYHND, handle, datatype.byte_count)
+        self.prefix = _ams_header_prefix(
+            ads_connection, self.command_id, len(payload))
+        self.payload = payload
+        self.decode = compile_decoder(datatype)
+
+    def to_ams_packet(self, ads_connection):
+        return _PrebuiltPacket(self.prefix, self.payload, self.command_id)
+
+    def CreateResponse(self, packet):
+        data = packet.data
+        error = ERROR_CODE.unpack_from(data)[0]
+        if error:
+            raise AdsException(error)
+        return self.decode(data)
+
+
+class _BoundWrite(object):
+    """Prebuilt parts of the write requests of an AdsVariable."""
+    def __init__(self, ads_connection, handle, datatype):
+        byte_count = datatype.byte_count
+        self.header = struct.pack(
+            '<III', ADSIGRP_SYM_VALBYHND, handle, byte_count)
+        self.prefix = _ams_header_prefix(
+            ads_connection, _BoundWriteCommand.command_id,
+            len(self.header) + byte_count)
+        self.encode = compile_encoder(datatype)
+
+    def command(self, value):
+        return _BoundWriteCommand(
+            self.prefix, self.header + self.encode(value))
+
+
+class _BoundWriteCommand(object):
+    """Write command of an AdsVariable, executed by AdsClient.execute()."""
+    __slots__ = ('prefix', 'payload')
+    command_id = 0x0003
+    index_group = ADSIGRP_SYM_VALBYHND
+
+    def __init__(self, prefix, payload):
+        self.prefix = prefix
+        self.payload = payload
+
+    def to_ams_packet(self, ads_connection):
+        return _PrebuiltPacket(self.prefix, self.payload, self.command_id)
+
+    def CreateResponse(self, packet):
+        error = ERROR_CODE.unpack_from(packet.data)[0]
+        if error:
+            raise AdsException(error)
+        return None
+
+
+class AdsVariable(object):
+    """A PLC variable bound to a handle, see AdsClient.bind()."""
+    def __init__(self, client, name, datatype):
+        self.client = client
+        self.name = name
+        self.datatype = datatype
+        self.handle = None
+        self._read = None
+        self._write = None
+        self.bind()
+
+    def bind(self):
+        """Resolves the handle and prebuilds the requests, e.g. again after
+        an online change. A previously resolved handle is released first.
+        """
+        self.release()
+        self.handle = self.client.get_handle_by_name(self.name)
+        connection = self.client.ads_connection
+        self._read = _BoundRead(connection, self.handle, self.datatype)
+        self._write = _BoundWrite(connection, self.handle, self.datatype)
+
+    def release(self):
+        """Releases the handle on the PLC. read() and write() raise
+        PyadsException until bind() is called again.
+        """
+        if self.handle is not None:
+            # the PLC may hand the freed handle out for another symbol
+            self._read = None
+            self._write = None
+            self.client.release_handles([self.handle])
+            self.handle = None
+
+    def _require_handle(self):
+        if self.handle is None:
+            raise PyadsException(
+                "The handle of %s was released." % self.name)
+
+    def read(self):
+        self._require_handle()
+        return self.client.execute(self._read)
+
+    def write(self, value):
+        self._require_handle()
+        self.client.execute_write(self._write.command(value))
+
+    def __repr__(self):
+        return '<AdsVariable %s (handle %s)>' % (self.name, self.handle)
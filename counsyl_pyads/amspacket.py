@@ -1,8 +1,15 @@
+import struct
+
 from .adsconnection import AdsConnection
 from .binaryparser import BinaryParser
 from .adsutils import HexBlock
 
 
+# target id and port, source id and port, command id, state flags, data
+# length, error code and invoke id
+AMS_HEADER = struct.Struct('<6BH6BHHHIII')
+
+
 class AmsPacket(object):
     """An incoming or outgoing communications packet in the Ams protocol"""
 
@@ -33,6 +40,12 @@ class AmsPacket(object):
         self.invoke_id = 0
         # the ADS-data to transmit as payload of the AMS packet
         self.data = b''
+        # request: writable memoryview the data of the read response is
+        # received into, see AdsClient.read_into()
+        self.sink = None
+        # response: number of bytes received into the sink of the request,
+        # None if data holds the complete payload
+        self.received_into = None
 
     @staticmethod
     def ams_id_to_bytes(dotted_decimal):
@@ -75,27 +88,28 @@ class AmsPacket(object):
 
     @staticmethod
     def from_binary_data(data=''):
-        binary = BinaryParser(data)
+        return AmsPacket.from_header(
+            data[:AMS_HEADER.size], data[AMS_HEADER.size:])
 
-        # ams target & source
-        target_ams_id = AmsPacket.ams_id_from_bytes(binary.ReadBytes(6))
-        target_ams_port = binary.ReadUInt16()
-        source_ams_id = AmsPacket.ams_id_from_bytes(binary.ReadBytes(6))
-        source_ams_port = binary.ReadUInt16()
+    @staticmethod
+    def from_header(header, data=b''):
+        """Creates a packet from its 32 byte AMS header; data becomes the
+        payload of the packet as is (without copying it).
+        """
+        fields = AMS_HEADER.unpack(header)
 
+        # ams target & source
         ads_conn = AdsConnection(
-            target_ams="%s:%s" % (target_ams_id, target_ams_port),
-            source_ams="%s:%s" % (source_ams_id, source_ams_port),
+            target_ams="%s:%s" % ('.'.join(map(str, fields[0:6])), fields[6]),
+            source_ams="%s:%s" % (
+                '.'.join(map(str, fields[7:13])), fields[13]),
         )
 
         packet = AmsPacket(ads_conn)
 
-        packet.command_id = binary.ReadUInt16()
-        packet.state_flags = binary.ReadUInt16()
-        packet.length = binary.ReadUInt32()
-        packet.error_code = binary.ReadUInt32()
-        packet.invoke_id = binary.ReadUInt32()
-        packet.data = binary.ByteData[32:]
+        (packet.command_id, packet.state_flags, packet.length,
+         packet.error_code, packet.invoke_id) = fields[14:]
+        packet.data = data
 
         return packet
 
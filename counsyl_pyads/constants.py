@@ -6,3 +6,7 @@ adsconstant.py.
 """
 
 PYADS_ENCODING = 'windows-1252'
+
+# Index group returning the number of symbols and the length of the symbol
+# table (used before ADSIGRP_SYM_UPLOAD)
+ADSIGRP_SYM_UPLOADINFO2 = 0xF00F
@@ -6,7 +6,8 @@ setup(
     name='counsyl-pyads',
     version=__version__,
     packages=find_packages(),
-    scripts=['bin/twincat_plc_info.py'],
+    scripts=['bin/twincat_plc_info.py', 'bin/ads_capture_replay.py',
+             'bin/ads_router.py'],
     include_package_data=True,
     zip_safe=False,
     author='Counsyl Inc.',
@@ -0,0 +1,31 @@
+"""Fixtures of the tests talking to an AdsSimulator.
+
+simulator is an empty simulator; test modules add their symbols by
+overriding it:
+
+    @pytest.fixture
+    def simulator(simulator):
+        simulator.add_symbol('MAIN.counter', INT, 5)
+        return simulator
+
+client is an AdsClient connected to the simulator.
+"""
+import pytest
+
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adssimulator import AdsSimulator
+
+
+@pytest.fixture
+def simulator():
+    with AdsSimulator() as simulator:
+        yield simulator
+
+
+@pytest.fixture
+def client(simulator):
+    conn = AdsConnection(
+        target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+    with AdsClient(conn, tcp_port=simulator.port) as client:
+        yield client
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from counsyl_pyads.adsbits import apply_bits
+from counsyl_pyads.adsbits import plan_bit_writes
+from counsyl_pyads.adsbits import unpack_bits
+from counsyl_pyads.adsbits import unpack_bits_numpy
+from counsyl_pyads.adsconstants import ADSIGRP_IOIMAGE_RWIB
+from counsyl_pyads.adsconstants import ADSIGRP_IOIMAGE_RWOB
+from counsyl_pyads.adsconstants import ADSIGRP_IOIMAGE_RWOX
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adssimulator import ADSIGRP_MEMORY_M
+
+
+def expected_bits(data, first_bit, count):
+    return [
+        bool(ord(data[bit // 8]) >> bit % 8 & 1)
+        for bit in range(first_bit, first_bit + count)]
+
+
+class TestBitCodec(object):
+
+    def test_unpack(self):
+        data = b'\x01\x80\xa5'
+        assert(unpack_bits(data, 0, 24) == expected_bits(data, 0, 24))
+        assert(unpack_bits(data, 7, 3) == [False, False, False])
+        assert(unpack_bits(data, 15, 3) == [True, True, False])
+        numpy = pytest.importorskip('numpy')
+        bits = unpack_bits_numpy(data, 3, 19)
+        assert(bits.dtype == numpy.bool_)
+        assert(bits.tolist() == expected_bits(data, 3, 19))
+
+    def test_plan(self):
+        ranges = plan_bit_writes(
+            [(0, True), (9, True), (9, False), (40, True)], max_gap=2)
+        assert(ranges == [
+            (0, bytearray(b'\x01\x02'), bytearray(b'\x01\x00')),
+            (5, bytearray(b'\x01'), bytearray(b'\x01'))])
+        merged = plan_bit_writes({0: True, 40: True}, max_gap=4)
+        assert(merged == [(0, bytearray(b'\x01\0\0\0\0\x01'),
+                           bytearray(b'\x01\0\0\0\0\x01'))])
+        assert(apply_bits(b'\xf0\xff', b'\x11\x02', b'\x01\x00') ==
+               bytearray(b'\xe1\xfd'))
+        with pytest.raises(PyadsException):
+            plan_bit_writes({-1: True})
+
+
+class TestClientBits(object):
+
+    def test_read_bits(self, client, simulator):
+        data = bytes(bytearray(random.randrange(256) for _ in range(64)))
+        simulator.memory[ADSIGRP_IOIMAGE_RWIB][100:164] = data
+        requests_before = simulator.request_count
+        bits = client.read_bits(ADSIGRP_IOIMAGE_RWIB, 800, 512)
+        assert(bits == expected_bits(data, 0, 512))
+        assert(client.read_bits(ADSIGRP_IOIMAGE_RWIB, 805, 7) ==
+               expected_bits(data, 5, 7))
+        assert(simulator.request_count - requests_before == 2)
+        pytest.importorskip('numpy')
+        assert(client.read_bits_numpy(
+            ADSIGRP_IOIMAGE_RWIB, 803, 500).tolist() ==
+            expected_bits(data, 3, 500))
+
+    def test_write_bits(self, client, simulator):
+        memory = simulator.memory[ADSIGRP_MEMORY_M]
+        memory[0:4] = b'\xff\x00\xff\x00'
+        memory[100] = 0x0f
+        requests_before = simulator.request_count
+        client.write_bits(ADSIGRP_MEMORY_M, {
+            0: False, 9: True, 24: True, 25: True, 800: False, 807: True})
+        # one sum read and one sum write
+        assert(simulator.request_count - requests_before == 2)
+        assert(memory[0:4] == b'\xfe\x02\xff\x03')
+        assert(memory[100] == 0x8e)
+
+        # a completely written byte isn't read
+        requests_before = simulator.request_count
+        client.write_bits(ADSIGRP_MEMORY_M, [(bit, True) for bit in range(8)])
+        assert(simulator.request_count - requests_before == 1)
+        assert(memory[0] == 0xff)
+
+    def test_bit_access(self, client, simulator):
+        memory = simulator.memory[ADSIGRP_IOIMAGE_RWOB]
+        memory[2] = 0x81
+        client.write_bits(
+            ADSIGRP_IOIMAGE_RWOB, {16: False, 17: True}, bit_access=True)
+        assert(memory[2] == 0x82)
+        client.write_bits(ADSIGRP_IOIMAGE_RWOB, {23: False}, bit_access=True)
+        assert(memory[2] == 0x02)
+        response = client.read(ADSIGRP_IOIMAGE_RWOX, 16, 2)
+        assert(response.data == b'\x00\x01')
+        with pytest.raises(PyadsException):
+            client.write_bits(ADSIGRP_MEMORY_M, {0: True}, bit_access=True)
+
+    def test_errors(self, client, simulator):
+        with pytest.raises(AdsException):
+            client.read_bits(0x1234, 0, 8)
+        with pytest.raises(AdsException):
+            client.write_bits(0x1234, {0: True, 800: True})
+        size = len(simulator.memory[ADSIGRP_MEMORY_M]) * 8
+        with pytest.raises(AdsException):
+            client.write_bits(ADSIGRP_MEMORY_M, {size: True})
@@ -0,0 +1,121 @@
+import struct
+import threading
+import time
+
+import pytest
+
+from counsyl_pyads.adscache import AdsCacheServer
+from counsyl_pyads.adscache import AdsReadCache
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsconstants import ADSIGRP_SYM_RELEASEHND
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adssimulator import AdsSimulator
+
+
+@pytest.fixture
+def simulator():
+    with AdsSimulator() as simulator:
+        simulator.add_symbol('MAIN.counter', INT, 5)
+        simulator.add_symbol('MAIN.speed', REAL, 1.5)
+        simulator.add_symbol('MAIN.other', INT, 3)
+        yield simulator
+
+
+def connect(port):
+    conn = AdsConnection(
+        target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+    client = AdsClient(conn, tcp_port=port)
+    client.connect()
+    return client
+
+
+@pytest.fixture
+def cache(simulator):
+    client = connect(simulator.port)
+    with AdsReadCache(
+            client, [('MAIN.counter', INT), ('MAIN.speed', REAL)]) as cache:
+        yield cache
+    client.close()
+
+
+class TestReadCache(object):
+
+    def test_max_age(self, cache, simulator):
+        assert(cache.age('MAIN.counter') is None)
+        assert(cache.get('MAIN.counter') == 5)
+        assert(cache.age('MAIN.counter') >= 0)
+        simulator.set_value('MAIN.counter', 6)
+        # any age is fine: served from the cache
+        assert(cache.get('MAIN.counter') == 5)
+        assert(cache.get('main.speed', max_age=10) == 1.5)
+        time.sleep(0.01)
+        assert(cache.get('MAIN.counter', max_age=0.005) == 6)
+        assert(cache.stats()['refreshes'] == 2)
+        assert(cache.stats()['hits'] == 2)
+
+    def test_not_cached(self, cache):
+        with pytest.raises(PyadsException):
+            cache.get('MAIN.other')
+        with pytest.raises(PyadsException):
+            cache.symbol('MAIN.other')
+
+    def test_symbol(self, cache):
+        symbol, datatype = cache.symbol('main.counter')
+        assert(symbol.name == 'MAIN.counter')
+        assert(datatype is INT)
+
+    def test_concurrent_misses_are_coalesced(self, simulator):
+        simulator.latency = 0.05
+        client = connect(simulator.port)
+        cache = AdsReadCache(client, [('MAIN.counter', INT)])
+        requests_before = simulator.request_count
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get('MAIN.counter')))
+            for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+        assert(results == [5] * 10)
+        assert(cache.refreshes == 1)
+        assert(simulator.request_count - requests_before == 1)
+
+    def test_polling(self, cache, simulator):
+        cache.start(0.01)
+        simulator.set_value('MAIN.counter', 42)
+        time.sleep(0.1)
+        cache.stop()
+        assert(cache.refreshes > 1)
+        assert(cache.get('MAIN.counter') == 42)
+
+
+class TestCacheServer(object):
+
+    def test_serves_reads_from_cache(self, cache, simulator):
+        with AdsCacheServer(cache, max_age=60) as server:
+            local = connect(server.port)
+            assert(local.read_by_name('MAIN.counter', INT) == 5)
+            handle = local.get_handle_by_name('MAIN.speed')
+            assert(local.read_by_handle(handle, REAL) == 1.5)
+            local.write(ADSIGRP_SYM_RELEASEHND, 0, struct.pack('<I', handle))
+            symbol = simulator.get_symbol('MAIN.counter')[0]
+            response = local.read(symbol.index_group, symbol.index_offset, 2)
+            assert(INT.unpack(response.data) == 5)
+            assert(local.read_device_info().DeviceName == u'Simulated PLC')
+            requests_before = simulator.request_count
+            simulator.set_value('MAIN.counter', 7)
+            for _ in range(10):
+                assert(local.read_by_name('MAIN.counter', INT) == 5)
+            assert(simulator.request_count == requests_before)
+
+            with pytest.raises(AdsException) as exc_info:
+                local.read_by_name('MAIN.other', INT)
+            assert(exc_info.value.code == 0x710)
+            local.close()
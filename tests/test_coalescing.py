@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads import adscoalescing
+from counsyl_pyads.adscoalescing import AdsSingleFlight
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adssimulator import AdsSimulator
+
+
+@pytest.fixture
+def simulator():
+    with AdsSimulator(latency=0.02) as simulator:
+        simulator.add_symbol('MAIN.counter', INT, 5)
+        yield simulator
+
+
+def connect(simulator, **kwargs):
+    conn = AdsConnection(
+        target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+    client = AdsClient(conn, tcp_port=simulator.port, **kwargs)
+    client.connect()
+    return client
+
+
+def run_concurrently(fn, count):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(fn()))
+        for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight(object):
+
+    def test_overlapping_calls_share_result(self):
+        single_flight = AdsSingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait()
+            return len(calls)
+
+        thread = threading.Thread(
+            target=lambda: single_flight.do('key', fn))
+        thread.start()
+        while not calls:
+            time.sleep(0.001)
+        followers = []
+        threads = [
+            threading.Thread(
+                target=lambda: followers.append(single_flight.do('key', fn)))
+            for _ in range(3)]
+        for follower in threads:
+            follower.start()
+        while single_flight.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        thread.join()
+        for follower in threads:
+            follower.join()
+        assert(followers == [1, 1, 1])
+        assert(single_flight.stats() == {
+            'executed': 1, 'coalesced': 3, 'reused': 0})
+        # the flight is over, the next call executes fn again
+        assert(single_flight.do('key', fn) == 2)
+
+    def test_errors_are_shared(self):
+        single_flight = AdsSingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def fn():
+            release.wait()
+            raise AdsException(0x710)
+
+        def call():
+            try:
+                single_flight.do('key', fn)
+            except AdsException as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while single_flight.coalesced < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert(len(errors) == 3)
+        assert(len(set(id(error) for error in errors)) == 1)
+
+    def test_ttl(self):
+        single_flight = AdsSingleFlight(ttl=0.05)
+        calls = []
+        fn = lambda: calls.append(1) or len(calls)  # noqa: E731
+        assert(single_flight.do('a', fn) == 1)
+        assert(single_flight.do('a', fn) == 1)
+        assert(single_flight.do('b', fn) == 2)
+        time.sleep(0.06)
+        assert(single_flight.do('a', fn) == 3)
+        single_flight.invalidate()
+        assert(single_flight.do('a', fn) == 4)
+        assert(single_flight.reused == 1)
+
+    def test_max_results(self, monkeypatch):
+        monkeypatch.setattr(adscoalescing, 'MAX_RESULTS', 3)
+        single_flight = AdsSingleFlight(ttl=10)
+        for key in 'abcd':
+            single_flight.do(key, lambda: key)
+        # none expired, the oldest was dropped
+        assert(list(single_flight._results) == ['b', 'c', 'd'])
+        assert(single_flight.do('a', lambda: 'new') == 'new')
+        assert(single_flight.do('d', lambda: 'new') == 'd')
+
+
+class TestClientCoalescing(object):
+
+    def test_concurrent_reads_share_request(self, simulator):
+        client = connect(simulator, coalesce_reads=True)
+        handle = client.get_handle_by_name('MAIN.counter')
+        requests_before = simulator.request_count
+        values = run_concurrently(
+            lambda: client.read_by_handle(handle, INT), 8)
+        assert(values == [5] * 8)
+        assert(simulator.request_count - requests_before < 8)
+        assert(client.stats()['coalescing']['coalesced'] > 0)
+        client.close()
+
+    def test_disabled_by_default(self, simulator):
+        client = connect(simulator)
+        handle = client.get_handle_by_name('MAIN.counter')
+        requests_before = simulator.request_count
+        run_concurrently(lambda: client.read_by_handle(handle, INT), 4)
+        assert(simulator.request_count - requests_before == 4)
+        assert('coalescing' not in client.stats())
+        client.close()
+
+    def test_ttl_and_writes(self, simulator):
+        client = connect(simulator, read_ttl=10)
+        handle = client.get_handle_by_name('MAIN.counter')
+        requests_before = simulator.request_count
+        assert(client.read_by_handle(handle, INT) == 5)
+        assert(client.read_by_handle(handle, INT) == 5)
+        assert(simulator.request_count - requests_before == 1)
+
+        client.write_by_handle(handle, INT, 6)
+        assert(client.read_by_handle(handle, INT) == 6)
+        assert(simulator.request_count - requests_before == 3)
+        assert(client.stats()['coalescing']['reused'] == 1)
+        client.close()
@@ -0,0 +1,179 @@
+import threading
+
+import pytest
+
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adscommands import ReadCommand
+from counsyl_pyads.adscommands import ReadWriteCommand
+from counsyl_pyads.adscommands import WriteCommand
+from counsyl_pyads.adscongestion import AdsCongestionControl
+from counsyl_pyads.adscongestion import is_retryable
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsconstants import ADSIGRP_SYM_HNDBYNAME
+from counsyl_pyads.adsconstants import ADSIGRP_SYM_VALBYHND
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsscheduling import AdsPriorityGate
+from counsyl_pyads.adssimulator import AdsSimulator
+
+
+class RejectingSimulator(AdsSimulator):
+    """Rejects the next rejections requests with a full mailbox."""
+    rejections = 0
+
+    def handle_frame(self, conn, data):
+        if self.rejections > 0:
+            self.rejections -= 1
+            self.reject_frame(conn, data, 0x4)
+            return
+        super(RejectingSimulator, self).handle_frame(conn, data)
+
+
+def connect(simulator, **kwargs):
+    conn = AdsConnection(
+        target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+    client = AdsClient(conn, tcp_port=simulator.port, **kwargs)
+    client.connect()
+    return client
+
+
+class TestCongestionControl(object):
+
+    def test_additive_increase_multiplicative_decrease(self):
+        gate = AdsPriorityGate()
+        control = AdsCongestionControl(gate, max_window=8)
+        assert(gate.capacity == 1)
+        for _ in range(1 + 2 + 3):
+            control.on_response(0.001)
+        assert(gate.capacity == 4)
+        for _ in range(100):
+            control.on_response(0.001)
+        assert(gate.capacity == 8)
+
+        control.srtt = 10.0
+        control.on_congestion()
+        assert(gate.capacity == 4)
+        # further rejections within the same round trip are the same event
+        control.on_congestion()
+        assert(gate.capacity == 4)
+        assert(control.congestion_events == 1)
+
+    def test_latency_target(self):
+        gate = AdsPriorityGate()
+        control = AdsCongestionControl(
+            gate, max_window=8, latency_target=0.01)
+        control.window = 8
+        control.on_response(0.1)
+        assert(gate.capacity == 4)
+        # large bulk reads are slow by nature
+        control.on_response(0.1, bulk=True)
+        assert(gate.capacity == 4)
+        assert(control.srtt == 0.1)
+
+    def test_retryable(self):
+        assert(is_retryable(ReadCommand(0x4020, 0, 2), 0x4))
+        assert(is_retryable(ReadCommand(0x4020, 0, 2), 0x745))
+        assert(not is_retryable(ReadCommand(0x4020, 0, 2), 0x710))
+        assert(not is_retryable(WriteCommand(0x4020, 0, b'\0\0'), 0x4))
+        assert(is_retryable(ReadWriteCommand(
+            ADSIGRP_SYM_HNDBYNAME, 0, 4, b'MAIN.x\0'), 0x4))
+        assert(not is_retryable(ReadWriteCommand(
+            ADSIGRP_SYM_VALBYHND, 1, 4, b'\0\0\0\0'), 0x4))
+
+
+class TestMailboxOverflow(object):
+
+    def test_window_adapts_to_mailbox(self):
+        with AdsSimulator(mailbox_size=4, latency=0.001) as simulator:
+            simulator.add_symbol('MAIN.counter', INT, 5)
+            client = connect(simulator, max_in_flight=32)
+            client.max_retries = 10
+            errors = []
+
+            def worker():
+                try:
+                    for _ in range(20):
+                        assert(client.read_by_name('MAIN.counter', INT) == 5)
+                except Exception as ex:
+                    errors.append(ex)
+
+            threads = [threading.Thread(target=worker) for _ in range(32)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stats = client.stats()
+            client.close()
+
+        assert(errors == [])
+        assert(simulator.rejected_count > 0)
+        assert(stats['retries'] == simulator.rejected_count)
+        assert(stats['errors'][0x4] == simulator.rejected_count)
+        assert(stats['congestion']['congestion_events'] > 0)
+        assert(stats['congestion']['window'] < 32)
+
+    def test_retried_read_is_traced(self):
+        with RejectingSimulator() as simulator:
+            simulator.add_symbol('MAIN.counter', INT, 5)
+            client = connect(simulator)
+            traces = []
+            client.add_profiling_hook(traces.append)
+            simulator.rejections = 1
+            assert(client.read_by_name('MAIN.counter', INT) == 5)
+            client.close()
+        assert(len(traces) == 2)
+        assert(traces[0].error.code == 0x4)
+        # the retry still hands its trace to the datatype decoding
+        assert(traces[1].stages[-1][0] == 'datatype_decode')
+
+    def test_writes_are_not_retried(self):
+        with AdsSimulator(mailbox_size=1, latency=0.05) as simulator:
+            simulator.add_symbol('MAIN.counter', INT, 5)
+            client = connect(simulator, max_in_flight=4)
+            client.congestion.window = 4
+            client.congestion.on_response(0.001)
+            symbol = simulator.get_symbol('MAIN.counter')[0]
+            errors = []
+
+            def worker():
+                try:
+                    client.write(
+                        symbol.index_group, symbol.index_offset, b'\1\0')
+                except Exception as ex:
+                    errors.append(ex)
+
+            threads = [threading.Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            client.close()
+        assert(len(errors) == simulator.rejected_count > 0)
+        assert(all(error.code == 0x4 for error in errors))
+        assert(client.metrics.retries == 0)
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 8])
+def test_concurrent_requests_get_their_responses(max_in_flight):
+    with AdsSimulator() as simulator:
+        for idx in range(8):
+            simulator.add_symbol('MAIN.var%d' % idx, INT, idx)
+        client = connect(simulator, max_in_flight=max_in_flight)
+        errors = []
+
+        def worker(idx):
+            try:
+                for _ in range(20):
+                    assert(client.read_by_name('MAIN.var%d' % idx, INT) ==
+                           idx)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [
+            threading.Thread(target=worker, args=(idx,)) for idx in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+    assert(errors == [])
+    assert(client.metrics.dropped_packets == 0)
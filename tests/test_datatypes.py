@@ -0,0 +1,200 @@
+import datetime
+import struct
+import threading
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import AdsDatatypeFactory
+from counsyl_pyads.adsdatatypes import AdsStructDatatype
+from counsyl_pyads.adsdatatypes import DATE
+from counsyl_pyads.adsdatatypes import DT
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsdatatypes import TIME
+from counsyl_pyads.adsdatatypes import TOD
+from counsyl_pyads.adsdatatypes import array_datatype
+from counsyl_pyads.adsdatatypes import parse_symtype
+from counsyl_pyads.adsdatatypes import string_datatype
+from counsyl_pyads.adsexception import PyadsTypeError
+
+
+@pytest.fixture
+def factory():
+    return AdsDatatypeFactory(max_size=4)
+
+
+class TestDatatypeFactory(object):
+
+    def test_interning(self):
+        factory = AdsDatatypeFactory()
+        array = factory.array(REAL, 100)
+        # the same specification in another spelling
+        assert(factory.array(REAL, [(0, 99)]) is array)
+        assert(factory.array(REAL, ((0, 99),)) is array)
+        assert(factory.array(REAL, 101) is not array)
+        assert(factory.array(INT, 100) is not array)
+        assert(array.byte_count == 400)
+        assert(array.dimensions == [(0, 99)])
+        assert(factory.string(80) is factory.string())
+        assert(factory.parse(' string(79) ') is factory.string(80))
+        assert(factory.parse('ARRAY [0..99] OF REAL') is array)
+        # parsed symtypes are interned as well as their parts
+        assert(factory.stats() == {
+            'size': 7, 'max_size': 1024, 'hits': 6, 'misses': 7,
+            'evictions': 0})
+
+    def test_same_codec(self, factory):
+        value = list(range(6))
+        raw = AdsArrayDatatype(INT, [(1, 2), (0, 2)]).pack(value)
+        array = factory.array(INT, [(1, 2), (0, 2)])
+        assert(array.pack(value) == raw)
+        assert(array.unpack(raw)[2][1] == 4)
+        assert(factory.string(5).unpack(b'ab\0xy') == u'ab')
+
+    def test_shared_instances_are_read_only(self, factory):
+        array = factory.array(INT, 3)
+        with pytest.raises(AttributeError):
+            array.dimensions = [(0, 9)]
+        with pytest.raises(AttributeError):
+            INT.byte_count = 4
+        # instances created directly stay mutable
+        AdsArrayDatatype(INT, 3).byte_count = 6
+
+    def test_lru_eviction(self, factory):
+        first = factory.string(1)
+        for length in range(2, 5):
+            factory.string(length)
+        # touch the oldest entry, the next insert evicts STRING(2) instead
+        assert(factory.string(1) is first)
+        factory.string(5)
+        assert(factory.stats()['evictions'] == 1)
+        assert(factory.string(1) is first)
+        assert(factory.stats()['misses'] == 5)
+        factory.string(2)
+        assert(factory.stats()['misses'] == 6)
+        factory.clear()
+        assert(factory.stats()['size'] == 0)
+        assert(factory.string(1) is not first)
+
+    def test_concurrent_requests_share_one_instance(self, factory):
+        results = []
+
+        def intern():
+            results.append(factory.array(REAL, [(0, 9), (0, 9)]))
+
+        threads = [threading.Thread(target=intern) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(len(set(map(id, results))) == 1)
+
+    def test_invalid_dimensions(self, factory):
+        with pytest.raises(TypeError):
+            factory.array(INT, None)
+        with pytest.raises(PyadsTypeError):
+            factory.parse('FB_Motor')
+        assert(factory.stats()['size'] == 0)
+
+
+def test_module_level_factory():
+    assert(array_datatype(REAL, 10) is array_datatype(REAL, [(0, 9)]))
+    assert(string_datatype(81) is parse_symtype('STRING'))
+
+
+def udints(*values):
+    return struct.pack('<%dI' % len(values), *values)
+
+
+class TestTimeDatatypes(object):
+
+    def test_time(self):
+        value = datetime.timedelta(days=2, hours=3, milliseconds=45)
+        raw = TIME.pack(value)
+        assert(raw == udints(((2 * 24 + 3) * 3600) * 1000 + 45))
+        assert(TIME.unpack(raw) == value)
+        assert(TIME.unpack(udints(0xFFFFFFFF)) ==
+               datetime.timedelta(milliseconds=0xFFFFFFFF))
+        with pytest.raises(PyadsTypeError):
+            TIME.pack(datetime.timedelta(seconds=-1))
+        with pytest.raises(PyadsTypeError):
+            TIME.pack(5)
+
+    def test_time_of_day(self):
+        value = datetime.time(23, 59, 58, 999000)
+        raw = TOD.pack(value)
+        assert(raw == udints(86398999))
+        assert(TOD.unpack(raw) == value)
+        assert(TOD.unpack(udints(0)) == datetime.time(0))
+        with pytest.raises(PyadsTypeError):
+            TOD.unpack(udints(86400000))
+
+    def test_date(self):
+        value = datetime.date(2016, 2, 29)
+        raw = DATE.pack(value)
+        # seconds since 1970 with a resolution of one day
+        assert(raw == udints(16860 * 86400))
+        assert(DATE.unpack(raw) == value)
+        assert(DATE.pack(datetime.datetime(2016, 2, 29, 13, 0)) == raw)
+        with pytest.raises(PyadsTypeError):
+            DATE.pack(datetime.date(1969, 12, 31))
+
+    def test_date_and_time(self):
+        value = datetime.datetime(2016, 2, 29, 13, 14, 15)
+        raw = DT.pack(value)
+        assert(raw == udints(16860 * 86400 + 13 * 3600 + 14 * 60 + 15))
+        assert(DT.unpack(raw) == value)
+        assert(DT.unpack(udints(0xFFFFFFFF)) ==
+               datetime.datetime(2106, 2, 7, 6, 28, 15))
+        with pytest.raises(PyadsTypeError):
+            DT.pack(value.date())
+
+    def test_arrays(self):
+        array = AdsArrayDatatype(DT, [(1, 2)])
+        values = [datetime.datetime(2020, 1, 1),
+                  datetime.datetime(2020, 1, 1, 0, 0, 1)]
+        raw = array.pack(values)
+        assert(raw == udints(1577836800, 1577836801))
+        assert(array.unpack(raw) == {1: values[0], 2: values[1]})
+
+    def test_numpy_arrays(self):
+        numpy = pytest.importorskip('numpy')
+        raw = udints(*range(0, 5000, 1000))
+        durations = AdsArrayDatatype(TIME, 5).unpack_numpy(raw)
+        assert(durations.dtype == numpy.dtype('m8[ms]'))
+        assert(durations[2] == numpy.timedelta64(2, 's'))
+        assert(AdsArrayDatatype(TOD, 5).unpack_numpy(raw)[4] ==
+               numpy.timedelta64(4000, 'ms'))
+
+        dates = AdsArrayDatatype(DATE, 2)
+        days = dates.unpack_numpy(udints(0, 16860 * 86400))
+        assert(days.dtype == numpy.dtype('M8[D]'))
+        assert(days[1] == numpy.datetime64('2016-02-29'))
+        assert(dates.pack(days) == udints(0, 16860 * 86400))
+
+        timestamps = AdsArrayDatatype(DT, [(0, 1), (0, 1)])
+        raw = udints(1577836800, 1577836801, 1577836802, 1577836803)
+        values = timestamps.unpack_numpy(raw)
+        assert(values.shape == (2, 2))
+        assert(values[1, 0] == numpy.datetime64('2020-01-01T00:00:02'))
+        assert(timestamps.pack(values) == raw)
+        # other units are converted when packing
+        assert(timestamps.pack(values.astype('M8[ms]')) == raw)
+        assert(timestamps.unpack_numpy(raw, convert=False)[0, 1] ==
+               1577836801)
+
+    def test_numpy_struct_fields(self):
+        numpy = pytest.importorskip('numpy')
+        entry = AdsStructDatatype([
+            ('timestamp', DT), ('duration', TIME), ('value', INT)])
+        log = AdsArrayDatatype(entry, 3)
+        raw = b''.join(
+            struct.pack('<IIh', 1577836800 + idx, idx * 10, -idx)
+            for idx in range(3))
+        values = log.unpack_numpy(raw)
+        assert(values['timestamp'][2] ==
+               numpy.datetime64('2020-01-01T00:00:02'))
+        assert(values['duration'][1] == numpy.timedelta64(10, 'ms'))
+        assert(list(values['value']) == [0, -1, -2])
+        assert(log.pack(values) == raw)
@@ -0,0 +1,62 @@
+import pytest
+
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adssymbol import AdsSymbol
+
+
+NAMES = ['MAIN.var%d' % idx for idx in range(1200)]
+
+
+@pytest.fixture
+def simulator(simulator):
+    for idx, name in enumerate(NAMES):
+        simulator.add_symbol(name, INT, idx)
+    return simulator
+
+
+class TestBulkHandles(object):
+
+    def test_get_and_release_handles(self, client, simulator):
+        names = NAMES[:600] + ['MAIN.missing'] + NAMES[600:]
+        requests_before = simulator.request_count
+        handles = client.get_handles_by_names(names)
+        assert(simulator.request_count - requests_before == 3)
+        assert(len(handles) == len(names))
+        assert(isinstance(handles[600], AdsException))
+        assert(handles[600].code == 0x710)
+
+        del handles[600]
+        assert(client.read_by_handle(handles[0], INT) == 0)
+        assert(client.read_by_handle(handles[1199], INT) == 1199)
+
+        requests_before = simulator.request_count
+        errors = client.release_handles(handles + [0xDEAD])
+        assert(simulator.request_count - requests_before == 3)
+        assert(errors[:-1] == [None] * len(handles))
+        assert(errors[-1].code == 0x710)
+        with pytest.raises(AdsException):
+            client.read_by_handle(handles[0], INT)
+
+    def test_get_infos(self, client):
+        client.sum_batch_size = 2
+        infos = client.get_infos_by_names(
+            ['MAIN.var1', 'MAIN.missing', 'main.VAR2'])
+        assert(isinstance(infos[0], AdsSymbol))
+        assert(infos[0].name == 'MAIN.var1')
+        assert(infos[0].symtype == 'INT')
+        assert(infos[1].code == 0x710)
+        assert(infos[2].name == 'MAIN.var2')
+
+    def test_get_long_infos(self, client, simulator):
+        simulator.add_symbol('MAIN.long', INT, comment=u'x' * 2000)
+        requests_before = simulator.request_count
+        infos = client.get_infos_by_names(['MAIN.var1', 'MAIN.long'])
+        # the long entry didn't fit and was read on its own
+        assert(simulator.request_count - requests_before == 2)
+        assert(infos[0].name == 'MAIN.var1')
+        assert(infos[1].comment == u'x' * 2000)
+
+    def test_empty(self, client):
+        assert(client.get_handles_by_names([]) == [])
+        assert(client.release_handles([]) == [])
@@ -0,0 +1,138 @@
+import struct
+import time
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adshistorian import AdsHistorian
+from counsyl_pyads.adshistorian import AdsHistorianReader
+from counsyl_pyads.adshistorian import numpy_dtype_descr
+from counsyl_pyads.adssymbol import AdsSymbol
+
+numpy = pytest.importorskip('numpy')
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.counter = 0
+
+    def read(self, indexGroup, indexOffset, length):
+        self.counter += 1
+        memory = bytearray(32)
+        struct.pack_into('<h', memory, 0, self.counter)
+        struct.pack_into('<d', memory, 8, self.counter / 2.0)
+        struct.pack_into('<3h', memory, 16, 1, 2, self.counter)
+        memory[24:28] = b'ab\x00\x00'
+        return FakeResponse(
+            bytes(memory[indexOffset:indexOffset + length]))
+
+
+@pytest.fixture
+def symbols():
+    return [
+        (AdsSymbol(0x4020, 0, 'MAIN.i', 'INT', ''), INT),
+        (AdsSymbol(0x4020, 8, 'MAIN.r', 'LREAL', ''), LREAL),
+        (AdsSymbol(0x4020, 16, 'MAIN.a', 'ARRAY [0..2] OF INT', ''),
+         AdsArrayDatatype(INT, 3)),
+        (AdsSymbol(0x4020, 24, 'MAIN.s', 'STRING(3)', ''), STRING(4)),
+    ]
+
+
+class TestHistorian(object):
+
+    def test_numpy_dtype_descr(self):
+        assert(numpy_dtype_descr('?') == '<b1')
+        assert(numpy_dtype_descr('3h') == ('<i2', (3,)))
+        assert(numpy_dtype_descr('80s') == 'S80')
+
+    def test_record_and_read(self, tmpdir, symbols):
+        directory = str(tmpdir.join('hist'))
+        with AdsHistorian(FakeClient(), symbols, directory,
+                          segment_rows=4, max_gap=8) as historian:
+            for ts in range(10):
+                raw = historian.plan.read_raw_list(historian.client)
+                historian.append(float(ts), raw)
+        reader = AdsHistorianReader(directory)
+        data = reader.read()
+        assert(list(data['timestamp']) == [float(ts) for ts in range(10)])
+        assert(list(data['MAIN.i']) == list(range(1, 11)))
+        assert(data['MAIN.r'][3] == 2.0)
+        assert(list(data['MAIN.a'][4]) == [1, 2, 5])
+        assert(data['MAIN.s'][0] == b'ab')
+
+        data = reader.read(start=2.5, end=6.0, names=['MAIN.i'])
+        assert(list(data['timestamp']) == [3.0, 4.0, 5.0])
+        assert(list(data['MAIN.i']) == [4, 5, 6])
+
+    def test_rollover(self, tmpdir, symbols):
+        directory = str(tmpdir.join('hist'))
+        with AdsHistorian(FakeClient(), symbols, directory,
+                          segment_rows=4, max_segments=2,
+                          max_gap=8) as historian:
+            for _ in range(10):
+                historian.sample()
+        reader = AdsHistorianReader(directory)
+        assert(len(reader.list_segments(directory)) == 2)
+        data = reader.read()
+        assert(list(data['MAIN.i']) == [5, 6, 7, 8, 9, 10])
+        assert(list(data['timestamp']) == sorted(data['timestamp']))
+        assert(abs(data['timestamp'][0] - time.time()) < 60)
+
+    def test_decreasing_timestamp(self, tmpdir, symbols):
+        with AdsHistorian(FakeClient(), symbols, str(tmpdir.join('hist')),
+                          max_gap=8) as historian:
+            raw = historian.plan.read_raw_list(historian.client)
+            historian.append(2.0, raw)
+            historian.append(2.0, raw)
+            with pytest.raises(PyadsException):
+                historian.append(1.0, raw)
+
+    def test_continue_recording(self, tmpdir, symbols):
+        directory = str(tmpdir.join('hist'))
+        with AdsHistorian(FakeClient(), symbols, directory,
+                          segment_rows=4, max_gap=8) as historian:
+            historian.sample()
+        with AdsHistorian(FakeClient(), symbols, directory,
+                          segment_rows=4, max_gap=8) as historian:
+            historian.sample()
+        assert(len(AdsHistorianReader(directory).read()['MAIN.i']) == 2)
+        with pytest.raises(PyadsException):
+            AdsHistorian(FakeClient(), symbols[:2], directory,
+                         segment_rows=4, max_gap=8)
+        with pytest.raises(PyadsException):
+            AdsHistorian(FakeClient(), symbols, directory,
+                         segment_rows=8, max_gap=8)
+
+    def test_recording_survives_errors(self, tmpdir, symbols):
+        client = FakeClient()
+        read = client.read
+
+        def flaky_read(indexGroup, indexOffset, length):
+            # the PLC is restarting during the first two samples
+            if client.counter < 2:
+                client.counter += 1
+                raise AdsException(0x745)
+            return read(indexGroup, indexOffset, length)
+
+        client.read = flaky_read
+        directory = str(tmpdir.join('hist'))
+        with AdsHistorian(client, symbols, directory,
+                          max_gap=8) as historian:
+            historian.start(rate=1000)
+            deadline = time.time() + 5
+            while client.counter < 5 and time.time() < deadline:
+                time.sleep(0.001)
+            errors = historian._recorder.errors
+        assert(errors == 2)
+        assert(list(AdsHistorianReader(directory).read()['MAIN.i'])[:3] == [
+            3, 4, 5])
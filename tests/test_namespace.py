@@ -0,0 +1,119 @@
+import pytest
+
+from counsyl_pyads.adsconstants import ADSIGRP_IOIMAGE_RWIB
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsdatatypes import UINT
+from counsyl_pyads.adsdatatypes import parse_symtype
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adsexception import PyadsTypeError
+from counsyl_pyads.adsnamespace import format_symbol_path
+from counsyl_pyads.adsnamespace import parse_symbol_path
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.speed', LREAL, 2.5)
+    simulator.add_symbol('MAIN.counter', INT, 5)
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(INT, [(1, 4)]), [1, 2, 3, 4],
+        symtype='ARRAY [1..4] OF INT')
+    simulator.add_symbol(
+        'MAIN.matrix', AdsArrayDatatype(INT, [(0, 1), (0, 2)]),
+        range(6), symtype='ARRAY [0..1,0..2] OF INT')
+    # a function block instance whose members are listed flat
+    simulator.add_symbol('MAIN.motor', INT, symtype='FB_Motor')
+    simulator.add_symbol('MAIN.motor.rpm', INT, 1500)
+    simulator.add_symbol('GVL.name', STRING(11), u'press 1')
+    simulator.add_symbol(
+        'GVL.input', INT, 7, index_group=ADSIGRP_IOIMAGE_RWIB)
+    return simulator
+
+
+def test_parse_symtype():
+    assert(parse_symtype('INT') is INT)
+    assert(parse_symtype(' lreal ') is LREAL)
+    assert(parse_symtype('STRING(20)').byte_count == 21)
+    assert(parse_symtype('STRING').byte_count == 81)
+    array = parse_symtype('ARRAY [0..3, -1..4] OF UINT')
+    assert(array.dimensions == [(0, 3), (-1, 4)])
+    assert(array.data_type is UINT)
+    assert(array.byte_count == 4 * 6 * 2)
+    strings = parse_symtype('ARRAY [0..3] OF STRING(5)')
+    assert(strings.data_type.byte_count == 6)
+    assert(strings.byte_count == 4 * 6)
+    for symtype in ['FB_Motor', 'ARRAY [0..3] OF ST_Axis',
+                    'ARRAY [a..b] OF INT']:
+        with pytest.raises(PyadsTypeError):
+            parse_symtype(symtype)
+
+
+def test_symbol_paths():
+    for name, path in [
+            ('MAIN.axis[3].position', ['MAIN', 'axis', 3, 'position']),
+            ('MAIN.m[1,2]', ['MAIN', 'm', (1, 2)]),
+            ('.gvar', ['gvar'])]:
+        assert(parse_symbol_path(name) == path)
+    assert(format_symbol_path(['MAIN', 'm', (1, 2), 'x']) == 'MAIN.m[1,2].x')
+
+
+class TestSymbolNamespace(object):
+
+    def test_attribute_and_item_access(self, client):
+        main = client.symbols.MAIN
+        assert(main is client.symbols['main'])
+        assert(main.speed.read() == 2.5)
+        assert(main.speed.datatype is LREAL)
+        # PLC names clashing with node attributes need item access
+        assert(client.symbols.GVL.name == 'GVL')
+        assert(client.symbols.GVL['name'].read() == u'press 1')
+        assert(main.values[3].read() == 3)
+        assert(main.values[3].name == 'MAIN.values[3]')
+        assert(main.matrix[1, 2].read() == 5)
+        assert(main.motor.rpm.read() == 1500)
+        assert(main.motor.datatype is None)
+        assert(client.symbols.get('MAIN.values[4]').read() == 4)
+        assert('speed' in dir(main))
+
+        with pytest.raises(AttributeError):
+            main.missing
+        with pytest.raises(IndexError):
+            main.values[0]
+        with pytest.raises(PyadsTypeError):
+            main.matrix[1]
+        with pytest.raises(PyadsException):
+            client.symbols.get('MAIN.missing.x')
+
+    def test_write_and_handle(self, client, simulator):
+        client.symbols.MAIN.values[2].write(20)
+        assert(simulator.get_value('MAIN.values')[2] == 20)
+        counter = client.symbols.MAIN.counter
+        assert(client.read_by_handle(counter.handle, INT) == 5)
+        # the handle is resolved once
+        assert(counter.handle == counter.handle)
+
+    def test_subtree_read_is_batched(self, client, simulator):
+        client.symbols.reload()
+        requests_before = simulator.request_count
+        values = client.symbols.read()
+        # one sum read of the ranges of both index groups
+        assert(simulator.request_count - requests_before == 1)
+        assert(values['MAIN']['speed'] == 2.5)
+        assert(values['MAIN']['values'][4] == 4)
+        assert(values['MAIN']['motor']['rpm'] == 1500)
+        assert(values['GVL'] == {'name': u'press 1', 'input': 7})
+
+        requests_before = simulator.request_count
+        values = client.symbols.GVL.read()
+        assert(simulator.request_count - requests_before == 1)
+        assert(values == {'name': u'press 1', 'input': 7})
+
+    def test_unknown_leaf_type(self, client, simulator):
+        simulator.add_symbol('GVL.state', INT, symtype='E_State')
+        client.symbols.reload()
+        with pytest.raises(PyadsTypeError):
+            client.symbols.GVL.read()
+        # the other variables can still be read
+        assert(client.symbols.GVL.input.read() == 7)
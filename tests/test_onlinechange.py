@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import DINT
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsonlinechange import AdsOnlineChangeWatcher
+from counsyl_pyads.adsonlinechange import diff_symbol_tables
+from counsyl_pyads.adssymbol import AdsSymbol
+
+
+DATATYPES = {'INT': INT, 'DINT': DINT}
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.a', INT, 1)
+    simulator.add_symbol('MAIN.b', INT, 2)
+    simulator.add_symbol('MAIN.c', INT, 3)
+    return simulator
+
+
+def test_diff_symbol_tables():
+    old = [
+        AdsSymbol(0x4020, 0, 'MAIN.a', 'INT', ''),
+        AdsSymbol(0x4020, 2, 'MAIN.b', 'INT', ''),
+        AdsSymbol(0x4020, 4, 'MAIN.c', 'INT', ''),
+        AdsSymbol(0x4020, 6, 'MAIN.d', 'INT', '')]
+    new = [
+        AdsSymbol(0x4020, 0, 'main.A', 'INT', 'comments don\'t matter'),
+        AdsSymbol(0x4020, 8, 'MAIN.b', 'INT', ''),
+        AdsSymbol(0x4020, 4, 'MAIN.c', 'DINT', ''),
+        AdsSymbol(0x4020, 12, 'MAIN.e', 'INT', '')]
+    diff = diff_symbol_tables(old, new)
+    assert(diff.added == ['MAIN.e'])
+    assert(diff.removed == ['MAIN.d'])
+    assert(diff.changed == ['MAIN.b', 'MAIN.c'])
+    assert(not diff_symbol_tables(old, old))
+
+
+class TestOnlineChangeWatcher(object):
+
+    def test_only_changed_symbols_are_invalidated(self, client, simulator):
+        built = []
+
+        def factory(symbol):
+            built.append(symbol.name)
+            return DATATYPES[symbol.symtype]
+
+        watcher = AdsOnlineChangeWatcher(client, datatype_factory=factory)
+        diffs = []
+        watcher.add_listener(diffs.append)
+        handles = dict(
+            (name, watcher.handle(name))
+            for name in ['MAIN.a', 'MAIN.b', 'MAIN.c'])
+        for name in handles:
+            watcher.datatype(name)
+        assert(not watcher.check())
+
+        requests_before = simulator.request_count
+        assert(not watcher.check())
+        # polling an unchanged PLC costs two small reads
+        assert(simulator.request_count - requests_before == 2)
+
+        # online change: MAIN.b moves, MAIN.c is removed, MAIN.d added
+        simulator.remove_symbol('MAIN.b')
+        simulator.remove_symbol('MAIN.c')
+        simulator.add_symbol('MAIN.b', DINT, 20, symtype='DINT')
+        simulator.add_symbol('MAIN.d', INT, 4)
+        diff = watcher.check()
+        assert(diff.changed == ['MAIN.b'])
+        assert(diff.removed == ['MAIN.c'])
+        assert(diff.added == ['MAIN.d'])
+        assert(diffs == [diff])
+        assert(watcher.changes == 1)
+
+        assert(watcher.handle('MAIN.a') == handles['MAIN.a'])
+        assert(watcher.handle('MAIN.b') != handles['MAIN.b'])
+        assert(watcher.datatype('MAIN.b') is DINT)
+        assert(client.read_by_handle(
+            watcher.handle('MAIN.b'), watcher.datatype('MAIN.b')) == 20)
+        assert(sorted(built) == [
+            'MAIN.a', 'MAIN.b', 'MAIN.b', 'MAIN.c'])
+        assert(watcher.stats() == {
+            'symbols': 3, 'handles': 2, 'datatypes': 2, 'changes': 1})
+
+    def test_polling(self, client, simulator):
+        with AdsOnlineChangeWatcher(client) as watcher:
+            diffs = []
+            watcher.add_listener(diffs.append)
+            watcher.sync()
+            watcher.start(interval=0.01)
+            simulator.add_symbol('MAIN.d', INT, 4)
+            for _ in range(200):
+                if diffs:
+                    break
+                time.sleep(0.01)
+        assert(diffs[0].added == ['MAIN.d'])
@@ -0,0 +1,106 @@
+import struct
+
+import pytest
+
+from counsyl_pyads.adscapture import AdsCaptureReader
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsscheduling import PRIORITY_BULK
+
+
+VALUES = [idx * 0.5 for idx in range(1000)]
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.counter', INT, 5)
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(REAL, 1000), VALUES,
+        symtype='ARRAY [0..999] OF REAL')
+    return simulator
+
+
+class TestReadInto(object):
+
+    def test_bytearray(self, client):
+        symbol = client.get_info_by_name('MAIN.values')
+        buffer = bytearray(4000)
+        count = client.read_into(
+            symbol.index_group, symbol.index_offset, buffer)
+        assert(count == 4000)
+        assert(list(struct.unpack('<1000f', bytes(buffer))) == VALUES)
+
+        # a part of a buffer
+        buffer = bytearray(b'\xff' * 12)
+        handle = client.get_handle_by_name('MAIN.counter')
+        assert(client.read_by_handle_into(
+            handle, memoryview(buffer)[4:6]) == 2)
+        assert(buffer == b'\xff' * 4 + b'\x05\x00' + b'\xff' * 6)
+
+    def test_numpy(self, client):
+        numpy = pytest.importorskip('numpy')
+        handle = client.get_handle_by_name('MAIN.values')
+        values = numpy.zeros(1000, dtype='<f4')
+        assert(client.read_by_handle_into(handle, values) == 4000)
+        assert(values.tolist() == VALUES)
+        matrix = numpy.zeros((10, 100), dtype='<f4')
+        client.read_by_handle_into(handle, matrix)
+        assert(matrix[9, 99] == VALUES[-1])
+
+        with pytest.raises(TypeError):
+            client.read_by_handle_into(handle, matrix[:, :50])
+        values.flags.writeable = False
+        with pytest.raises(TypeError):
+            client.read_by_handle_into(handle, values)
+        with pytest.raises(TypeError):
+            client.read_by_handle_into(handle, b'\0' * 4000)
+
+    def test_chunked(self, client, simulator):
+        symbol = client.get_info_by_name('MAIN.values')
+        client.bulk_chunk_size = 1024
+        buffer = bytearray(4000)
+        requests_before = simulator.request_count
+        with client.priority(PRIORITY_BULK):
+            count = client.read_into(
+                symbol.index_group, symbol.index_offset, buffer)
+        assert(count == 4000)
+        assert(simulator.request_count - requests_before == 4)
+        assert(list(struct.unpack('<1000f', bytes(buffer))) == VALUES)
+
+    def test_capture(self, client, tmpdir):
+        path = str(tmpdir.join('reads.cap'))
+        handle = client.get_handle_by_name('MAIN.values')
+        client.start_capture(path)
+        client.read_by_handle_into(handle, bytearray(4000))
+        client.stop_capture()
+        (request, response), = AdsCaptureReader(path).exchanges()
+        # the frame is captured although the data went into the buffer
+        assert(response[32:40] == struct.pack('<II', 0, 4000))
+        assert(response[40:] == struct.pack('<1000f', *VALUES))
+
+    def test_timeout_releases_buffer(self, client, simulator):
+        handle = client.get_handle_by_name('MAIN.values')
+        # the response trickles in for about half a second
+        simulator.split_size = 64
+        simulator.split_delay = 0.008
+        client.request_timeout = 0.05
+        buffer = bytearray(4000)
+        with pytest.raises(AdsException):
+            client.read_by_handle_into(handle, buffer)
+        buffer[:] = b'\xff' * 4000
+        client.request_timeout = 10
+        # the rest of the late response isn't written into the buffer
+        assert(client.read_by_handle(handle, REAL) == VALUES[0])
+        assert(buffer == b'\xff' * 4000)
+
+    def test_errors(self, client):
+        buffer = bytearray(b'\xff' * 4)
+        with pytest.raises(AdsException):
+            client.read_by_handle_into(0x1234, buffer)
+        assert(buffer == b'\xff' * 4)
+        # the client still works after an error response
+        handle = client.get_handle_by_name('MAIN.counter')
+        assert(client.read_by_handle_into(handle, memoryview(buffer)[:2]) == 2)
+        assert(buffer == b'\x05\x00\xff\xff')
@@ -0,0 +1,109 @@
+import struct
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import BOOL
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adsreadplan import AdsReadPlan
+from counsyl_pyads.adssymbol import AdsSymbol
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeClient(object):
+    """Serves reads from a dict of index group -> memory byte string."""
+    def __init__(self, memory):
+        self.memory = memory
+        self.reads = []
+
+    def read(self, indexGroup, indexOffset, length):
+        self.reads.append((indexGroup, indexOffset, length))
+        return FakeResponse(
+            self.memory[indexGroup][indexOffset:indexOffset + length])
+
+
+@pytest.fixture
+def symbols():
+    return [
+        (AdsSymbol(0x4020, 4, 'MAIN.b', 'REAL', ''), REAL),
+        (AdsSymbol(0x4020, 0, 'MAIN.a', 'INT', ''), INT),
+        (AdsSymbol(0x4020, 12, 'MAIN.c', 'BOOL', ''), BOOL),
+        (AdsSymbol(0x4020, 100, 'MAIN.d',
+                   'ARRAY [0..1] OF INT', ''), AdsArrayDatatype(INT, 2)),
+        (AdsSymbol(0xF020, 0, 'MAIN.e', 'INT', ''), INT),
+    ]
+
+
+@pytest.fixture
+def client():
+    memory_m = bytearray(128)
+    struct.pack_into('<h', memory_m, 0, -5)
+    struct.pack_into('<f', memory_m, 4, 1.5)
+    struct.pack_into('<?', memory_m, 12, True)
+    struct.pack_into('<hh', memory_m, 100, 7, 8)
+    memory_i = bytearray(4)
+    struct.pack_into('<h', memory_i, 0, 42)
+    return FakeClient({0x4020: bytes(memory_m), 0xF020: bytes(memory_i)})
+
+
+class TestReadPlan(object):
+
+    def test_merge_without_gap(self, symbols):
+        plan = AdsReadPlan(symbols)
+        assert([(r.index_group, r.index_offset, r.length)
+                for r in plan.ranges] == [
+            (0x4020, 0, 2), (0x4020, 4, 4), (0x4020, 12, 1),
+            (0x4020, 100, 4), (0xF020, 0, 2)])
+
+    def test_merge_with_gap(self, symbols):
+        plan = AdsReadPlan(symbols, max_gap=4)
+        assert([(r.index_group, r.index_offset, r.length)
+                for r in plan.ranges] == [
+            (0x4020, 0, 13), (0x4020, 100, 4), (0xF020, 0, 2)])
+
+    def test_max_read_size(self, symbols):
+        plan = AdsReadPlan(symbols, max_gap=4, max_read_size=8)
+        assert([(r.index_offset, r.length) for r in plan.ranges][:2] == [
+            (0, 8), (12, 1)])
+
+    def test_execute(self, symbols, client):
+        plan = AdsReadPlan(symbols, max_gap=200)
+        values = plan.execute(client)
+        assert(len(client.reads) == 2)
+        assert(list(values.keys()) == [
+            'MAIN.b', 'MAIN.a', 'MAIN.c', 'MAIN.d', 'MAIN.e'])
+        assert(values['MAIN.a'] == -5)
+        assert(values['MAIN.b'] == 1.5)
+        assert(values['MAIN.c'] is True)
+        assert(values['MAIN.d'] == {0: 7, 1: 8})
+        assert(values['MAIN.e'] == 42)
+
+    def test_report(self, symbols):
+        report = AdsReadPlan(symbols, max_gap=4).report()
+        assert(report.naive_requests == 5)
+        assert(report.saved_requests == 2)
+        assert(report.payload_bytes == 13)
+        assert(report.gap_bytes == 6)
+        assert(report.overlap_bytes == 0)
+        assert(report.saved_bytes > 0)
+
+    def test_duplicates_and_overlaps(self, symbols, client):
+        # a symbol listed twice and an INT overlapping the REAL MAIN.b
+        symbols = symbols[:2] + [
+            symbols[0], (AdsSymbol(0x4020, 6, 'MAIN.b', 'INT', ''), INT)]
+        plan = AdsReadPlan(symbols)
+        values = plan.execute_list(client)
+        assert(values[:3] == [1.5, -5, 1.5])
+        assert(values[3] == struct.unpack('<h', struct.pack('<f', 1.5)[2:])[0])
+        assert(plan.read_raw_list(client)[0] == struct.pack('<f', 1.5))
+        with pytest.raises(PyadsException):
+            plan.execute(client)
+        report = plan.report()
+        assert(report.gap_bytes == 0)
+        assert(report.overlap_bytes == 6)
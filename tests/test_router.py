@@ -0,0 +1,208 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+
+import pytest
+
+from counsyl_pyads import adsrouter
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adsrouter import AdsRouter
+from counsyl_pyads.adssimulator import AdsSimulator
+from counsyl_pyads.adstransport import AdsUnixTransport
+from counsyl_pyads.amspacket import AmsPacket
+
+
+PLC_AMS_ID = '127.0.0.1.1.1'
+
+
+@pytest.fixture
+def socket_path():
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, 'router.sock')
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def simulator():
+    with AdsSimulator() as simulator:
+        simulator.add_symbol('MAIN.counter', INT, 5)
+        yield simulator
+
+
+@pytest.fixture
+def router(simulator, socket_path):
+    routes = {PLC_AMS_ID: ('127.0.0.1', simulator.port)}
+    with AdsRouter(socket_path, routes=routes) as router:
+        yield router
+
+
+def make_client(socket_path, source_port=801):
+    conn = AdsConnection(
+        target_ams=PLC_AMS_ID + ':801',
+        source_ams='127.0.0.2.1.1:%d' % source_port)
+    client = AdsClient(conn, transport=AdsUnixTransport(socket_path))
+    client.connect()
+    return client
+
+
+class NotifyingServer(AdsSimulator):
+    """Answers AddDeviceNotification requests and immediately sends one
+    notification for the new handle.
+    """
+    def __init__(self, **kwargs):
+        super(NotifyingServer, self).__init__(**kwargs)
+        self.next_handle = 100
+
+    def handle_frame(self, conn, data):
+        request = AmsPacket.from_binary_data(data)
+        if request.command_id != 0x0006:
+            return super(NotifyingServer, self).handle_frame(conn, data)
+        handle = self.next_handle
+        self.next_handle += 1
+        self.send_packet(conn, self.create_response(
+            request, struct.pack('<II', 0, handle)))
+        notification = self.create_response(
+            request, struct.pack(
+                '<IIQIII', 28, 1, 0, 1, handle, 4) + struct.pack('<I', handle))
+        notification.command_id = 0x0008
+        notification.state_flags = 0x0004
+        notification.invoke_id = 0
+        self.send_packet(conn, notification)
+
+
+def send_request(sock, command_id, invoke_id, data):
+    conn = AdsConnection(
+        target_ams=PLC_AMS_ID + ':801', source_ams='127.0.0.2.1.1:900')
+    packet = AmsPacket(conn)
+    packet.command_id = command_id
+    packet.state_flags = 0x0004
+    packet.invoke_id = invoke_id
+    packet.data = data
+    ams_data = packet.GetBinaryData()
+    sock.sendall(struct.pack('<HI', 0, len(ams_data)) + ams_data)
+
+
+def recv_packet(sock):
+    header = b''
+    while len(header) < 6:
+        header += sock.recv(6 - len(header))
+    length = struct.unpack('<I', header[2:6])[0]
+    data = b''
+    while len(data) < length:
+        data += sock.recv(length - len(data))
+    return AmsPacket.from_binary_data(data)
+
+
+class TestRouter(object):
+
+    def test_clients_share_one_upstream_connection(
+            self, router, simulator, socket_path):
+        clients = [make_client(socket_path, 801 + idx) for idx in range(4)]
+        errors = []
+
+        def worker(client, value):
+            try:
+                for _ in range(20):
+                    client.write_by_name('MAIN.counter', INT, value)
+                    client.read_by_name('MAIN.counter', INT)
+                    assert(client.read_device_info().DeviceName ==
+                           u'Simulated PLC')
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [
+            threading.Thread(target=worker, args=(client, idx))
+            for idx, client in enumerate(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for client in clients:
+            client.close()
+
+        assert(errors == [])
+        stats = router.stats()
+        assert(stats['upstream_connections'] == 1)
+        assert(stats['forwarded_requests'] == stats['forwarded_responses'])
+        assert(stats['dropped_frames'] == 0)
+        # every client started with invoke id 0x8001; without rewriting the
+        # PLC would have seen duplicate invoke ids
+        assert(len(simulator._connections) == 1)
+
+    def test_ads_errors_are_passed_through(self, router, socket_path):
+        client = make_client(socket_path)
+        with pytest.raises(AdsException) as exc_info:
+            client.read_by_name('MAIN.missing', INT)
+        assert(exc_info.value.code == 0x710)
+        client.close()
+
+    def test_reconnect_after_send_failure(
+            self, router, socket_path, monkeypatch):
+        client = make_client(socket_path)
+        assert(client.read_by_name('MAIN.counter', INT) == 5)
+        upstream = router._upstreams[PLC_AMS_ID]
+
+        def send(data):
+            raise socket.timeout('timed out')
+
+        monkeypatch.setattr(upstream.socket, 'send', send)
+        monkeypatch.setattr(adsrouter, 'UPSTREAM_SEND_TIMEOUT', 0)
+        with pytest.raises(AdsException) as exc_info:
+            client.read_by_name('MAIN.counter', INT)
+        assert(exc_info.value.code == 0x7)
+        assert(upstream.failed)
+        # the next request opens a new connection
+        assert(client.read_by_name('MAIN.counter', INT) == 5)
+        assert(router._upstreams[PLC_AMS_ID] is not upstream)
+        client.close()
+
+    def test_unreachable_plc(self, socket_path):
+        # a port nobody listens on
+        blocker = socket.socket()
+        blocker.bind(('127.0.0.1', 0))
+        port = blocker.getsockname()[1]
+        blocker.close()
+        routes = {PLC_AMS_ID: ('127.0.0.1', port)}
+        with AdsRouter(socket_path, routes=routes):
+            client = make_client(socket_path)
+            with pytest.raises(AdsException) as exc_info:
+                client.read_state()
+            assert(exc_info.value.code == 0x7)
+            client.close()
+
+    def test_no_router(self, socket_path):
+        with pytest.raises(PyadsException):
+            make_client(socket_path)
+
+    def test_notifications_are_routed_to_their_owner(self, socket_path):
+        with NotifyingServer() as server:
+            routes = {PLC_AMS_ID: ('127.0.0.1', server.port)}
+            with AdsRouter(socket_path, routes=routes) as router:
+                first = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                first.connect(socket_path)
+                second = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                second.connect(socket_path)
+                first.settimeout(2)
+                second.settimeout(2)
+
+                for sock, invoke_id in [(first, 7), (second, 7)]:
+                    send_request(sock, 0x0006, invoke_id, b'\0' * 40)
+                    response = recv_packet(sock)
+                    assert(response.invoke_id == invoke_id)
+                    handle = struct.unpack('<I', response.data[4:8])[0]
+                    notification = recv_packet(sock)
+                    assert(notification.command_id == 0x0008)
+                    # the sample carries its own handle as value
+                    assert(struct.unpack(
+                        '<I', notification.data[-4:])[0] == handle)
+
+                assert(router.stats()['forwarded_notifications'] == 2)
+                first.close()
+                second.close()
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsscheduling import AdsPriorityGate
+from counsyl_pyads.adsscheduling import PRIORITY_BULK
+from counsyl_pyads.adsscheduling import PRIORITY_CONTROL
+from counsyl_pyads.adsscheduling import PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.counter', INT, 5)
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(INT, 1000), list(range(1000)),
+        symtype='ARRAY [0..999] OF INT')
+    return simulator
+
+
+class TestPriorityGate(object):
+
+    def test_most_urgent_first(self):
+        gate = AdsPriorityGate()
+        gate.acquire(PRIORITY_BULK)
+        admitted = []
+
+        def waiter(priority, name):
+            gate.acquire(priority)
+            admitted.append(name)
+            gate.release()
+
+        threads = []
+        for priority, name in [
+                (PRIORITY_BULK, 'bulk'),
+                (PRIORITY_INTERACTIVE, 'interactive'),
+                (PRIORITY_CONTROL, 'control 1'),
+                (PRIORITY_CONTROL, 'control 2')]:
+            thread = threading.Thread(target=waiter, args=(priority, name))
+            thread.start()
+            threads.append(thread)
+            # make the arrival order deterministic
+            while gate.waiting < len(threads):
+                time.sleep(0.001)
+        gate.release()
+        for thread in threads:
+            thread.join()
+        assert(admitted == ['control 1', 'control 2', 'interactive', 'bulk'])
+
+    def test_capacity(self):
+        gate = AdsPriorityGate(capacity=2)
+        gate.acquire(PRIORITY_BULK)
+        gate.acquire(PRIORITY_BULK)
+        assert(gate.holders == 2)
+        waited = []
+        thread = threading.Thread(
+            target=lambda: waited.append(gate.acquire(PRIORITY_CONTROL)))
+        thread.start()
+        time.sleep(0.02)
+        assert(waited == [])
+        gate.capacity = 3
+        thread.join()
+        assert(gate.holders == 3)
+        assert(waited[0] > 0)
+
+    def test_interrupted_acquire(self, monkeypatch):
+        gate = AdsPriorityGate()
+        gate.acquire(PRIORITY_INTERACTIVE)
+        admitted = []
+        thread = threading.Thread(
+            target=lambda: admitted.append(gate.acquire(PRIORITY_BULK)))
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.02)
+
+        wait = gate._condition.wait
+        caller = threading.current_thread()
+
+        def interrupted_wait(*args):
+            if threading.current_thread() is caller:
+                raise KeyboardInterrupt()
+            return wait(*args)
+
+        monkeypatch.setattr(gate._condition, 'wait', interrupted_wait)
+        with pytest.raises(KeyboardInterrupt):
+            gate.acquire(PRIORITY_CONTROL)
+        assert(gate.waiting == 1)
+        # the interrupted ticket doesn't block the bulk waiter
+        gate.release()
+        thread.join(1)
+        assert(len(admitted) == 1)
+
+
+class TestClientPriorities(object):
+
+    def test_bulk_reads_are_chunked(self, client, simulator):
+        symbol = simulator.get_symbol('MAIN.values')[0]
+        client.bulk_chunk_size = 300
+        requests_before = simulator.request_count
+        response = client.read(symbol.index_group, symbol.index_offset, 2000)
+        assert(simulator.request_count - requests_before == 1)
+
+        with client.priority(PRIORITY_BULK):
+            chunked = client.read(
+                symbol.index_group, symbol.index_offset, 2000)
+        assert(simulator.request_count - requests_before == 1 + 7)
+        assert(chunked.data == response.data)
+        assert(chunked.Length == 2000)
+
+    def test_wait_times_are_reported(self, client):
+        with client.priority(PRIORITY_CONTROL):
+            client.read_by_name('MAIN.counter', INT)
+        client.read_by_name('MAIN.counter', INT)
+        client.get_symbols()
+        waits = client.stats()['priority_waits']
+        assert(waits['control']['count'] == 1)
+        assert(waits['interactive']['count'] == 1)
+        assert(waits['bulk']['count'] == 2)
+        assert('pyads_priority_wait_seconds_count{priority="bulk"} 2' in
+               client.metrics.prometheus())
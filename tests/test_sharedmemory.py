@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import DINT
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adssharedmemory import AdsSharedMemoryPublisher
+from counsyl_pyads.adssharedmemory import AdsSharedMemoryReader
+from counsyl_pyads.adssymbol import AdsSymbol
+
+
+SIGNALS = [
+    ('MAIN.counter', INT),
+    ('MAIN.speed', LREAL),
+    ('MAIN.name', STRING(11)),
+    ('MAIN.values', AdsArrayDatatype(INT, 3)),
+]
+
+
+@pytest.fixture
+def path():
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, 'plc.shm')
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.counter', INT, 5)
+    simulator.add_symbol('MAIN.speed', LREAL, 2.5)
+    simulator.add_symbol('MAIN.name', STRING(11), u'press 1')
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(INT, 3), [1, 2, 3],
+        symtype='ARRAY [0..2] OF INT')
+    return simulator
+
+
+class TestSharedMemory(object):
+
+    def test_publish_and_read(self, client, path):
+        with AdsSharedMemoryPublisher(client, SIGNALS, path) as publisher:
+            with AdsSharedMemoryReader(path, SIGNALS) as reader:
+                assert(reader.sequence == 0)
+                publisher.sample()
+                assert(reader.get('main.counter') == 5)
+                sequence, timestamp, values = reader.read()
+                assert(sequence == 2)
+                assert(timestamp > 0)
+                assert(values['MAIN.speed'] == 2.5)
+                assert(values['MAIN.name'] == u'press 1')
+                assert(list(values['MAIN.values'].values()) == [1, 2, 3])
+
+                client.write_by_name('MAIN.counter', INT, 6)
+                publisher.start(rate=100)
+                assert(reader.wait(sequence, timeout=2) > sequence)
+                publisher.stop()
+                assert(reader.get('MAIN.counter') == 6)
+
+    def test_publishing_survives_errors(self, client, path):
+        with AdsSharedMemoryPublisher(client, SIGNALS, path) as publisher:
+            with AdsSharedMemoryReader(path, SIGNALS) as reader:
+                publisher.client = None
+                publisher.start(rate=200)
+                time.sleep(0.05)
+                assert(publisher._publisher.errors > 0)
+                publisher.client = client
+                assert(reader.wait(0, timeout=2) > 0)
+                publisher.stop()
+
+    def test_layout_mismatch(self, client, path):
+        with AdsSharedMemoryPublisher(client, SIGNALS, path):
+            with pytest.raises(PyadsException):
+                AdsSharedMemoryReader(path, SIGNALS[:2])
+            with pytest.raises(PyadsException):
+                AdsSharedMemoryReader(
+                    path, [('MAIN.counter', DINT)] + SIGNALS[1:])
+
+    def test_duplicate_signals(self, client, path):
+        signals = SIGNALS + [('main.counter', INT)]
+        with pytest.raises(PyadsException):
+            AdsSharedMemoryPublisher(client, signals, path)
+        assert(not os.path.exists(path))
+        with AdsSharedMemoryPublisher(client, SIGNALS, path):
+            with pytest.raises(PyadsException):
+                AdsSharedMemoryReader(path, signals)
+
+    def test_snapshots_are_consistent(self, path):
+        # publish() doesn't need a PLC, the layout only depends on the symbols
+        publisher = AdsSharedMemoryPublisher(None, [
+            (AdsSymbol(0x4020, 0, 'a', 'DINT', ''), DINT),
+            (AdsSymbol(0x4020, 4, 'b', 'DINT', ''), DINT)], path)
+        signals = [('a', DINT), ('b', DINT)]
+        reader = AdsSharedMemoryReader(path, signals)
+        stop = threading.Event()
+
+        def write():
+            value = 0
+            while not stop.is_set():
+                value += 1
+                raw = DINT.pack(value)
+                publisher.publish(0.0, [raw, raw])
+                # pace the writer so the readers aren't starved
+                stop.wait(0.0005)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            for _ in range(2000):
+                _, _, values = reader.read()
+                assert(values['a'] == values['b'])
+        finally:
+            stop.set()
+            writer.join()
+        reader.close()
+        publisher.close()
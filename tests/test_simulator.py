@@ -0,0 +1,217 @@
+import struct
+import time
+import pytest
+
+from counsyl_pyads.adscapture import AdsCaptureReader
+from counsyl_pyads.adscapture import AdsCaptureWriter
+from counsyl_pyads.adscapture import AdsReplayServer
+from counsyl_pyads.adscapture import replay_decode
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsconstants import ADSIGRP_SUMUP_READ
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import REAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsprofiling import AdsSlowestRequestsProfiler
+from counsyl_pyads.adssimulator import AdsSimulator
+
+
+def add_symbols(simulator):
+    simulator.add_symbol('MAIN.counter', INT, 5, comment=u'a counter')
+    simulator.add_symbol('MAIN.speed', REAL, 1.5)
+    simulator.add_symbol('MAIN.name', STRING(81), u'simulated')
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(INT, 4), [1, 2, 3, 4],
+        symtype='ARRAY [0..3] OF INT')
+    return simulator
+
+
+@pytest.fixture
+def simulator(simulator):
+    return add_symbols(simulator)
+
+
+class TestSimulator(object):
+
+    def test_device_info(self, client):
+        info = client.read_device_info()
+        assert(info.DeviceName == u'Simulated PLC')
+        assert(info.Version == '2.11.2000')
+
+    def test_read_state(self, client):
+        state = client.read_state()
+        assert(state.AdsState == 5)
+
+    def test_read_write_by_name(self, client, simulator):
+        assert(client.read_by_name('MAIN.counter', INT) == 5)
+        assert(client.read_by_name('main.name', STRING(81)) == u'simulated')
+        client.write_by_name('MAIN.counter', INT, -7)
+        assert(simulator.get_value('MAIN.counter') == -7)
+
+    def test_handles(self, client):
+        handle = client.get_handle_by_name('MAIN.values')
+        values = client.read_by_handle(handle, AdsArrayDatatype(INT, 4))
+        assert(list(values.values()) == [1, 2, 3, 4])
+
+    def test_unknown_symbol(self, client):
+        with pytest.raises(AdsException) as excinfo:
+            client.get_handle_by_name('MAIN.missing')
+        assert(excinfo.value.code == 0x710)
+
+    def test_symbol_upload(self, client):
+        symbols = client.get_symbols()
+        assert([s.name for s in symbols] == [
+            'MAIN.counter', 'MAIN.speed', 'MAIN.name', 'MAIN.values'])
+        assert(symbols[0].comment == u'a counter')
+        assert(symbols[3].symtype == 'ARRAY [0..3] OF INT')
+        assert(symbols[1].index_offset == 2)
+
+    def test_info_by_name(self, client):
+        symbol = client.get_info_by_name('MAIN.speed')
+        assert(symbol.index_group == 0x4020)
+        assert(symbol.symtype == 'REAL')
+
+    def test_sum_read(self, client):
+        request = struct.pack('<IIIIII', 0x4020, 0, 2, 0x4020, 2, 4)
+        response = client.read_write(ADSIGRP_SUMUP_READ, 2, 14, request)
+        errors = struct.unpack_from('<II', response.data)
+        assert(errors == (0, 0))
+        assert(struct.unpack_from('<hf', response.data, 8) == (5, 1.5))
+
+
+class TestNetworkConditions(object):
+
+    def test_split_frames(self):
+        simulator = add_symbols(
+            AdsSimulator(split_size=5, latency=0.001, jitter=0.001))
+        with simulator:
+            conn = AdsConnection(
+                target_ams='127.0.0.1.1.1:801',
+                source_ams='127.0.0.2.1.1:801')
+            with AdsClient(conn, tcp_port=simulator.port) as client:
+                assert(len(client.get_symbols()) == 4)
+                assert(client.read_by_name('MAIN.speed', REAL) == 1.5)
+
+
+class TestMetrics(object):
+
+    def test_stats(self, client):
+        client.read_by_name('MAIN.counter', INT)
+        with pytest.raises(AdsException):
+            client.get_handle_by_name('MAIN.missing')
+        stats = client.stats()
+        assert(stats['requests'] == 2)
+        assert(stats['in_flight'] == 0)
+        assert(stats['connects'] == 1)
+        assert(stats['errors'] == {0x710: 1})
+        assert(stats['bytes_sent'] > 0 and stats['bytes_received'] > 0)
+        latencies = dict(
+            (entry['index_group'], entry['latency'])
+            for entry in stats['latencies'])
+        assert(latencies[0xF004]['count'] == 1)
+        assert(latencies[0xF003]['p50'] > 0)
+
+    def test_prometheus(self, client):
+        client.read_state()
+        text = client.metrics.prometheus()
+        assert('pyads_requests_total 1' in text)
+        assert(
+            'pyads_request_duration_seconds_count{command="read_state"} 1'
+            in text)
+
+
+class TestProfiling(object):
+
+    def test_slowest_requests(self, client):
+        profiler = AdsSlowestRequestsProfiler(n=2)
+        client.add_profiling_hook(profiler)
+        for _ in range(3):
+            client.read_by_name('MAIN.counter', INT)
+        client.remove_profiling_hook(profiler)
+        client.read_state()
+        assert(profiler.count == 3)
+        traces = profiler.slowest()
+        assert(len(traces) == 2)
+        assert(traces[0].duration_ns >= traces[1].duration_ns)
+        assert([stage for stage, _, _ in traces[0].stages] == [
+            'encode', 'frame', 'send', 'wait', 'frame_decode', 'wakeup',
+            'response_decode', 'datatype_decode'])
+        assert(sum(traces[0].breakdown().values()) <= traces[0].duration_ns)
+        assert('datatype_decode' in profiler.report())
+
+    def test_failed_request(self, client):
+        traces = []
+        client.add_profiling_hook(traces.append)
+        with pytest.raises(AdsException):
+            client.read_by_name('MAIN.missing', INT)
+        client.read_by_name('MAIN.counter', INT)
+        assert(len(traces) == 2)
+        assert(traces[0].error.code == 0x710)
+        assert(traces[1].stages[-1][0] == 'datatype_decode')
+
+    def test_hooks_removed_during_read(self, client):
+        traces = []
+        hook = traces.append
+        client.add_profiling_hook(hook)
+        handle = client.get_handle_by_name('MAIN.counter')
+        read = client.read
+
+        def read_without_hooks(*args, **kwargs):
+            client.remove_profiling_hook(hook)
+            return read(*args, **kwargs)
+
+        client.read = read_without_hooks
+        assert(client.read_by_handle(handle, INT) == 5)
+        del client.read
+        # the next request is traced on its own, not deferred
+        client.add_profiling_hook(hook)
+        client.read_state()
+        assert(len(traces) == 2)
+        assert(traces[1].command_id == 0x0004)
+        assert(all(end >= start for _, start, end in traces[1].stages))
+
+
+class TestCapture(object):
+
+    def test_capture_and_replay(self, client, tmpdir):
+        path = str(tmpdir.join('plc.cap'))
+        client.start_capture(path)
+        client.read_by_name('MAIN.counter', INT)
+        client.read_device_info()
+        client.stop_capture()
+
+        reader = AdsCaptureReader(path)
+        records = reader.records()
+        assert([r.direction for r in records] == [0, 1, 0, 1])
+        timestamps = [r.timestamp_ns for r in records]
+        assert(timestamps == sorted(timestamps))
+        # the wall clock anchor converts the monotonic stamps
+        assert(abs(reader.wall_time_ns(records[0]) / 1e9 - time.time()) < 60)
+        assert(replay_decode(path, repeat=2)['frames'] == 4)
+
+        with AdsReplayServer(path) as server:
+            conn = AdsConnection(
+                target_ams='127.0.0.1.1.1:801',
+                source_ams='127.0.0.2.1.1:801')
+            with AdsClient(conn, tcp_port=server.port) as replay_client:
+                for _ in range(2):
+                    assert(replay_client.read_by_name(
+                        'MAIN.counter', INT) == 5)
+                assert(replay_client.read_device_info().DeviceName ==
+                       u'Simulated PLC')
+            assert(server.unmatched == 0)
+
+    def test_close_after_writer_failed(self, tmpdir):
+        writer = AdsCaptureWriter(
+            str(tmpdir.join('failed.cap')), max_queued_frames=1)
+        thread = writer._thread
+        # writing to the closed file kills the writer thread
+        writer._file.close()
+        writer.write(0, b'\x00')
+        thread.join(1)
+        assert(not thread.is_alive())
+        writer.write(0, b'\x00')
+        # the queue is full and nobody empties it
+        writer.close(timeout=0.1)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import struct
+
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import AdsStructDatatype
+from counsyl_pyads.adsdatatypes import BOOL
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsdatatypes import UDINT
+from counsyl_pyads.adsdatatypes import numpy_dtype
+from counsyl_pyads.adsexception import PyadsTypeError
+
+
+@pytest.fixture
+def recipe():
+    # STRUCT name: STRING(9); active: BOOL; amount: LREAL; steps: ARRAY
+    # [1..2] OF INT; END_STRUCT
+    return AdsStructDatatype([
+        ('name', STRING(10)),
+        ('active', BOOL),
+        ('amount', LREAL),
+        ('steps', AdsArrayDatatype(INT, [(1, 2)])),
+    ])
+
+
+def recipe_bytes(name, active, amount, steps):
+    return struct.pack('<10s?d2h', name, active, amount, *steps)
+
+
+class TestStructDatatype(object):
+
+    def test_pack_and_unpack(self, recipe):
+        assert(recipe.byte_count == 23)
+        assert(recipe.offsets == [0, 10, 11, 19])
+        raw = recipe_bytes(b'mix\0junk', True, 1.5, [3, 4])
+        value = recipe.unpack(raw)
+        assert(list(value.keys()) == ['name', 'active', 'amount', 'steps'])
+        assert(value['name'] == u'mix')
+        assert(value['steps'] == {1: 3, 2: 4})
+        assert(recipe.pack(value) == recipe_bytes(b'mix', True, 1.5, [3, 4]))
+        assert(recipe.pack((u'mix', True, 1.5, [3, 4])) == recipe.pack(value))
+        with pytest.raises(PyadsTypeError):
+            recipe.pack({'name': u'mix'})
+        with pytest.raises(PyadsTypeError):
+            recipe.unpack(raw[:-1])
+
+    def test_alignment(self):
+        fields = [('flag', BOOL), ('count', UDINT), ('value', LREAL),
+                  ('small', INT)]
+        packed = AdsStructDatatype(fields)
+        assert(packed.offsets == [0, 1, 5, 13])
+        assert(packed.byte_count == 15)
+        aligned = AdsStructDatatype(fields, pack_mode=8)
+        assert(aligned.offsets == [0, 4, 8, 16])
+        # padded to its alignment for arrays of the struct
+        assert(aligned.byte_count == 24)
+        nested = AdsStructDatatype(
+            [('flag', BOOL), ('inner', aligned)], pack_mode=8)
+        assert(nested.offsets == [0, 8])
+        assert(AdsStructDatatype(fields, pack_mode=4).offsets == [
+            0, 4, 8, 16])
+
+    def test_invalid_fields(self):
+        with pytest.raises(PyadsTypeError):
+            AdsStructDatatype([('a', INT), ('a', BOOL)])
+        with pytest.raises(PyadsTypeError):
+            AdsStructDatatype([('a', 'INT')])
+
+
+class TestArraysOfAnyType(object):
+
+    def test_array_of_strings(self):
+        array = AdsArrayDatatype(STRING(6), [(1, 3)])
+        assert(array.byte_count == 18)
+        raw = array.pack([u'a', u'\xe4bc', u'12345'])
+        assert(raw == b'a\0\0\0\0\0\xe4bc\0\0\x0012345\0')
+        assert(array.unpack(raw) == {1: u'a', 2: u'\xe4bc', 3: u'12345'})
+
+    def test_array_of_structs(self, recipe):
+        array = AdsArrayDatatype(recipe, [(0, 1), (1, 2)])
+        rows = [
+            (u'r%d' % idx, idx % 2 == 0, idx * 0.5, [idx, -idx])
+            for idx in range(4)]
+        raw = array.pack(rows)
+        assert(raw == b''.join(
+            recipe_bytes(name.encode('ascii'), active, amount, steps)
+            for name, active, amount, steps in rows))
+        value = array.unpack(raw)
+        assert(value[1][2]['name'] == u'r3')
+        assert(value[1][1]['steps'] == {1: 2, 2: -2})
+        assert(array.pack(value) == raw)
+
+        byte_buffer = bytearray(b'\xff' * (array.byte_count + 2))
+        array.pack_into_buffer(byte_buffer, 2, value)
+        assert(bytes(byte_buffer[2:]) == raw)
+        assert(array.unpack_from_buffer(bytes(byte_buffer), 2) == value)
+
+
+class TestNumpy(object):
+
+    def test_numpy_dtype(self, recipe):
+        numpy = pytest.importorskip('numpy')
+        dtype = numpy_dtype(recipe)
+        assert(dtype.itemsize == 23)
+        assert(dtype.fields['amount'] == (numpy.dtype('<f8'), 11))
+        assert(dtype.fields['steps'][0] == numpy.dtype(('<i2', (2,))))
+        assert(numpy_dtype(AdsArrayDatatype(INT, [(0, 1), (0, 2)])) ==
+               numpy.dtype(('<i2', (2, 3))))
+
+    def test_unpack_struct_array(self, recipe):
+        numpy = pytest.importorskip('numpy')
+        array = AdsArrayDatatype(recipe, 1000)
+        raw = b''.join(
+            recipe_bytes(
+                b'\xe4 %d\0stale' % idx, idx % 3 == 0, idx / 4.0,
+                [idx, idx + 1])
+            for idx in range(1000))
+        table = array.unpack_numpy(raw)
+        assert(table.shape == (1000,))
+        assert(table['name'][0] == u'\xe4 0')
+        assert(table['name'][999] == u'\xe4 999')
+        assert(table['active'].sum() == 334)
+        assert(table['amount'][10] == 2.5)
+        assert(table['steps'].shape == (1000, 2))
+        assert(list(table['steps'][7]) == [7, 8])
+
+        undecoded = array.unpack_numpy(raw, convert=False)
+        assert(undecoded['name'][1] == b'\xe4 1\0stale')
+        # packing the raw array reproduces the PLC data
+        assert(array.pack(undecoded) == raw)
+        assert(array.pack(numpy.asarray(undecoded)) == raw)
+
+    def test_unpack_arrays(self):
+        numpy = pytest.importorskip('numpy')
+        matrix = AdsArrayDatatype(INT, [(1, 2), (0, 2)])
+        raw = matrix.pack(range(6))
+        values = matrix.unpack_numpy(raw)
+        assert(values.shape == (2, 3))
+        assert(values[1, 2] == 5)
+        # no strings, no copy
+        assert(not values.flags.writeable)
+        assert(matrix.pack(numpy.arange(6.0)) == raw)
+        with pytest.raises(PyadsTypeError):
+            matrix.pack(numpy.arange(5))
+
+        strings = AdsArrayDatatype(STRING(4), 3)
+        raw = strings.pack([u'ab', u'', u'xyz'])
+        assert(list(strings.unpack_numpy(raw)) == [u'ab', u'', u'xyz'])
+
+        nested = AdsArrayDatatype(AdsArrayDatatype(INT, 2), 3)
+        assert(nested.unpack_numpy(nested.pack(
+            [[0, 1], [2, 3], [4, 5]])).shape == (3, 2))
@@ -0,0 +1,110 @@
+import fnmatch
+import re
+
+import pytest
+
+from counsyl_pyads.adsclient import AdsClient
+from counsyl_pyads.adsconnection import AdsConnection
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsexception import PyadsException
+from counsyl_pyads.adsonlinechange import AdsOnlineChangeWatcher
+from counsyl_pyads.adssimulator import AdsSimulator
+from counsyl_pyads.adssymbol import AdsSymbol
+from counsyl_pyads.adssymbolindex import AdsSymbolIndex
+from counsyl_pyads.adssymbolindex import name_segments
+
+
+def make_symbols():
+    symbols = []
+    for axis in range(50):
+        for member, symtype, comment in [
+                ('position', 'LREAL', u'Actual position in mm'),
+                ('velocity', 'LREAL', u'Actual velocity in mm/s'),
+                ('enabled', 'BOOL', u'Drive enabled'),
+                ('errors', 'ARRAY [0..9] OF UDINT', u'Error history')]:
+            symbols.append(AdsSymbol(
+                0x4020, len(symbols) * 8,
+                'MAIN.axis%02d.%s' % (axis, member), symtype, comment))
+    symbols.append(AdsSymbol(0x4020, 0, 'GVL.axisCount', 'INT', u''))
+    symbols.append(AdsSymbol(0x4020, 0, 'MAIN.axes[3]', 'INT', u''))
+    return symbols
+
+
+@pytest.fixture
+def index():
+    return AdsSymbolIndex(make_symbols(), version=1)
+
+
+def names(symbols):
+    return [symbol.name for symbol in symbols]
+
+
+class TestSymbolIndex(object):
+
+    def test_prefix(self, index):
+        result = index.prefix('main.AXIS01.')
+        assert(names(result) == [
+            'MAIN.axis01.enabled', 'MAIN.axis01.errors',
+            'MAIN.axis01.position', 'MAIN.axis01.velocity'])
+        assert(len(index.prefix('MAIN.')) == 201)
+        assert(len(index.prefix('MAIN.', limit=5)) == 5)
+        assert(index.prefix('PLC') == [])
+        assert(len(index.prefix('')) == len(index))
+
+    def test_filters(self, index):
+        assert(len(index.search(symtype='lreal')) == 100)
+        assert(len(index.search(segment='position')) == 50)
+        assert(names(index.search(segment=['axis07', 'position'])) == [
+            'MAIN.axis07.position'])
+        assert(names(index.search(segment='3')) == ['MAIN.axes[3]'])
+        assert(len(index.search(comment='actual MM')) == 100)
+        assert(len(index.search(comment='actual velocity')) == 50)
+        assert(names(index.search(prefix='main.axis1', symtype='BOOL')) == [
+            'MAIN.axis%02d.enabled' % axis for axis in range(10, 20)])
+        assert(index.search(symtype='STRING') == [])
+
+    def test_patterns_match_brute_force(self, index):
+        symbols = sorted(make_symbols(), key=lambda s: s.name.upper())
+        for glob in ['MAIN.axis?3.*', '*.VELOCITY', 'gvl.*', '*']:
+            expected = [
+                symbol.name for symbol in symbols
+                if fnmatch.fnmatchcase(symbol.name.upper(), glob.upper())]
+            assert(names(index.search(glob=glob)) == expected)
+        for regex in [r'axis4\d\.(position|enabled)$', 'count']:
+            expected = [
+                symbol.name for symbol in symbols
+                if re.search(regex, symbol.name, re.I)]
+            assert(names(index.search(regex=regex)) == expected)
+        assert(names(index.search(
+            prefix='GVL', glob='MAIN.*', regex='.')) == [])
+        assert(len(index.search(glob='main.axis1*', segment='errors')) == 10)
+        # brackets are array indices, not character classes
+        assert(names(index.search(glob='main.axes[3]')) == ['MAIN.axes[3]'])
+        assert(names(index.search(glob='MAIN.axes[?]')) == ['MAIN.axes[3]'])
+        assert(index.search(glob='MAIN.axes[0-9]') == [])
+        with pytest.raises(PyadsException):
+            index.search(regex='(')
+
+    def test_name_segments(self):
+        assert(name_segments('MAIN.m[1,2].x') == ['MAIN', 'M', '1', '2', 'X'])
+
+
+def test_watcher_keeps_index_per_version():
+    with AdsSimulator() as simulator:
+        simulator.add_symbol('MAIN.a', INT, comment=u'first value')
+        conn = AdsConnection(
+            target_ams='127.0.0.1.1.1:801', source_ams='127.0.0.2.1.1:801')
+        with AdsClient(conn, tcp_port=simulator.port) as client:
+            watcher = AdsOnlineChangeWatcher(client)
+            index = watcher.index()
+            assert(names(index.search(comment='first')) == ['MAIN.a'])
+            assert(watcher.index() is index)
+            watcher.check()
+            assert(watcher.index() is index)
+
+            simulator.add_symbol('MAIN.b', INT)
+            watcher.check()
+            assert(watcher.index() is not index)
+            assert(watcher.index().version == simulator.symbol_version)
+            assert(names(watcher.index().prefix('main.')) == [
+                'MAIN.a', 'MAIN.b'])
@@ -0,0 +1,231 @@
+import os
+import struct
+
+import pytest
+
+from counsyl_pyads import adstypelibrary
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import AdsEnumDatatype
+from counsyl_pyads.adsdatatypes import AdsStructDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import UDINT
+from counsyl_pyads.adsexception import PyadsTypeError
+from counsyl_pyads.adstypelibrary import AdsTypeLibrary
+from counsyl_pyads.adstypelibrary import load_type_library
+from counsyl_pyads.adstypelibrary import parse_declarations
+
+
+DECLARATIONS = u"""
+(* recipes of the mixer (* nested comment *) *)
+TYPE ST_Recipe :
+STRUCT
+    name : STRING(9) := 'new;recipe';  // initial values are skipped
+    mode : E_Mode := E_Mode.Idle;
+    steps : ARRAY [1..MAX_STEPS] OF ST_Step;
+    amount, limit : T_Amount;
+END_STRUCT
+END_TYPE
+
+TYPE E_Mode : (Idle := 0, Mixing, Draining := 16#10, Failed) UDINT;
+END_TYPE
+
+TYPE
+    T_Amount : LREAL;
+    T_Percent : INT (0..100) := 50;
+    ST_Step :
+    STRUCT
+        duration : TIME;
+        power AT %Q* : T_Percent;
+    END_STRUCT
+END_TYPE
+
+{attribute 'pack_mode' := '8'}
+TYPE ST_Aligned EXTENDS ST_Step :
+STRUCT
+    flag : BOOL;
+    total : LREAL;
+END_STRUCT
+END_TYPE
+"""
+
+TCDUT = u"""<?xml version="1.0" encoding="utf-8"?>
+<TcPlcObject Version="1.1.0.1" ProductVersion="3.1.4022.10">
+  <DUT Name="ST_Point" Id="{b5d2f7f0-0000-0000-0000-000000000000}">
+    <Declaration><![CDATA[TYPE ST_Point :
+STRUCT
+    x : REAL;
+    y : REAL;
+    label : STRING;
+END_STRUCT
+END_TYPE
+]]></Declaration>
+  </DUT>
+</TcPlcObject>
+"""
+
+
+@pytest.fixture
+def library():
+    # TwinCAT 2 layout, the offsets are easier to follow
+    library = AdsTypeLibrary(pack_mode=1, constants={'max_steps': 2})
+    library.add_source(DECLARATIONS)
+    return library
+
+
+class TestTypeLibrary(object):
+
+    def test_parse(self):
+        declarations = parse_declarations(DECLARATIONS)
+        assert([name for name, _ in declarations] == [
+            'ST_Recipe', 'E_Mode', 'T_Amount', 'T_Percent', 'ST_Step',
+            'ST_Aligned'])
+        recipe = declarations[0][1]
+        assert(recipe['fields'][0] == [
+            'name', {'kind': 'string', 'length': 9}])
+        assert(recipe['fields'][2][1]['dimensions'] == [[1, 'MAX_STEPS']])
+        assert(declarations[1][1]['members'] == [
+            ['Idle', 0], ['Mixing', 1], ['Draining', 16], ['Failed', 17]])
+        assert(declarations[5][1]['pack_mode'] == 8)
+        assert(declarations[5][1]['extends'] == 'ST_Step')
+
+    def test_compile(self, library):
+        datatypes = library.compile()
+        assert(list(datatypes.keys()) == library.names())
+        recipe = library.datatype('st_recipe')
+        assert(isinstance(recipe, AdsStructDatatype))
+        assert([name for name, _ in recipe.fields] == [
+            'name', 'mode', 'steps', 'amount', 'limit'])
+        assert(recipe.offsets == [0, 10, 14, 26, 34])
+        assert(recipe.byte_count == 42)
+        mode = recipe.fields[1][1]
+        assert(isinstance(mode, AdsEnumDatatype))
+        assert(mode.base_type is UDINT)
+        steps = recipe.fields[2][1]
+        assert(isinstance(steps, AdsArrayDatatype))
+        assert(steps.dimensions == [(1, 2)])
+        assert(steps.data_type is library.datatype('ST_Step'))
+        assert(library.datatype('T_Amount') is LREAL)
+        assert(library.datatype('T_Percent') is INT)
+        assert(library.datatype('INT') is INT)
+
+        aligned = library.datatype('ST_Aligned')
+        assert([name for name, _ in aligned.fields] == [
+            'duration', 'power', 'flag', 'total'])
+        assert(aligned.offsets == [0, 4, 6, 8])
+        assert(aligned.byte_count == 16)
+
+    def test_twincat3_layout(self):
+        text = u"""
+        TYPE ST_Mixed :
+        STRUCT
+            first : BYTE;
+            value : LREAL;
+            second : BYTE;
+            count : WORD;
+        END_STRUCT
+        END_TYPE
+        """
+        library = AdsTypeLibrary()
+        library.add_source(text)
+        mixed = library.datatype('ST_Mixed')
+        assert(mixed.offsets == [0, 8, 16, 18])
+        assert(mixed.byte_count == 24)
+        packed = AdsTypeLibrary(pack_mode=1)
+        packed.add_source(text)
+        assert(packed.datatype('ST_Mixed').offsets == [0, 1, 9, 10])
+
+    def test_codec(self, library):
+        recipe = library.datatype('ST_Recipe')
+        raw = struct.pack(
+            '<10sI' + 'Ih' * 2 + 'dd', b'mix', 16, 1000, 20, 2000, 30,
+            1.5, 2.0)
+        value = recipe.unpack(raw)
+        assert(value['name'] == u'mix')
+        assert(value['mode'] == 16)
+        assert(value['steps'][2]['power'] == 30)
+        assert(value['limit'] == 2.0)
+        value['mode'] = 'draining'
+        assert(recipe.pack(value) == raw)
+        value['mode'] = 'Unknown'
+        with pytest.raises(PyadsTypeError):
+            recipe.pack(value)
+
+    def test_parse_symtype(self, library):
+        table = library.parse_symtype('ARRAY [0..9] OF ST_Recipe')
+        assert(table.byte_count == 420)
+        assert(table.data_type is library.datatype('ST_Recipe'))
+        assert(library.parse_symtype('STRING(5)').byte_count == 6)
+
+    @pytest.mark.parametrize('text', [
+        'TYPE A : STRUCT p : POINTER TO INT; END_STRUCT END_TYPE',
+        'TYPE A : STRUCT x : INT END_STRUCT END_TYPE',
+        'TYPE A : UNION x : INT; END_UNION END_TYPE',
+        'TYPE A : WSTRING; END_TYPE',
+        'TYPE A : INT; (* unterminated END_TYPE',
+    ])
+    def test_syntax_errors(self, text):
+        with pytest.raises(PyadsTypeError):
+            AdsTypeLibrary().add_source(text)
+
+    def test_resolution_errors(self):
+        library = AdsTypeLibrary()
+        library.add_source("""
+            TYPE A : STRUCT b : B; END_STRUCT END_TYPE
+            TYPE B : STRUCT a : ARRAY [0..1] OF A; END_STRUCT END_TYPE
+            TYPE C : ST_Missing; END_TYPE
+            TYPE D : ARRAY [0..N] OF INT; END_TYPE
+            TYPE E EXTENDS C : STRUCT x : INT; END_STRUCT END_TYPE
+        """)
+        for name in ['A', 'C', 'D', 'E']:
+            with pytest.raises(PyadsTypeError):
+                library.datatype(name)
+        with pytest.raises(PyadsTypeError):
+            library.compile()
+        with pytest.raises(PyadsTypeError):
+            library.add_source('TYPE a : INT; END_TYPE')
+
+
+class TestLoadTypeLibrary(object):
+
+    @pytest.fixture
+    def files(self, tmpdir):
+        text = tmpdir.join('recipes.st')
+        text.write(DECLARATIONS.encode('utf-8'), mode='wb')
+        dut = tmpdir.join('ST_Point.TcDUT')
+        dut.write(TCDUT.encode('utf-8'), mode='wb')
+        return [str(text), str(dut)]
+
+    def test_tcdut(self, files):
+        library = load_type_library(files, constants={'MAX_STEPS': 2})
+        point = library.datatype('ST_Point')
+        # padded to the alignment of REAL
+        assert(point.byte_count == 4 + 4 + 81 + 3)
+
+    def test_cache(self, files, tmpdir, monkeypatch):
+        cache_dir = str(tmpdir.join('cache'))
+        library = load_type_library(
+            files, cache_dir=cache_dir, constants={'MAX_STEPS': 2})
+        assert(len(os.listdir(cache_dir)) == 1)
+
+        def fail(text):
+            raise AssertionError("The cached declarations weren't used.")
+
+        monkeypatch.setattr(adstypelibrary, 'parse_declarations', fail)
+        cached = load_type_library(
+            files, cache_dir=cache_dir, constants={'MAX_STEPS': 2})
+        assert(cached.names() == library.names())
+        recipe = cached.datatype('ST_Recipe')
+        assert(recipe.offsets == library.datatype('ST_Recipe').offsets)
+        assert(all(type(name) is str for name, _ in recipe.fields))
+        monkeypatch.undo()
+
+        # other constants or changed files are parsed again
+        load_type_library(
+            files, cache_dir=cache_dir, constants={'MAX_STEPS': 3})
+        with open(files[0], 'a') as f:
+            f.write('TYPE T_Extra : INT; END_TYPE\n')
+        changed = load_type_library(
+            files, cache_dir=cache_dir, constants={'MAX_STEPS': 2})
+        assert('T_Extra' in changed.names())
+        assert(len(os.listdir(cache_dir)) == 3)
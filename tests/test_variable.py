@@ -0,0 +1,82 @@
+import pytest
+
+from counsyl_pyads.adsdatatypes import AdsArrayDatatype
+from counsyl_pyads.adsdatatypes import INT
+from counsyl_pyads.adsdatatypes import LREAL
+from counsyl_pyads.adsdatatypes import STRING
+from counsyl_pyads.adsexception import AdsException
+from counsyl_pyads.adsexception import PyadsException
+
+
+@pytest.fixture
+def simulator(simulator):
+    simulator.add_symbol('MAIN.counter', INT, 5)
+    simulator.add_symbol('MAIN.speed', LREAL, 2.5)
+    simulator.add_symbol('MAIN.name', STRING(11), u'press 1')
+    simulator.add_symbol(
+        'MAIN.values', AdsArrayDatatype(INT, 3), [1, 2, 3],
+        symtype='ARRAY [0..2] OF INT')
+    return simulator
+
+
+class TestBoundVariable(object):
+
+    def test_read_and_write(self, client, simulator):
+        counter = client.bind('MAIN.counter', INT)
+        assert(counter.read() == 5)
+        counter.write(-7)
+        assert(simulator.get_value('MAIN.counter') == -7)
+        assert(counter.read() == -7)
+
+        speed = client.bind('MAIN.speed', LREAL)
+        speed.write(0.125)
+        assert(speed.read() == 0.125)
+
+        name = client.bind('MAIN.name', STRING(11))
+        assert(name.read() == u'press 1')
+        name.write(u'press 2')
+        assert(simulator.get_value('MAIN.name') == u'press 2')
+
+        values = client.bind('MAIN.values', AdsArrayDatatype(INT, 3))
+        values.write([4, 5, 6])
+        assert(list(values.read().values()) == [4, 5, 6])
+
+    def test_same_frames_as_read_by_handle(self, client, simulator):
+        counter = client.bind('MAIN.counter', INT)
+        requests_before = simulator.request_count
+        counter.read()
+        client.read_by_handle(counter.handle, INT)
+        assert(simulator.request_count - requests_before == 2)
+        latencies = client.stats()['latencies']
+        reads = [
+            entry for entry in latencies
+            if entry['command'] == 'read' and entry['index_group'] == 0xF005]
+        assert(reads[0]['latency']['count'] == 2)
+
+    def test_errors(self, client, simulator):
+        counter = client.bind('MAIN.counter', INT)
+        counter.release()
+        # the prebuilt requests refer to the released handle, they aren't
+        # sent
+        requests_before = simulator.request_count
+        with pytest.raises(PyadsException):
+            counter.read()
+        with pytest.raises(PyadsException):
+            counter.write(1)
+        assert(simulator.request_count == requests_before)
+        counter.bind()
+        assert(counter.read() == 5)
+
+    def test_rebind_releases_handle(self, client, simulator):
+        counter = client.bind('MAIN.counter', INT)
+        old_handle = counter.handle
+        counter.bind()
+        assert(counter.handle != old_handle)
+        # releasing it again fails: bind() already released it
+        error = client.release_handles([old_handle])[0]
+        assert(isinstance(error, AdsException))
+        assert(counter.read() == 5)
+
+    def test_unknown_symbol(self, client):
+        with pytest.raises(AdsException):
+            client.bind('MAIN.missing', INT)